@@ -3,13 +3,20 @@
 Consolidates all 17 Python micro-services into a single Flask app
 using Blueprints for clean route organisation.
 
-Run:  python app.py                             (development)
+Run:  python serve.py                           (development)
       gunicorn app:app -b 0.0.0.0:5050 -w 4    (production)
+      gunicorn app:app -b 0.0.0.0:5050 -w 4 --preload   (workers share libraries)
+
+Importing this module builds the app and nothing else: process-level hooks
+(signals, exit cleanup, JVM warm-up) belong to serve.py and gunicorn.conf.py.
+Pool children are started with ``spawn`` and re-import the parent's main
+script, so app.py must never be that script.
 """
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import os, logging, atexit, shutil, tempfile, signal, sys, gc, threading, psutil
+import os, time, logging, shutil, tempfile, importlib, psutil
+from utils import result_cache, file_store, memory_governor, metrics, lazy, spool
 
 # ── Logging ─────────────────────────────────────────────────────────────────
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
@@ -25,101 +32,79 @@ app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # MEMORY MANAGEMENT: 50 MB
 
 # ── CORS – restrict in production ──────────────────────────────────────────
 cors_origins = os.environ.get('CORS_ORIGIN', '*')
-CORS(app, origins=cors_origins.split(',') if cors_origins != '*' else '*')
+CORS(app, origins=cors_origins.split(',') if cors_origins != '*' else '*',
+     expose_headers=['X-Target-Met', 'X-Predicted-Size', 'Retry-After'])
 
 # ── Temp directory for all file operations ──────────────────────────────────
 TEMP_DIR = os.path.join(tempfile.gettempdir(), 'allfilechanger')
 os.makedirs(TEMP_DIR, exist_ok=True)
 
 def cleanup_temp():
-    """Remove global temp dir on shutdown."""
+    """Remove global temp dir on shutdown (called by serve.py / gunicorn's on_exit)."""
     if os.path.exists(TEMP_DIR):
         shutil.rmtree(TEMP_DIR, ignore_errors=True)
         logger.info('Cleaned up temp directory')
 
-atexit.register(cleanup_temp)
-
-# ── MEMORY MANAGEMENT: Force GC after every request ─────────────────────────
+# ── File store: keep results server-side when asked (store=1) ──────────────
 @app.after_request
-def after_request_cleanup(response):
-    """Run garbage collection after every request to free memory immediately."""
-    gc.collect()
+def store_result(response):
+    if request.method == 'POST' and request.blueprint != 'files' and file_store.wants_store():
+        return file_store.store_response(response)
     return response
 
-# ── MEMORY MANAGEMENT: Periodic memory monitoring & emergency cleanup ────────
-MEMORY_WARN_MB = 400
-MEMORY_CRITICAL_MB = 480
-
-def memory_monitor():
-    """Background thread that monitors memory and force-cleans if critical."""
-    while True:
-        try:
-            proc = psutil.Process(os.getpid())
-            rss_mb = proc.memory_info().rss / (1024 * 1024)
-            
-            if rss_mb > MEMORY_CRITICAL_MB:
-                logger.warning(f'🚨 CRITICAL MEMORY: {rss_mb:.0f}MB — force cleanup')
-                # Clean temp files
-                if os.path.exists(TEMP_DIR):
-                    for f in os.listdir(TEMP_DIR):
-                        try:
-                            fp = os.path.join(TEMP_DIR, f)
-                            if os.path.isfile(fp):
-                                os.unlink(fp)
-                            elif os.path.isdir(fp):
-                                shutil.rmtree(fp, ignore_errors=True)
-                        except Exception:
-                            pass
-                # Force GC
-                gc.collect()
-                logger.info(f'Memory after cleanup: {proc.memory_info().rss / (1024 * 1024):.0f}MB')
-            elif rss_mb > MEMORY_WARN_MB:
-                logger.warning(f'⚠️ HIGH MEMORY: {rss_mb:.0f}MB')
-                gc.collect()
-        except Exception:
-            pass
-        
-        threading.Event().wait(15)  # check every 15 seconds
-
-monitor_thread = threading.Thread(target=memory_monitor, daemon=True)
-monitor_thread.start()
+# ── MEMORY MANAGEMENT: admit requests against a per-worker memory budget ───
+# Over-budget requests queue briefly, then get 503 + Retry-After.
+memory_governor.install(app)
+
+# ── Metrics: per-route latency, sizes and errors, merged across workers ─────
+metrics.install(app)
+
+# ── MEMORY MANAGEMENT: spool large uploads to disk, parse them through mmap ─
+spool.install(app)
 
 # ── Register Blueprints ─────────────────────────────────────────────────────
-from routes.img_to_pdf       import bp as img_to_pdf_bp
-from routes.pdf_merge         import bp as pdf_merge_bp
-from routes.pdf_split         import bp as pdf_split_bp
-from routes.pdf_compress      import bp as pdf_compress_bp
-from routes.pdf_to_word       import bp as pdf_to_word_bp
-from routes.word_to_pdf       import bp as word_to_pdf_bp
-from routes.pdf_to_excel      import bp as pdf_to_excel_bp
-from routes.pdf_to_ppt        import bp as pdf_to_ppt_bp
-from routes.pdf_protect       import bp as pdf_protect_bp
-from routes.pdf_unlock        import bp as pdf_unlock_bp
-from routes.word_converter    import bp as word_converter_bp
-from routes.excel_converter   import bp as excel_converter_bp
-from routes.ppt_converter     import bp as ppt_converter_bp
-from routes.text_extractor    import bp as text_extractor_bp
-from routes.ocr_scanner       import bp as ocr_scanner_bp
-from routes.doc_merger        import bp as doc_merger_bp
-from routes.format_converter  import bp as format_converter_bp
-
-app.register_blueprint(img_to_pdf_bp,       url_prefix='/api/pdf')
-app.register_blueprint(pdf_merge_bp,        url_prefix='/api/pdf')
-app.register_blueprint(pdf_split_bp,        url_prefix='/api/pdf')
-app.register_blueprint(pdf_compress_bp,     url_prefix='/api/pdf')
-app.register_blueprint(pdf_to_word_bp,      url_prefix='/api/pdf')
-app.register_blueprint(word_to_pdf_bp,      url_prefix='/api/doc')
-app.register_blueprint(pdf_to_excel_bp,     url_prefix='/api/pdf')
-app.register_blueprint(pdf_to_ppt_bp,       url_prefix='/api/pdf')
-app.register_blueprint(pdf_protect_bp,      url_prefix='/api/pdf')
-app.register_blueprint(pdf_unlock_bp,       url_prefix='/api/pdf')
-app.register_blueprint(word_converter_bp,   url_prefix='/api/doc')
-app.register_blueprint(excel_converter_bp,  url_prefix='/api/doc')
-app.register_blueprint(ppt_converter_bp,    url_prefix='/api/doc')
-app.register_blueprint(text_extractor_bp,   url_prefix='/api/doc')
-app.register_blueprint(ocr_scanner_bp,      url_prefix='/api/doc')
-app.register_blueprint(doc_merger_bp,       url_prefix='/api/doc')
-app.register_blueprint(format_converter_bp, url_prefix='/api/doc')
+# Route modules import only light dependencies; converter libraries (pandas,
+# tabula, pdf2docx, python-pptx, …) load on first use – see utils/lazy.py.
+BLUEPRINTS = (
+    ('img_to_pdf',       '/api/pdf'),
+    ('pdf_merge',        '/api/pdf'),
+    ('pdf_split',        '/api/pdf'),
+    ('pdf_compress',     '/api/pdf'),
+    ('pdf_to_word',      '/api/pdf'),
+    ('word_to_pdf',      '/api/doc'),
+    ('pdf_to_excel',     '/api/pdf'),
+    ('pdf_to_ppt',       '/api/pdf'),
+    ('pdf_protect',      '/api/pdf'),
+    ('pdf_unlock',       '/api/pdf'),
+    ('pdf_pipeline',     '/api/pdf'),
+    ('word_converter',   '/api/doc'),
+    ('excel_converter',  '/api/doc'),
+    ('data_to_excel',    '/api/doc'),
+    ('ppt_converter',    '/api/doc'),
+    ('text_extractor',   '/api/doc'),
+    ('ocr_scanner',      '/api/doc'),
+    ('doc_merger',       '/api/doc'),
+    ('format_converter', '/api/doc'),
+    ('jobs',             '/api'),
+    ('files',            '/api'),
+)
+
+_import_ms = {}
+for _name, _prefix in BLUEPRINTS:
+    _start = time.perf_counter()
+    _module = importlib.import_module(f'routes.{_name}')
+    _import_ms[_name] = (time.perf_counter() - _start) * 1000
+    app.register_blueprint(_module.bp, url_prefix=_prefix)
+logger.info('Imported %d route modules in %.0f ms (%s)', len(_import_ms), sum(_import_ms.values()),
+            ', '.join(f'{n} {ms:.0f}' for n, ms in sorted(_import_ms.items(), key=lambda i: -i[1])[:5]))
+
+# Start the tabula JVM before the first PDF→Excel request.  Called by
+# gunicorn.conf.py in each worker (a JVM does not survive fork, so never in a
+# --preload master) and by serve.py.
+def warm_up_worker():
+    if os.environ.get('TABULA_WARMUP', '1') != '0':
+        from routes.pdf_to_excel import warm_up as tabula_warm_up
+        tabula_warm_up()
 
 # ── Health / Root ───────────────────────────────────────────────────────────
 @app.route('/health')
@@ -147,9 +132,17 @@ def health():
         service='allfilechanger-python-backend',
         environment=os.environ.get('FLASK_ENV', 'production'),
         memory=mem_info,
-        temp_files=temp_files
+        temp_files=temp_files,
+        cache=result_cache.stats(),
+        file_store=file_store.stats(),
+        admission=memory_governor.stats(),
+        imports=lazy.stats()
     )
 
+@app.route('/metrics')
+def prometheus_metrics():
+    return metrics.exposition()
+
 @app.route('/')
 def root():
     return jsonify(
@@ -160,20 +153,30 @@ def root():
             'pdf_merge':       'POST /api/pdf/merge',
             'pdf_split':       'POST /api/pdf/split',
             'pdf_compress':    'POST /api/pdf/compress',
+            'pdf_compress_estimate': 'POST /api/pdf/compress/estimate',
             'pdf_to_word':     'POST /api/pdf/to-word',
             'pdf_to_excel':    'POST /api/pdf/to-excel',
             'pdf_to_ppt':      'POST /api/pdf/to-powerpoint',
             'pdf_protect':     'POST /api/pdf/protect',
             'pdf_unlock':      'POST /api/pdf/unlock',
+            'pdf_pipeline':    'POST /api/pdf/pipeline',
             'word_to_pdf':     'POST /api/doc/word-to-pdf',
             'word_convert':    'POST /api/doc/word-convert',
             'excel_convert':   'POST /api/doc/excel-convert',
+            'data_to_excel':   'POST /api/doc/to-excel',
             'ppt_convert':     'POST /api/doc/ppt-convert',
             'text_extract':    'POST /api/doc/extract',
             'ocr_scan':        'POST /api/doc/scan',
             'doc_merge':       'POST /api/doc/merge',
             'format_convert':  'POST /api/doc/format-convert',
+            'job_status':      'GET  /api/jobs/<id>',
+            'job_result':      'GET  /api/jobs/<id>/result',
+            'file_upload':     'POST /api/files',
+            'file_info':       'GET  /api/files/<id>',
+            'file_content':    'GET  /api/files/<id>/content',
+            'file_delete':     'DELETE /api/files/<id>',
             'health':          'GET  /health',
+            'metrics':         'GET  /metrics',
         }
     )
 
@@ -185,20 +188,9 @@ def too_large(e):
 @app.errorhandler(Exception)
 def handle_exception(e):
     logger.exception('Unhandled error')
+    metrics.record_error(e)
     detail = str(e) if os.environ.get('FLASK_ENV') != 'production' else 'An internal error occurred'
     return jsonify(error='Internal server error', details=detail), 500
 
-# ── Graceful shutdown ───────────────────────────────────────────────────────
-def _shutdown(signum, frame):
-    logger.info(f'Received signal {signum} – shutting down')
-    cleanup_temp()
-    sys.exit(0)
-
-signal.signal(signal.SIGTERM, _shutdown)
-signal.signal(signal.SIGINT,  _shutdown)
-
-# ── Run ─────────────────────────────────────────────────────────────────────
-if __name__ == '__main__':
-    PORT = int(os.environ.get('PORT', 5050))
-    logger.info(f'🚀 AllFileChanger Python Backend starting on port {PORT}')
-    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
+# ── MEMORY MANAGEMENT: freeze the boot heap, raise GC thresholds ──────────
+memory_governor.tune_gc()
@@ -0,0 +1,11 @@
+"""Benchmarks – reproducible per-endpoint timings and memory for the Python backend.
+
+    python -m benchmarks run --out baseline.json          # all cases
+    python -m benchmarks run "pdf_*" --compare baseline.json
+    python -m benchmarks compare baseline.json current.json
+    python -m benchmarks load --duration 3600             # soak under gunicorn
+
+Run from ``backend/python-server``.  See ``corpus`` for the generated
+inputs, ``cases`` for what each endpoint is fed, ``runner`` for what
+is measured per call and ``load`` for the HTTP load / soak harness.
+"""
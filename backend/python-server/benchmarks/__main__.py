@@ -0,0 +1,100 @@
+"""Command line: ``python -m benchmarks {run,compare,corpus,list,load}`` from backend/python-server."""
+
+import argparse, sys
+from benchmarks import compare as cmp, runner
+
+
+def _compare(baseline, current, threshold, verbose):
+    rows, regressions = cmp.compare(baseline, current, threshold)
+    print(cmp.report(rows, only_changes=not verbose))
+    added, removed = cmp.coverage(baseline, current)
+    if added:
+        print('Not in baseline:', ', '.join(added))
+    if removed:
+        print('Missing from this run:', ', '.join(removed))
+    print(f'{len(regressions)} regression(s) beyond {threshold:.0%}')
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='benchmark cases and write a JSON result')
+    p.add_argument('cases', nargs='*', help='case name globs, e.g. "pdf_*" (default: all)')
+    p.add_argument('--out', default='benchmark-results.json')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--scale', type=float, default=1.0, help='corpus size multiplier')
+    p.add_argument('--corpus', help='corpus directory (default: benchmarks/.corpus/scale-N)')
+    p.add_argument('--no-tracemalloc', action='store_true')
+    p.add_argument('--compare', metavar='BASELINE', help='compare against a baseline JSON afterwards')
+    p.add_argument('--threshold', type=float, default=0.2)
+
+    p = sub.add_parser('compare', help='compare two result files')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('--threshold', type=float, default=0.2)
+    p.add_argument('-v', '--verbose', action='store_true', help='show unchanged metrics too')
+
+    p = sub.add_parser('corpus', help='only generate the corpus')
+    p.add_argument('--scale', type=float, default=1.0)
+    p.add_argument('--corpus')
+
+    sub.add_parser('list', help='list cases and their requirements')
+
+    p = sub.add_parser('load', help='mixed-workload load / soak test against gunicorn')
+    p.add_argument('--mix', help='case-glob weights, e.g. "pdf_compress.*=5,text_extract.*=1"')
+    p.add_argument('--sizes', help='corpus scale weights, e.g. "0.1:70,0.3:25,1:5"')
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--timeout', type=int, default=120, help='gunicorn and client timeout, seconds')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--rps', type=float, help='open-loop request rate (default: closed loop)')
+    p.add_argument('--duration', type=float, default=60.0, help='seconds; hours-long for a soak')
+    p.add_argument('--warmup', type=float, help='seconds excluded from stats (default: min(duration/4, 30))')
+    p.add_argument('--interval', type=float, default=1.0, help='RSS sampling interval, seconds')
+    p.add_argument('--leak-mb', type=float, default=20.0, help='worker RSS floor growth treated as a leak')
+    p.add_argument('--max-error-rate', type=float, default=0.01)
+    p.add_argument('--url', help='load an already running server instead (no RSS sampling)')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--out', default='load-results.json')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        doc = runner.run(args.cases, args.repeat, args.scale, args.corpus,
+                         trace=not args.no_tracemalloc)
+        runner.save(doc, args.out)
+        print(f'Wrote {args.out} ({len(doc["cases"])} cases, {len(doc["skipped"])} skipped)')
+        if args.compare:
+            return _compare(runner.load(args.compare), doc, args.threshold, False)
+        return 0
+    if args.command == 'compare':
+        return _compare(runner.load(args.baseline), runner.load(args.current),
+                        args.threshold, args.verbose)
+    if args.command == 'corpus':
+        from benchmarks import corpus
+        for name, path in corpus.build(args.scale, args.corpus).items():
+            print(f'{name:16s} {path if isinstance(path, str) else f"{len(path)} files"}')
+        return 0
+    if args.command == 'load':
+        from benchmarks import load
+        doc = load.run(load.parse_weights(args.mix) if args.mix else None,
+                       load.parse_weights(args.sizes, float) if args.sizes else None,
+                       args.workers, args.concurrency, args.rps, args.duration, args.warmup,
+                       args.interval, args.timeout, args.url, args.seed, args.leak_mb)
+        runner.save(doc, args.out)
+        print(load.report(doc))
+        print(f'Wrote {args.out}')
+        failed = doc['leak_suspected'] or doc['summary']['error_rate'] > args.max_error_rate
+        return 1 if failed else 0
+    if args.command == 'list':
+        from benchmarks import cases
+        for case in cases.CASES:
+            missing = cases.missing(case)
+            note = f'  (skipped here: {", ".join(missing)})' if missing else ''
+            print(f'{case.name:45s} {case.path:28s} {",".join(case.requires)}{note}')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
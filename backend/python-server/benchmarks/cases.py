@@ -0,0 +1,121 @@
+"""Cases – one request per benchmarked endpoint, built from the corpus.
+
+``fields(corpus)`` returns fresh multipart fields for every call (the test
+client consumes upload streams).  ``requires`` names external tools or
+optional packages; cases whose requirements are missing are skipped.
+"""
+
+from collections import namedtuple
+from PyPDF2 import PdfReader, PdfWriter
+import io, os, json, shutil, importlib.util
+
+Case = namedtuple('Case', 'name path fields requires', defaults=((),))
+
+
+def _upload(path, name=None):
+    with open(path, 'rb') as f:
+        return io.BytesIO(f.read()), name or os.path.basename(path)
+
+
+def _encrypted(path, password='bench'):
+    writer = PdfWriter()
+    writer.append(PdfReader(path))
+    writer.encrypt(password)
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out, 'encrypted.pdf'
+
+
+_PIPELINE = json.dumps([{'op': 'unlock', 'password': 'bench'},
+                        {'op': 'compress', 'level': 'medium'},
+                        {'op': 'split', 'mode': 'range', 'start': 2, 'end': 4},
+                        {'op': 'protect', 'password': 'out'}])
+
+CASES = [
+    # ── PDF tools ───────────────────────────────────────────────────────────
+    Case('img_to_pdf.mixed_images', '/api/pdf/image-to-pdf',
+         lambda c: {'images': [_upload(p) for p in c['images']]}),
+    Case('pdf_merge.text_scanned_ranges', '/api/pdf/merge',
+         lambda c: {'pdfs': [_upload(c['text.pdf']), _upload(c['scanned.pdf'])],
+                    'ranges': ['1-8', '']}),
+    Case('pdf_split.all', '/api/pdf/split',
+         lambda c: {'pdf': _upload(c['text.pdf']), 'mode': 'all'}),
+    Case('pdf_split.range', '/api/pdf/split',
+         lambda c: {'pdf': _upload(c['text.pdf']), 'mode': 'range', 'start': '2', 'end': '8'}),
+    Case('pdf_compress.scanned_high', '/api/pdf/compress',
+         lambda c: {'pdf': _upload(c['scanned.pdf']), 'level': 'high'}),
+    Case('pdf_compress.scanned_target', '/api/pdf/compress',
+         lambda c: {'pdf': _upload(c['scanned.pdf']),
+                    'target_bytes': str(os.path.getsize(c['scanned.pdf']) // 4)}),
+    Case('pdf_compress.estimate', '/api/pdf/compress/estimate',
+         lambda c: {'pdf': _upload(c['scanned.pdf'])}),
+    Case('pdf_protect.text', '/api/pdf/protect',
+         lambda c: {'pdf': _upload(c['text.pdf']), 'password': 'bench'}),
+    Case('pdf_unlock.text', '/api/pdf/unlock',
+         lambda c: {'pdf': _encrypted(c['text.pdf']), 'password': 'bench'}),
+    Case('pdf_pipeline.unlock_compress_split_protect', '/api/pdf/pipeline',
+         lambda c: {'pdf': _encrypted(c['scanned.pdf']), 'ops': _PIPELINE}),
+    Case('pdf_to_word.text', '/api/pdf/to-word',
+         lambda c: {'pdf': _upload(c['text_small.pdf'])}),
+    Case('pdf_to_excel.tables', '/api/pdf/to-excel',
+         lambda c: {'pdf': _upload(c['tables.pdf']), 'mode': 'lattice'}, ('java',)),
+    Case('pdf_to_ppt.text', '/api/pdf/to-powerpoint',
+         lambda c: {'pdf': _upload(c['text_small.pdf'])}, ('poppler',)),
+
+    # ── Document tools ──────────────────────────────────────────────────────
+    Case('word_to_pdf.docx', '/api/doc/word-to-pdf',
+         lambda c: {'file': _upload(c['large.docx'])}, ('libreoffice',)),
+    Case('word_convert.docx_txt', '/api/doc/word-convert',
+         lambda c: {'file': _upload(c['large.docx']), 'format': 'txt'}),
+    Case('ppt_convert.pptx_pdf', '/api/doc/ppt-convert',
+         lambda c: {'file': _upload(c['large.pptx']), 'format': 'pdf'}, ('libreoffice',)),
+    Case('format_convert.docx_pdf', '/api/doc/format-convert',
+         lambda c: {'file': _upload(c['large.docx']), 'format': 'pdf'}, ('libreoffice',)),
+    Case('excel_convert.csv', '/api/doc/excel-convert',
+         lambda c: {'file': _upload(c['large.xlsx']), 'format': 'csv'}),
+    Case('excel_convert.json', '/api/doc/excel-convert',
+         lambda c: {'file': _upload(c['large.xlsx']), 'format': 'json'}),
+    Case('excel_convert.parquet', '/api/doc/excel-convert',
+         lambda c: {'file': _upload(c['large.xlsx']), 'format': 'parquet'}, ('pyarrow',)),
+    Case('data_to_excel.csv', '/api/doc/to-excel',
+         lambda c: {'file': _upload(c['large.csv'])}),
+    Case('text_extract.pdf', '/api/doc/extract',
+         lambda c: {'file': _upload(c['text.pdf'])}),
+    Case('text_extract.pdf_parallel', '/api/doc/extract',
+         lambda c: {'file': _upload(c['text.pdf']), 'parallel': '1', 'format': 'ndjson'}),
+    Case('text_extract.docx', '/api/doc/extract',
+         lambda c: {'file': _upload(c['large.docx'])}),
+    Case('text_extract.pptx', '/api/doc/extract',
+         lambda c: {'file': _upload(c['large.pptx'])}),
+    Case('ocr_scan.pngs', '/api/doc/scan',
+         lambda c: {'images': [_upload(p) for p in c['scans']]}, ('tesseract',)),
+    Case('doc_merge.docx', '/api/doc/merge',
+         lambda c: {'files': [_upload(c['large.docx']), _upload(c['large.docx'], 'b.docx')],
+                    'type': 'docx'}),
+    Case('doc_merge.pdf', '/api/doc/merge',
+         lambda c: {'files': [_upload(c['text.pdf']), _upload(c['tables.pdf'])], 'type': 'pdf'}),
+
+    # ── Infrastructure ──────────────────────────────────────────────────────
+    Case('files.upload', '/api/files',
+         lambda c: {'file': _upload(c['scanned.pdf'])}),
+]
+
+
+def _libreoffice():
+    from utils import libreoffice
+    return libreoffice.available()
+
+
+_CHECKS = {
+    'java':        lambda: shutil.which('java') is not None,
+    'poppler':     lambda: shutil.which('pdftoppm') is not None,
+    'tesseract':   lambda: shutil.which('tesseract') is not None,
+    'libreoffice': _libreoffice,
+    'pyarrow':     lambda: importlib.util.find_spec('pyarrow') is not None,
+}
+
+
+def missing(case):
+    """Requirements of *case* that are not available here."""
+    return [r for r in case.requires if not _CHECKS[r]()]
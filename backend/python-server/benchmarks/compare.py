@@ -0,0 +1,63 @@
+"""Compare – flag regressions of a run against a JSON baseline.
+
+A metric regresses when it grows by more than ``threshold`` (relative) *and*
+by more than its noise floor (absolute), so tiny cases do not trip on
+jitter.  A case whose status changes to a non-2xx one also counts as a
+regression.
+"""
+
+# metric → absolute noise floor
+METRICS = {
+    'wall_s':              0.02,
+    'cpu_s':               0.02,
+    'peak_rss_mb':         4.0,
+    'tracemalloc_peak_mb': 2.0,
+    'output_bytes':        1024,
+}
+
+
+def compare(baseline, current, threshold=0.2):
+    """Return ``(rows, regressions)``; rows are ``(case, metric, old, new, change, flag)``."""
+    rows, regressions = [], []
+    base_cases, cur_cases = baseline.get('cases', {}), current.get('cases', {})
+    for name in sorted(set(base_cases) & set(cur_cases)):
+        old_case, new_case = base_cases[name], cur_cases[name]
+        old_status, new_status = old_case.get('status'), new_case.get('status')
+        if old_status != new_status:
+            failed = not 200 <= (new_status or 0) < 300
+            row = (name, 'status', old_status, new_status, None, 'REGRESSION' if failed else 'fixed')
+            rows.append(row)
+            if failed:
+                regressions.append(row)
+            continue
+        for metric, floor in METRICS.items():
+            old, new = old_case.get(metric), new_case.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+            flag = ''
+            if new - old > floor and change > threshold:
+                flag = 'REGRESSION'
+            elif old - new > floor and -change > threshold:
+                flag = 'improved'
+            row = (name, metric, old, new, change, flag)
+            rows.append(row)
+            if flag == 'REGRESSION':
+                regressions.append(row)
+    return rows, regressions
+
+
+def report(rows, only_changes=True):
+    lines = [f'{"case":45s} {"metric":20s} {"baseline":>12s} {"current":>12s} {"change":>9s}']
+    for name, metric, old, new, change, flag in rows:
+        if only_changes and not flag:
+            continue
+        pct = '' if change is None else f'{change:+.0%}'
+        lines.append(f'{name:45s} {metric:20s} {old!s:>12} {new!s:>12} {pct:>9s}  {flag}')
+    return '\n'.join(lines)
+
+
+def coverage(baseline, current):
+    """Cases present in only one of the two runs (new, removed or newly skipped)."""
+    base, cur = set(baseline.get('cases', {})), set(current.get('cases', {}))
+    return sorted(cur - base), sorted(base - cur)
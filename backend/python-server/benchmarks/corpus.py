@@ -0,0 +1,292 @@
+"""Corpus – deterministic synthetic inputs for every benchmark case.
+
+Everything is generated from a fixed seed with the libraries the server
+already depends on, so two machines produce the same documents.  PDFs are
+written directly (text, table grids and JPEG page scans) rather than
+through a converter, which keeps their structure stable across library
+upgrades.  ``build(scale)`` writes the files once into a cache directory.
+"""
+
+from PIL import Image, ImageDraw
+from docx import Document
+from pptx import Presentation
+from pptx.util import Inches, Pt
+from openpyxl import Workbook
+import io, os, csv, json, random, datetime, zlib
+
+SEED = 20240601
+_PAGE = (612, 792)   # US letter, points
+
+_WORDS = ('alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima '
+          'mike november oscar papa quebec romeo sierra tango uniform victor whiskey '
+          'xray yankee zulu invoice total amount balance quarter revenue account '
+          'document section report summary page table figure analysis result').split()
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(_WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def _lines(rng, count, width=11):
+    return [_sentence(rng, width) for _ in range(count)]
+
+
+# ── Minimal PDF writer ──────────────────────────────────────────────────────
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pdf(pages):
+    """Serialise *pages* – ``(content_ops, jpeg or None)`` tuples – as a PDF.
+
+    Contents are Flate-compressed; a page's JPEG, if any, is available to
+    its content stream as ``/Im0``.  Object order and bytes depend only on
+    the input, so output is byte-for-byte reproducible.
+    """
+    objects = [None, None, None]             # 1 catalog, 2 pages, 3 font
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[2] = b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    kids = []
+
+    def add(obj):
+        objects.append(obj)
+        return len(objects)
+
+    for ops, jpeg in pages:
+        xobject = b''
+        if jpeg is not None:
+            width, height = Image.open(io.BytesIO(jpeg)).size
+            im = add(b'<< /Type /XObject /Subtype /Image /Width %d /Height %d '
+                     b'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /DCTDecode '
+                     b'/Length %d >>\nstream\n' % (width, height, len(jpeg)) + jpeg + b'\nendstream')
+            xobject = b' /XObject << /Im0 %d 0 R >>' % im
+        data = zlib.compress(ops.encode('latin-1'))
+        content = add(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(data) + data + b'\nendstream')
+        kids.append(add(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                        b'/Resources << /Font << /F1 3 0 R >>%s >> /Contents %d 0 R >>'
+                        % (_PAGE[0], _PAGE[1], xobject, content)))
+    objects[1] = (b'<< /Type /Pages /Count %d /Kids [' % len(kids)
+                  + b' '.join(b'%d 0 R' % k for k in kids) + b'] >>')
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n' % n + obj + b'\nendobj\n')
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for off in offsets:
+        out.write(b'%010d 00000 n \n' % off)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+              % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _text_ops(lines, title):
+    ops = ['BT /F1 16 Tf 72 740 Td (%s) Tj ET' % _escape(title), 'BT /F1 10 Tf 72 710 Td 13 TL']
+    ops += ['(%s) \'' % _escape(line) for line in lines]
+    ops.append('ET')
+    return '\n'.join(ops)
+
+
+def text_pdf(pages, seed=SEED):
+    rng = random.Random(seed)
+    return _pdf([(_text_ops(_lines(rng, 48), f'Page {n}'), None) for n in range(1, pages + 1)])
+
+
+def table_pdf(pages, rows=20, cols=5, seed=SEED):
+    """Pages with one ruled table each – lattice-detectable grid lines plus cell text."""
+    rng = random.Random(seed)
+    cell_w, cell_h, left, top = 94, 24, 72, 700
+    out = []
+    for n in range(1, pages + 1):
+        ops = ['BT /F1 14 Tf 72 740 Td (%s) Tj ET' % f'Quarterly figures {n}', '0.5 w']
+        for r in range(rows + 1):
+            y = top - r * cell_h
+            ops.append(f'{left} {y} m {left + cols * cell_w} {y} l S')
+        for c in range(cols + 1):
+            x = left + c * cell_w
+            ops.append(f'{x} {top} m {x} {top - rows * cell_h} l S')
+        for r in range(rows):
+            for c in range(cols):
+                text = rng.choice(_WORDS).title() if c == 0 or r == 0 else f'{rng.uniform(0, 10000):.2f}'
+                ops.append('BT /F1 9 Tf %d %d Td (%s) Tj ET'
+                           % (left + c * cell_w + 4, top - (r + 1) * cell_h + 8, _escape(text)))
+        out.append(('\n'.join(ops), None))
+    return _pdf(out)
+
+
+def scan_image(seed=SEED, dpi=150, lines=40):
+    """A greyscale page 'scan': dark text rows on an off-white, slightly uneven background."""
+    rng = random.Random(seed)
+    w, h = int(8.5 * dpi), int(11 * dpi)
+    img = Image.new('L', (w, h), 238)
+    draw = ImageDraw.Draw(img)
+    for _ in range(300):                                   # paper texture / speckles
+        x, y = rng.randrange(w), rng.randrange(h)
+        draw.ellipse((x, y, x + rng.randint(1, 3), y + rng.randint(1, 3)), fill=rng.randint(170, 225))
+    y = dpi // 2
+    for line in _lines(rng, lines, 9):
+        draw.text((dpi // 2, y), line, fill=rng.randint(10, 50))
+        y += int(dpi * 0.25)
+    return img
+
+
+def scanned_pdf(pages, seed=SEED, quality=90):
+    """Image-only PDF: one full-page greyscale JPEG per page, like a scanner's output."""
+    out = []
+    for n in range(pages):
+        buf = io.BytesIO()
+        scan_image(seed + n).save(buf, 'JPEG', quality=quality)
+        out.append((f'q {_PAGE[0]} 0 0 {_PAGE[1]} 0 0 cm /Im0 Do Q', buf.getvalue()))
+    return _pdf(out)
+
+
+# ── Office documents ────────────────────────────────────────────────────────
+
+def _saved(doc):
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def docx(paragraphs, seed=SEED):
+    rng = random.Random(seed)
+    doc = Document()
+    for n in range(paragraphs):
+        if n % 25 == 0:
+            doc.add_heading(f'Section {n // 25 + 1}', level=1)
+        doc.add_paragraph(' '.join(_lines(rng, 3)))
+    table = doc.add_table(rows=10, cols=4)
+    for row in table.rows:
+        for cell in row.cells:
+            cell.text = rng.choice(_WORDS)
+    return _saved(doc)
+
+
+def pptx(slides, seed=SEED):
+    rng = random.Random(seed)
+    prs = Presentation()
+    for n in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f'Slide {n + 1}: {rng.choice(_WORDS).title()}'
+        body = slide.placeholders[1].text_frame
+        body.text = _sentence(rng, 6)
+        for line in _lines(rng, 4, 6):
+            body.add_paragraph().text = line
+        box = slide.shapes.add_textbox(Inches(1), Inches(6.5), Inches(8), Inches(0.5))
+        box.text_frame.text = _sentence(rng, 12)
+        box.text_frame.paragraphs[0].runs[0].font.size = Pt(10)
+    return _saved(prs)
+
+
+def _records(rows, seed):
+    rng = random.Random(seed)
+    base = datetime.datetime(2024, 1, 1)
+    for n in range(rows):
+        yield (n + 1, rng.choice(_WORDS), round(rng.uniform(-5000, 5000), 2),
+               rng.randint(0, 10 ** 6), base + datetime.timedelta(minutes=37 * n),
+               rng.random() < 0.5, _sentence(rng, 5))
+
+
+_COLUMNS = ('id', 'category', 'amount', 'count', 'timestamp', 'flag', 'note')
+
+
+def xlsx(rows, sheets=2, seed=SEED):
+    wb = Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f'Sheet{s + 1}')
+        ws.append(_COLUMNS)
+        for record in _records(rows, seed + s):
+            ws.append(record)
+    return _saved(wb)
+
+
+def csv_bytes(rows, seed=SEED):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(_COLUMNS)
+    for record in _records(rows, seed):
+        writer.writerow(r.isoformat() if isinstance(r, datetime.datetime) else r for r in record)
+    return out.getvalue().encode('utf-8')
+
+
+def images(count, seed=SEED):
+    """Mixed PNG / JPEG / WebP / TIFF images of assorted sizes and modes."""
+    rng = random.Random(seed)
+    formats = (('png', 'PNG', 'RGBA'), ('jpg', 'JPEG', 'RGB'), ('webp', 'WEBP', 'RGB'), ('tiff', 'TIFF', 'RGB'))
+    out = []
+    for n in range(count):
+        ext, fmt, mode = formats[n % len(formats)]
+        w, h = rng.randint(800, 3000), rng.randint(800, 3000)
+        img = Image.new(mode, (w, h), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(w), rng.randrange(h)
+            draw.rectangle((x, y, x + rng.randint(20, w // 3), y + rng.randint(20, h // 3)),
+                           fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        buf = io.BytesIO()
+        img.save(buf, fmt, **({'quality': 90} if fmt in ('JPEG', 'WEBP') else {}))
+        out.append((f'image_{n + 1}.{ext}', buf.getvalue()))
+    return out
+
+
+def scan_pngs(count, seed=SEED):
+    out = []
+    for n in range(count):
+        buf = io.BytesIO()
+        scan_image(seed + n, dpi=300).save(buf, 'PNG', dpi=(300, 300))
+        out.append((f'scan_{n + 1}.png', buf.getvalue()))
+    return out
+
+
+# ── Corpus on disk ──────────────────────────────────────────────────────────
+
+def _spec(scale):
+    """File name → generator call, sized by *scale* (1 = a few minutes for the full suite)."""
+    n = lambda base, least=1: max(least, int(round(base * scale)))
+    return {
+        'text.pdf':         lambda: text_pdf(n(60, 10)),     # cases select pages up to 8
+        'text_small.pdf':   lambda: text_pdf(n(8), seed=SEED + 1),
+        'tables.pdf':       lambda: table_pdf(n(10)),
+        'scanned.pdf':      lambda: scanned_pdf(n(12, 4)),
+        'large.docx':       lambda: docx(n(600)),
+        'large.pptx':       lambda: pptx(n(60)),
+        'large.xlsx':       lambda: xlsx(n(40000)),
+        'large.csv':        lambda: csv_bytes(n(80000)),
+        'images':           lambda: images(n(8)),
+        'scans':            lambda: scan_pngs(n(3)),
+    }
+
+
+def build(scale=1.0, directory=None):
+    """Generate (or reuse) the corpus for *scale*; returns ``{name: path or [paths]}``."""
+    directory = directory or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          '.corpus', f'scale-{scale:g}')
+    os.makedirs(directory, exist_ok=True)
+    corpus = {}
+    for name, make in _spec(scale).items():
+        path = os.path.join(directory, name)
+        if '.' in name:
+            if not os.path.exists(path):
+                data = make()
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+            corpus[name] = path
+        else:   # a set of files
+            index = os.path.join(path, 'index.json')
+            if not os.path.exists(index):
+                os.makedirs(path, exist_ok=True)
+                names = []
+                for fname, data in make():
+                    with open(os.path.join(path, fname), 'wb') as f:
+                        f.write(data)
+                    names.append(fname)
+                with open(index, 'w') as f:
+                    json.dump(names, f)
+            with open(index) as f:
+                corpus[name] = [os.path.join(path, fname) for fname in json.load(f)]
+    return corpus
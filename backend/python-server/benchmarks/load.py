@@ -0,0 +1,454 @@
+"""Load – mixed-workload HTTP load and soak runs against gunicorn.
+
+Starts ``gunicorn app:app`` with the production flags (or targets an
+already running ``--url``) and replays a weighted mix of the benchmark
+cases, drawing each request's inputs from corpora of several scales so
+small and large documents interleave as they do in production.
+
+Closed loop by default: ``concurrency`` clients send back to back.  With
+``rps`` requests are scheduled on a fixed clock instead and latency is
+counted from the scheduled time, so queueing behind slow requests shows up
+as latency rather than as a quietly lower offered load.
+
+Every gunicorn worker's RSS is sampled throughout.  The leak check cuts
+each worker's post-warm-up samples into windows and takes the minimum of
+each: transient peaks from large requests do not move these floors, memory
+that is never given back keeps raising them.
+"""
+
+import os, sys, math, time, uuid, queue, random, signal, socket, fnmatch, shutil, tempfile, threading
+import subprocess, http.client
+from urllib.parse import urlsplit
+import psutil
+
+from benchmarks import runner
+
+_MB = 1024 * 1024
+_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# case-name glob → share of traffic (split evenly between the cases it matches)
+DEFAULT_MIX = {
+    'pdf_compress.*':   20,
+    'pdf_merge.*':      12,
+    'img_to_pdf.*':     12,
+    'text_extract.*':   10,
+    'pdf_split.*':       8,
+    'pdf_to_word.*':     6,
+    'pdf_protect.*':     4,
+    'pdf_unlock.*':      4,
+    'pdf_pipeline.*':    4,
+    'word_convert.*':    4,
+    'excel_convert.*':   4,
+    'data_to_excel.*':   3,
+    'doc_merge.*':       3,
+    'word_to_pdf.*':     3,
+    'ppt_convert.*':     2,
+    'format_convert.*':  2,
+    'pdf_to_excel.*':    2,
+    'pdf_to_ppt.*':      2,
+    'ocr_scan.*':        2,
+}
+
+# corpus scale → share of traffic: mostly small documents, a long tail of big ones
+DEFAULT_SIZES = {0.1: 70, 0.3: 25, 1.0: 5}
+
+
+def parse_weights(text, key=str):
+    """``"a=3,b=1"`` (or ``"0.1:70,1:5"``) → ``{key(a): 3.0, key(b): 1.0}``."""
+    out = {}
+    for item in filter(None, (s.strip() for s in text.split(','))):
+        name, _, weight = item.replace(':', '=').rpartition('=')
+        if not name:
+            name, weight = weight, '1'
+        out[key(name)] = float(weight)
+    return out
+
+
+# ── Requests ────────────────────────────────────────────────────────────────
+
+def _multipart(fields):
+    """Encode benchmark case fields as a ``multipart/form-data`` body."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, tuple):
+                stream, filename = item
+                head = (f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                        'Content-Type: application/octet-stream')
+                data = stream.getvalue()
+            else:
+                head = f'Content-Disposition: form-data; name="{name}"'
+                data = str(item).encode('utf-8')
+            parts += [f'--{boundary}\r\n{head}\r\n\r\n'.encode('utf-8'), data, b'\r\n']
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def _bodies(picks, corpora):
+    """Encode every ``(case, scale)`` body up front so clients only send."""
+    return {(case.name, scale): _multipart(case.fields(corpora[scale])) for case, scale in picks}
+
+
+def _send(url, path, body, content_type, timeout):
+    """POST and read the whole response; returns ``(status, response_bytes)``."""
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    try:
+        conn.request('POST', path, body, {'Content-Type': content_type})
+        resp = conn.getresponse()
+        size = 0
+        while True:
+            chunk = resp.read(64 * 1024)
+            if not chunk:
+                return resp.status, size
+            size += len(chunk)
+    finally:
+        conn.close()
+
+
+def _get(url, path, timeout=5):
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+# ── Server ──────────────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """``gunicorn app:app`` as deployed (``--workers 4 --timeout 120``), on a free local port."""
+
+    def __init__(self, workdir, workers=4, timeout=120, extra=()):
+        self.workdir, self.workers, self.timeout, self.extra = workdir, workers, timeout, list(extra)
+        self.proc = self.url = None
+
+    def start(self, wait=120):
+        port = _free_port()
+        self.url = urlsplit(f'http://127.0.0.1:{port}')
+        self._log = open(os.path.join(self.workdir, 'gunicorn.log'), 'wb')
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+             '--workers', str(self.workers), '--timeout', str(self.timeout), *self.extra],
+            cwd=_SERVER_DIR, stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                if _get(self.url, '/health')[0] == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.25)
+        tail = self.log_tail()
+        self.stop()
+        raise RuntimeError('gunicorn did not become healthy:\n' + tail)
+
+    def worker_processes(self):
+        try:
+            return psutil.Process(self.proc.pid).children()
+        except psutil.Error:
+            return []
+
+    def log_tail(self, lines=30):
+        self._log.flush()
+        with open(self._log.name, 'rb') as f:
+            return b''.join(f.readlines()[-lines:]).decode('utf-8', 'replace')
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGTERM)
+            try:
+                self.proc.wait(30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self._log.close()
+
+
+def _sample_rss(server, t0, interval, stop, rss):
+    while True:
+        now = round(time.monotonic() - t0, 2)
+        for proc in server.worker_processes():
+            try:
+                rss.setdefault(str(proc.pid), []).append((now, round(proc.memory_info().rss / _MB, 1)))
+            except psutil.Error:
+                pass
+        if stop.wait(interval):
+            return
+
+
+# ── Load generation ─────────────────────────────────────────────────────────
+
+def _choices(mix, sizes):
+    """Expand mix globs into runnable ``[(case, scale)]`` and weights; also returns skips."""
+    from benchmarks import cases as cases_mod
+    picks, weights, skipped = [], [], {}
+    total = sum(sizes.values())
+    for pattern, weight in mix.items():
+        runnable = []
+        for case in cases_mod.CASES:
+            if not fnmatch.fnmatch(case.name, pattern):
+                continue
+            missing = cases_mod.missing(case)
+            if missing:
+                skipped[case.name] = 'missing ' + ', '.join(missing)
+            else:
+                runnable.append(case)
+        for case in runnable:
+            for scale, share in sizes.items():
+                picks.append((case, scale))
+                weights.append(weight / len(runnable) * share / total)
+    if not picks:
+        raise ValueError('the mix matches no runnable case')
+    return picks, weights, skipped
+
+
+def _drive(url, picks, weights, bodies, concurrency, rps, duration, timeout, seed):
+    """Run the load; returns ``(records, dropped)``.
+
+    A record is ``(start_s, latency_s, case, scale, status, in_bytes, out_bytes, error)``;
+    ``dropped`` counts scheduled requests never sent because no client was free.
+    """
+    records, lock = [], threading.Lock()
+    t0 = time.monotonic()
+    deadline = t0 + duration
+    slots = queue.Queue() if rps else None
+
+    def one(rng, scheduled):
+        case, scale = rng.choices(picks, weights)[0]
+        body, content_type = bodies[case.name, scale]
+        status, out_bytes, error = 0, 0, None
+        try:
+            status, out_bytes = _send(url, case.path, body, content_type, timeout)
+        except (OSError, http.client.HTTPException) as e:
+            error = type(e).__name__
+        done = time.monotonic()
+        with lock:
+            records.append((round(scheduled - t0, 3), round(done - scheduled, 4), case.name, scale,
+                            status, len(body), out_bytes, error))
+
+    def client(n):
+        rng = random.Random(seed + n)
+        while True:
+            if slots is None:
+                start = time.monotonic()
+                if start >= deadline:
+                    return
+                one(rng, start)
+                continue
+            scheduled = slots.get()
+            if scheduled is None:
+                return
+            if time.monotonic() >= deadline:
+                continue                      # drain what is left unsent
+            one(rng, scheduled)
+
+    threads = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    scheduled = 0
+    if slots is not None:
+        while True:
+            at = t0 + scheduled / rps
+            if at >= deadline:
+                break
+            time.sleep(max(0.0, at - time.monotonic()))
+            slots.put(at)
+            scheduled += 1
+        for _ in threads:
+            slots.put(None)
+    for t in threads:
+        t.join()
+    return records, max(0, scheduled - len(records)) if rps else 0
+
+
+# ── Analysis ────────────────────────────────────────────────────────────────
+
+def _pct(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def summarise(records, elapsed):
+    latencies = sorted(r[1] for r in records)
+    ok = sum(1 for r in records if 200 <= r[4] < 300)
+    shed = sum(1 for r in records if r[4] == 503)
+    errors = len(records) - ok - shed
+    return {
+        'requests': len(records),
+        'ok': ok,
+        'shed_503': shed,
+        'errors': errors,
+        'error_rate': round(errors / len(records), 4) if records else 0.0,
+        'throughput_rps': round(len(records) / elapsed, 2) if elapsed else 0.0,
+        'p50_s': _pct(latencies, 50),
+        'p95_s': _pct(latencies, 95),
+        'p99_s': _pct(latencies, 99),
+        'max_s': latencies[-1] if latencies else None,
+        'mb_in': round(sum(r[5] for r in records) / _MB, 1),
+        'mb_out': round(sum(r[6] for r in records) / _MB, 1),
+    }
+
+
+def timeline(records, interval):
+    """Completed requests, failures and p95 per *interval* seconds of start time."""
+    buckets = {}
+    for r in records:
+        buckets.setdefault(int(r[0] // interval), []).append(r)
+    return [{'t': n * interval, **{k: v for k, v in summarise(rs, interval).items()
+                                   if k in ('requests', 'errors', 'shed_503', 'throughput_rps', 'p95_s')}}
+            for n, rs in sorted(buckets.items())]
+
+
+def leaks(rss, warmup, end, interval, windows=4, threshold_mb=20.0, min_span=120.0):
+    """Per-worker RSS floors after *warmup*; ``suspect`` when they only rise, by > *threshold_mb*.
+
+    Allocator arenas and lazily imported libraries keep growing for a while
+    after start, so no verdict is given on less than *min_span* seconds.
+    """
+    out = {}
+    for pid, samples in rss.items():
+        points = [(t, mb) for t, mb in samples if t >= warmup]
+        info = {'first_s': samples[0][0], 'last_s': samples[-1][0],
+                'exited': samples[-1][0] < end - 2 * interval}
+        if len(points) < windows * 2:
+            out[pid] = {**info, 'suspect': False, 'note': 'too few samples after warm-up'}
+            continue
+        size = len(points) // windows
+        floors = [min(mb for _, mb in points[i * size:(i + 1) * size]) for i in range(windows)]
+        n = len(points)
+        mean_t = sum(t for t, _ in points) / n
+        mean_mb = sum(mb for _, mb in points) / n
+        var = sum((t - mean_t) ** 2 for t, _ in points)
+        slope = sum((t - mean_t) * (mb - mean_mb) for t, mb in points) / var if var else 0.0
+        growth = floors[-1] - floors[0]
+        out[pid] = {
+            **info,
+            'floors_mb': floors,
+            'growth_mb': round(growth, 1),
+            'slope_mb_per_min': round(slope * 60, 2),
+            'peak_mb': max(mb for _, mb in points),
+            'suspect': (points[-1][0] - points[0][0] >= min_span and growth > threshold_mb
+                        and all(b >= a for a, b in zip(floors, floors[1:]))),
+        }
+        if points[-1][0] - points[0][0] < min_span:
+            out[pid]['note'] = f'no verdict under {min_span:g}s after warm-up'
+    return out
+
+
+# ── Entry point ─────────────────────────────────────────────────────────────
+
+def run(mix=None, sizes=None, workers=4, concurrency=8, rps=None, duration=60.0, warmup=None,
+        interval=1.0, timeout=120, url=None, seed=0, leak_mb=20.0, log=print):
+    """Run one load (or soak) test; returns the results document."""
+    mix, sizes = mix or DEFAULT_MIX, sizes or DEFAULT_SIZES
+    warmup = min(duration / 4, 30.0) if warmup is None else warmup
+    workdir = tempfile.mkdtemp(prefix='allfilechanger-load-')
+    runner.configure(workdir)
+    from benchmarks import corpus as corpus_mod
+
+    picks, weights, skipped = _choices(mix, sizes)
+    for name, reason in sorted(skipped.items()):
+        log(f'  skip  {name:45s} ({reason})')
+    log('Building corpora (scales ' + ', '.join(f'{s:g}' for s in sizes) + ') …')
+    bodies = _bodies(picks, {scale: corpus_mod.build(scale) for scale in sizes})
+
+    server, rss, stop = None, {}, threading.Event()
+    try:
+        if url:
+            target = urlsplit(url)
+        else:
+            server = Server(workdir, workers, timeout).start()
+            target = server.url
+        log(f'Load: {concurrency} clients, ' + (f'{rps:g} req/s' if rps else 'closed loop')
+            + f', {duration:g}s against {target.geturl()}')
+        t0 = time.monotonic()
+        sampler = None
+        if server:
+            sampler = threading.Thread(target=_sample_rss, args=(server, t0, interval, stop, rss), daemon=True)
+            sampler.start()
+        records, dropped = _drive(target, picks, weights, bodies, concurrency, rps, duration, timeout, seed)
+        elapsed = time.monotonic() - t0
+        stop.set()
+        if sampler:
+            sampler.join()
+    finally:
+        stop.set()
+        if server:
+            server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    steady = [r for r in records if r[0] >= warmup]
+    groups = {}
+    for r in steady:
+        groups.setdefault(r[2], []).append(r)
+        groups.setdefault(f'{r[2]}@{r[3]:g}', []).append(r)
+    failures = {}
+    for r in records:
+        if not 200 <= r[4] < 300:
+            key = f'{r[2]} → {r[7] or r[4]}'
+            failures[key] = failures.get(key, 0) + 1
+    memory = leaks(rss, warmup, elapsed, interval, threshold_mb=leak_mb) if rss else {}
+
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'target': 'gunicorn' if server else url,
+            'workers': workers if server else None,
+            'concurrency': concurrency,
+            'rps': rps,
+            'duration_s': duration,
+            'warmup_s': warmup,
+            'mix': mix,
+            'sizes': {f'{k:g}': v for k, v in sizes.items()},
+            'cpus': os.cpu_count(),
+        },
+        'summary': {**summarise(steady, max(elapsed - warmup, 1e-9)), 'dropped': dropped},
+        'cases': {name: summarise(rs, max(elapsed - warmup, 1e-9)) for name, rs in sorted(groups.items())},
+        'failures': failures,
+        'timeline': timeline(records, max(interval, 5.0)),
+        'rss_mb': rss,
+        'workers': memory,
+        'leak_suspected': any(w['suspect'] for w in memory.values()),
+        'skipped': skipped,
+    }
+
+
+def report(doc):
+    s = doc['summary']
+    ms = lambda v: '-' if v is None else f'{v * 1000:.0f}'
+    lines = [
+        f'{s["requests"]} requests after warm-up, {s["throughput_rps"]} req/s, '
+        f'{s["errors"]} errors ({s["error_rate"]:.2%}), {s["shed_503"]} shed (503), {s["dropped"]} dropped',
+        f'latency ms  p50 {ms(s["p50_s"])}  p95 {ms(s["p95_s"])}  p99 {ms(s["p99_s"])}  max {ms(s["max_s"])}',
+        '',
+        f'{"case":52s} {"n":>5s} {"err":>4s} {"503":>4s} {"p50":>7s} {"p95":>7s} {"p99":>7s}',
+    ]
+    for name, c in doc['cases'].items():
+        lines.append(f'{name:52s} {c["requests"]:5d} {c["errors"]:4d} {c["shed_503"]:4d} '
+                     f'{ms(c["p50_s"]):>7s} {ms(c["p95_s"]):>7s} {ms(c["p99_s"]):>7s}')
+    if doc['failures']:
+        lines += ['', 'Failures:'] + [f'  {n:5d}  {k}' for k, n in sorted(doc['failures'].items())]
+    if doc['workers']:
+        lines += ['', f'{"worker":>8s} {"floors MB":32s} {"growth":>7s} {"MB/min":>7s} {"peak":>7s}']
+        for pid, w in doc['workers'].items():
+            if 'floors_mb' not in w:
+                lines.append(f'{pid:>8s} {w["note"]}')
+                continue
+            flag = '  LEAK?' if w['suspect'] else ('  exited' if w['exited'] else '')
+            flag += f'  ({w["note"]})' if 'note' in w else ''
+            lines.append(f'{pid:>8s} {" → ".join(f"{f:g}" for f in w["floors_mb"]):32s} '
+                         f'{w["growth_mb"]:7.1f} {w["slope_mb_per_min"]:7.2f} {w["peak_mb"]:7.1f}{flag}')
+    return '\n'.join(lines)
@@ -0,0 +1,165 @@
+"""Runner – drive every case through the Flask test client and measure it.
+
+Per case: one untimed warm-up call, then ``repeat`` timed calls recording
+wall time, CPU time (this process plus reaped child processes such as
+tesseract and pdftoppm), peak RSS growth, and output size.  An optional
+extra call under ``tracemalloc`` records peak Python allocations; it is
+kept separate because tracing slows everything down.
+
+The app runs with the result cache disabled and private store / job /
+metrics directories, so repeats measure real work and nothing leaks into
+a running server's state.
+"""
+
+import os, time, json, shutil, fnmatch, platform, resource, statistics, tempfile, tracemalloc
+import psutil
+
+_MB = 1024 * 1024
+
+
+def configure(workdir):
+    """Point the app's shared directories at *workdir*; must run before ``import app``."""
+    os.environ.update({
+        'RESULT_CACHE_MAX_MB': '0',
+        'RESULT_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'FILE_STORE_DIR': os.path.join(workdir, 'files'),
+        'JOBS_DIR': os.path.join(workdir, 'jobs'),
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'metrics'),
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING'),
+    })
+
+
+# ── Probes ──────────────────────────────────────────────────────────────────
+
+def _rss():
+    return psutil.Process().memory_info().rss
+
+
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return _rss()
+
+
+def _cpu():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _call(client, case, fields):
+    """One request; returns ``(status, output_bytes)`` after the response is fully consumed."""
+    resp = client.post(case.path, data=fields, content_type='multipart/form-data')
+    try:
+        size = sum(len(chunk) for chunk in resp.iter_encoded())
+        return resp.status_code, size
+    finally:
+        resp.close()  # runs close callbacks: temp-file cleanup, admission release
+
+
+# ── Running ─────────────────────────────────────────────────────────────────
+
+def select(cases, patterns):
+    if not patterns:
+        return list(cases)
+    return [c for c in cases if any(fnmatch.fnmatch(c.name, p) for p in patterns)]
+
+
+def run(patterns=None, repeat=3, scale=1.0, corpus_dir=None, trace=True, log=print):
+    """Benchmark the selected cases; returns the results document."""
+    repeat = max(1, repeat)
+    workdir = tempfile.mkdtemp(prefix='allfilechanger-bench-')
+    configure(workdir)
+    from benchmarks import corpus as corpus_mod, cases as cases_mod
+    log(f'Building corpus (scale {scale:g}) …')
+    corpus = corpus_mod.build(scale, corpus_dir)
+
+    from app import app
+    client = app.test_client()
+    hwm = _reset_peak()
+
+    results, skipped = {}, {}
+    try:
+        for case in select(cases_mod.CASES, patterns):
+            missing = cases_mod.missing(case)
+            if missing:
+                skipped[case.name] = 'missing ' + ', '.join(missing)
+                log(f'  skip  {case.name:45s} ({skipped[case.name]})')
+                continue
+
+            fields = case.fields(corpus)
+            input_bytes = sum(f[0].getbuffer().nbytes for v in fields.values()
+                              for f in (v if isinstance(v, list) else [v]) if isinstance(f, tuple))
+            rss_before = _rss()
+            status, _ = _call(client, case, fields)                   # warm-up
+            walls, cpus, peaks = [], [], []
+            for _ in range(repeat):
+                fields = case.fields(corpus)
+                _reset_peak()
+                base = _rss()
+                t0, c0 = time.perf_counter(), _cpu()
+                status, out_bytes = _call(client, case, fields)
+                walls.append(time.perf_counter() - t0)
+                cpus.append(_cpu() - c0)
+                peaks.append(max(0, _peak_rss() - base))
+            result = {
+                'status': status,
+                'wall_s': round(statistics.median(walls), 4),
+                'wall_s_all': [round(w, 4) for w in walls],
+                'cpu_s': round(statistics.median(cpus), 4),
+                'peak_rss_mb': round(max(peaks) / _MB, 2) if hwm else None,
+                'retained_rss_mb': round((_rss() - rss_before) / _MB, 2),
+                'input_bytes': input_bytes,
+                'output_bytes': out_bytes,
+            }
+            if trace:
+                fields = case.fields(corpus)
+                tracemalloc.start()
+                try:
+                    _call(client, case, fields)
+                    result['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / _MB, 2)
+                finally:
+                    tracemalloc.stop()
+            results[case.name] = result
+            log(f'  {status}   {case.name:45s} {result["wall_s"]:8.3f}s  cpu {result["cpu_s"]:7.3f}s'
+                f'  peak {result["peak_rss_mb"] or 0:7.1f} MB  out {out_bytes / 1024:9.1f} KB')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'scale': scale,
+            'repeat': repeat,
+            'peak_rss_source': 'VmHWM' if hwm else 'unavailable',
+        },
+        'cases': results,
+        'skipped': skipped,
+    }
+
+
+def save(doc, path):
+    with open(path, 'w') as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
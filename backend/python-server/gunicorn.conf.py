@@ -0,0 +1,34 @@
+"""Gunicorn settings – loaded automatically from the working directory.
+
+Keeps the multiprocess metrics directory and the memory governor's
+machine-wide ledger consistent across workers and, with ``--preload``,
+imports the converter libraries in the master so the workers share them
+copy-on-write.  The command-line flags in the
+Procfile / Dockerfile still set binds and workers.
+"""
+
+from utils import metrics, memory_governor
+
+
+def on_starting(server):
+    metrics.reset_dir()
+    memory_governor.reset()
+    if server.cfg.preload_app:
+        from utils import lazy
+        lazy.preload()
+        memory_governor.tune_gc()   # freeze what was just imported too
+
+
+def post_worker_init(worker):
+    from app import warm_up_worker
+    warm_up_worker()
+
+
+def on_exit(server):
+    from app import cleanup_temp
+    cleanup_temp()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
+    memory_governor.release_pid(worker.pid)
@@ -0,0 +1,257 @@
+"""Data → Excel – stream CSV / NDJSON into XLSX with openpyxl write-only mode.
+
+Rows are parsed from the upload stream and appended one by one; only a
+type-inference sample of ``TO_EXCEL_SAMPLE_ROWS`` rows is ever buffered, so
+memory stays flat for million-row inputs.
+"""
+
+from flask import Blueprint, request, jsonify
+from utils import jobs, file_store, lazy
+from utils.streaming import send_temp_file
+import io, os, csv, json, datetime, tempfile, itertools, logging
+
+openpyxl = lazy.module('openpyxl')
+
+bp = Blueprint('data_to_excel', __name__)
+logger = logging.getLogger(__name__)
+
+_XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+_EXCEL_MAX_ROWS = 1_048_576
+SAMPLE_ROWS = int(os.environ.get('TO_EXCEL_SAMPLE_ROWS', 1000))
+
+_FORMATS = {'csv': 'csv', 'tsv': 'csv', 'txt': 'csv',
+            'ndjson': 'ndjson', 'jsonl': 'ndjson'}
+
+
+# ── Type inference ──────────────────────────────────────────────────────────
+
+def _to_bool(s):
+    low = s.lower()
+    if low in ('true', 'false'):
+        return low == 'true'
+    raise ValueError(s)
+
+
+def _check_leading_zero(s):
+    # Leading zeros (ZIP codes, IDs) must stay text
+    digits = s.lstrip('+-')
+    if len(digits) > 1 and digits[0] == '0' and digits[1].isdigit():
+        raise ValueError(s)
+
+
+def _to_int(s):
+    _check_leading_zero(s)
+    return int(s)
+
+
+def _to_float(s):
+    _check_leading_zero(s)
+    return float(s)
+
+
+def _to_datetime(s):
+    if len(s) == 10:
+        return datetime.date.fromisoformat(s)
+    dt = datetime.datetime.fromisoformat(s)
+    if dt.tzinfo is not None:
+        # Excel has no time zones: store the instant as naive UTC
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+# Most specific first; a column gets the first parser every sampled value accepts
+_PARSERS = (_to_bool, _to_int, _to_float, _to_datetime)
+
+
+def _infer(sample, width):
+    """One parser (or ``None`` = text) per column, chosen from the sample rows."""
+    types = []
+    for col in range(width):
+        values = [row[col] for row in sample
+                  if col < len(row) and isinstance(row[col], str) and row[col] != '']
+        chosen = None
+        for parse in _PARSERS if values else ():
+            try:
+                for v in values:
+                    parse(v)
+            except (ValueError, OverflowError):
+                continue
+            chosen = parse
+            break
+        types.append(chosen)
+    return types
+
+
+def _typed(row, types):
+    out = []
+    for i, v in enumerate(row):
+        if isinstance(v, str):
+            if v == '':
+                v = None
+            elif i < len(types) and types[i] is not None:
+                try:
+                    v = types[i](v)
+                except (ValueError, OverflowError):
+                    pass  # outlier outside the sample: keep the text as-is
+        elif isinstance(v, (dict, list)):
+            v = json.dumps(v, ensure_ascii=False)
+        out.append(v)
+    return out
+
+
+# ── Readers: yield the header, then data rows ───────────────────────────────
+
+def _csv_rows(text, delimiter=None):
+    lines = iter(text)
+    if not delimiter:
+        # Sniff on whole lines from the head, then replay them to the reader
+        head, size = [], 0
+        for line in lines:
+            head.append(line)
+            size += len(line)
+            if size >= 64 * 1024:
+                break
+        try:
+            delimiter = csv.Sniffer().sniff(''.join(head), delimiters=',;\t|').delimiter
+        except csv.Error:
+            delimiter = ','
+        lines = itertools.chain(head, lines)
+    yield from csv.reader(lines, delimiter=delimiter)
+
+
+class _NewKeys(Exception):
+    """A record past the sample has a key the header does not."""
+
+
+def _records(text):
+    for n, line in enumerate(text, 1):
+        if line.strip():
+            rec = json.loads(line)
+            if not isinstance(rec, dict):
+                raise ValueError(f'Line {n} is not a JSON object')
+            yield rec
+
+
+def _ndjson_keys(text):
+    """Every key of every record, in order of first appearance."""
+    keys = {}
+    for rec in _records(text):
+        keys.update(dict.fromkeys(rec))
+    return list(keys)
+
+
+def _ndjson_rows(text, keys=None):
+    """Header from *keys*, or from the first ``SAMPLE_ROWS`` records.
+
+    In the second case a later record with a new key raises ``_NewKeys``
+    so the caller can start again with the full key set.
+    """
+    records = _records(text)
+    if keys is None:
+        first = list(itertools.islice(records, SAMPLE_ROWS))
+        keys = list(dict.fromkeys(k for rec in first for k in rec))
+        records = itertools.chain(first, records)
+        known = set(keys)
+    else:
+        known = None
+    yield keys
+    for rec in records:
+        if known is not None and not known.issuperset(rec):
+            raise _NewKeys()
+        yield [rec.get(k) for k in keys]
+
+
+# ── Writer ──────────────────────────────────────────────────────────────────
+
+def _write_xlsx(text, xlsx_path, fmt, delimiter=None):
+    if fmt != 'ndjson':
+        return _write_rows(_csv_rows(text, delimiter), xlsx_path)
+    try:
+        return _write_rows(_ndjson_rows(text), xlsx_path)
+    except _NewKeys:
+        # Keys first seen after the sample: read once more to collect them all
+        text.seek(0)
+        keys = _ndjson_keys(text)
+        text.seek(0)
+        return _write_rows(_ndjson_rows(text, keys), xlsx_path)
+
+
+def _discard(wb):
+    """Close an unsaved write-only workbook and remove its sheets' temp files."""
+    for ws in wb.worksheets:
+        try:
+            ws.close()
+            ws._writer.cleanup()
+        except Exception:
+            pass
+
+
+def _write_rows(rows, xlsx_path):
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('Input is empty')
+    sample = list(itertools.islice(rows, SAMPLE_ROWS))
+    types = _infer(sample, max([len(header)] + [len(r) for r in sample]))
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws, written, sheet_no = None, _EXCEL_MAX_ROWS, 0
+    try:
+        for row in itertools.chain(sample, rows):
+            if written >= _EXCEL_MAX_ROWS:
+                # Excel's row limit: continue on a new sheet with the header repeated
+                sheet_no += 1
+                ws = wb.create_sheet(f'Sheet{sheet_no}')
+                ws.append(header)
+                written = 1
+            ws.append(_typed(row, types))
+            written += 1
+    except BaseException:
+        _discard(wb)
+        raise
+    if ws is None:
+        wb.create_sheet('Sheet1').append(header)
+    wb.save(xlsx_path)
+    return xlsx_path
+
+
+def _convert(in_path, xlsx_path, fmt, delimiter=None):
+    """Convert a CSV / NDJSON file; top-level so the async job pool can call it."""
+    with open(in_path, encoding='utf-8-sig', newline='') as text:
+        return _write_xlsx(text, xlsx_path, fmt, delimiter)
+
+
+@bp.route('/to-excel', methods=['POST'])
+@file_store.accepts_file_ids('file')
+def data_to_excel():
+    xlsx_path = None
+    try:
+        if 'file' not in request.files:
+            return jsonify(error='No file provided'), 400
+
+        f = request.files['file']
+        ext = f.filename.rsplit('.', 1)[-1].lower() if '.' in f.filename else ''
+        fmt = _FORMATS.get(request.form.get('format', '').lower() or ext)
+        if fmt is None:
+            return jsonify(error='Unsupported input format (use CSV or NDJSON)'), 400
+        delimiter = request.form.get('delimiter') or ('\t' if ext == 'tsv' else None)
+
+        if jobs.wants_async():
+            return jobs.start('data_to_excel', f.save, _convert, _XLSX_MIME, 'converted.xlsx',
+                              'input.' + fmt, 'converted.xlsx', fmt, delimiter)
+
+        fd, xlsx_path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        text = io.TextIOWrapper(f.stream, encoding='utf-8-sig', newline='')
+        try:
+            _write_xlsx(text, xlsx_path, fmt, delimiter)
+        except (ValueError, csv.Error) as e:
+            return jsonify(error='Could not parse input', details=str(e)), 400
+
+        path, xlsx_path = xlsx_path, None   # removed once the response is sent
+        return send_temp_file(path, _XLSX_MIME, 'converted.xlsx')
+    except Exception as e:
+        logger.exception('Data→Excel failed')
+        return jsonify(error='Failed to convert to Excel', details=str(e)), 500
+    finally:
+        if xlsx_path and os.path.exists(xlsx_path):
+            os.unlink(xlsx_path)
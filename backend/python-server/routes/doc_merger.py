@@ -1,17 +1,19 @@
 """Document Merger – merge multiple PDFs or DOCX files."""
 
 from flask import Blueprint, request, send_file, jsonify
-from PyPDF2 import PdfMerger
-from docx import Document
-from docxcompose.composer import Composer
-import io, gc
+from routes.pdf_merge import merge_uploads
+from utils import page_ranges, file_store, lazy, spool
+from utils.streaming import send_temp_file
+import io
+
+docx = lazy.module('docx')
+docx_composer = lazy.module('docxcompose.composer')
 
 bp = Blueprint('doc_merger', __name__)
 
 @bp.route('/merge', methods=['POST'])
+@file_store.accepts_file_ids('files')
 def merge_documents():
-    input_buffers = []
-    merger = None
     try:
         if 'files' not in request.files:
             return jsonify(error='No files provided'), 400
@@ -23,28 +25,18 @@ def merge_documents():
             return jsonify(error='At least 2 files required'), 400
 
         if ftype == 'pdf':
-            merger = PdfMerger()
-            for f in files:
-                buf = io.BytesIO(f.read())
-                input_buffers.append(buf)
-                merger.append(buf)
-            out = io.BytesIO()
-            merger.write(out)
-            merger.close()
-            merger = None
-            # MEMORY MANAGEMENT: close input buffers
-            for buf in input_buffers:
-                buf.close()
-            input_buffers.clear()
-            out.seek(0)
-            return send_file(out, mimetype='application/pdf',
-                             as_attachment=True, download_name='merged.pdf')
+            # Same disk-spooled engine as /api/pdf/merge, including ``ranges``
+            try:
+                out_path = merge_uploads(files, request.form.getlist('ranges'))
+            except page_ranges.PageRangeError as e:
+                return jsonify(error=str(e)), 400
+            return send_temp_file(out_path, 'application/pdf', 'merged.pdf')
 
         elif ftype == 'docx':
-            master = Document(io.BytesIO(files[0].read()))
-            composer = Composer(master)
+            master = docx.Document(spool.open_input(files[0]))
+            composer = docx_composer.Composer(master)
             for f in files[1:]:
-                composer.append(Document(io.BytesIO(f.read())))
+                composer.append(docx.Document(spool.open_input(f)))
             out = io.BytesIO()
             composer.save(out)
             del composer, master  # MEMORY MANAGEMENT: free documents
@@ -56,11 +48,3 @@ def merge_documents():
         return jsonify(error='Unsupported file type'), 400
     except Exception as e:
         return jsonify(error='Failed to merge documents', details=str(e)), 500
-    finally:
-        if merger:
-            try: merger.close()
-            except: pass
-        for buf in input_buffers:
-            try: buf.close()
-            except: pass
-        gc.collect()
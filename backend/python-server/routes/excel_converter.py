@@ -1,39 +1,224 @@
-"""Excel Converter – convert XLSX to CSV / JSON / HTML."""
+"""Excel Converter – convert XLSX to CSV / NDJSON / JSON / HTML / Parquet / Feather.
+
+CSV and NDJSON are streamed row by row from openpyxl's read-only reader,
+so memory does not grow with the number of rows.  The other formats go
+through a typed pandas DataFrame; Parquet and Feather need ``pyarrow``.
+"""
 
 from flask import Blueprint, request, send_file, jsonify
-import pandas as pd
-import io, gc
+from utils import file_store, lazy, spool
+from utils.streaming import zip_stream, stream_response
+import io, csv, json, datetime
+
+pd = lazy.module('pandas')
+openpyxl = lazy.module('openpyxl')
 
 bp = Blueprint('excel_converter', __name__)
 
+_CHUNK_BYTES = 64 * 1024
+_STREAMED = {'csv': ('text/csv', 'csv'), 'ndjson': ('application/x-ndjson', 'ndjson')}
+_COLUMNAR = {
+    'parquet': ('application/vnd.apache.parquet', 'converted.parquet'),
+    'feather': ('application/vnd.apache.arrow.file', 'converted.feather'),
+}
+_INFER_MODES = ('auto', 'none', 'string')
+
+
+def _select_sheets(wb, sheet):
+    """Worksheets for a ``sheet=`` value: a name, a 1-based index, ``*`` or nothing (first)."""
+    if sheet in (None, ''):
+        return wb.worksheets[:1]
+    if sheet == '*':
+        return wb.worksheets
+    if sheet in wb.sheetnames:
+        return [wb[sheet]]
+    if sheet.isdigit() and 1 <= int(sheet) <= len(wb.worksheets):
+        return [wb.worksheets[int(sheet) - 1]]
+    raise KeyError(f'Sheet "{sheet}" not found')
+
+
+def _rows(ws):
+    # Sheet dimensions in the file can be stale; reset them so no rows are lost
+    ws.reset_dimensions()
+    for row in ws.iter_rows(values_only=True):
+        if any(v is not None for v in row):
+            yield row
+
+
+def _cell(v):
+    # Same rendering pandas used: midnight datetimes as plain dates
+    if isinstance(v, datetime.datetime):
+        return v.date().isoformat() if v.time() == datetime.time() else v.isoformat(sep=' ')
+    if isinstance(v, (datetime.date, datetime.time)):
+        return v.isoformat()
+    return v
+
+
+def _csv_chunks(ws):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    for row in _rows(ws):
+        writer.writerow(['' if v is None else _cell(v) for v in row])
+        if buf.tell() >= _CHUNK_BYTES:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(ws):
+    rows = _rows(ws)
+    header = next(rows, None)
+    if header is None:
+        return
+    keys = [str(h) if h is not None else f'Unnamed: {i}' for i, h in enumerate(header)]
+    parts, size = [], 0
+    for row in rows:
+        # Trailing blank header cells are not stored, so rows can be wider
+        keys.extend(f'Unnamed: {i}' for i in range(len(keys), len(row)))
+        line = json.dumps({k: _cell(v) for k, v in zip(keys, row)},
+                          ensure_ascii=False, default=str) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= _CHUNK_BYTES:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    if parts:
+        yield ''.join(parts).encode('utf-8')
+
+
+def _stream_sheets(wb, sheets, fmt):
+    """ZIP entries ``(name, chunks)`` – one member per sheet; closes *wb* when done."""
+    render = _csv_chunks if fmt == 'csv' else _ndjson_chunks
+    ext = _STREAMED[fmt][1]
+    try:
+        for ws in sheets:
+            yield f'{ws.title}.{ext}', render(ws)
+    finally:
+        wb.close()
+
+
+def _stream_sheet(wb, ws, fmt):
+    render = _csv_chunks if fmt == 'csv' else _ndjson_chunks
+    try:
+        yield from render(ws)
+    finally:
+        wb.close()  # MEMORY MANAGEMENT: read-only workbooks keep the archive open
+
+
+# ── Typed (DataFrame) formats ──────────────────────────────────────────────
+
+def _typed_frame(df, infer, dtypes):
+    """Apply the ``infer=`` mode and explicit ``dtypes`` overrides to *df*.
+
+    ``auto`` picks the narrowest nullable dtype per column, ``none`` keeps
+    what pandas read, ``string`` makes every column text.  Columns still of
+    mixed object type are stored as strings so Arrow can type them.
+    """
+    if infer == 'auto':
+        df = df.convert_dtypes()
+    elif infer == 'string':
+        df = df.astype('string')
+    if dtypes:
+        missing = [c for c in dtypes if c not in df.columns]
+        if missing:
+            raise ValueError(f'Unknown column(s) in dtypes: {", ".join(missing)}')
+        df = df.astype(dtypes)
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype('string')
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+def _compression(pa):
+    """Best codec this pyarrow build supports."""
+    for codec in ('zstd', 'lz4', 'snappy'):
+        if pa.Codec.is_available(codec):
+            return codec
+    return None
+
+
+def _json_columns(df):
+    """Compact column-oriented JSON: a schema plus one value array per column."""
+    schema = json.dumps([{'name': c, 'type': str(t)} for c, t in df.dtypes.items()],
+                        separators=(',', ':'))
+    cols = ','.join(json.dumps(c) + ':' + df[c].to_json(orient='values', date_format='iso')
+                    for c in df.columns)
+    return f'{{"schema":{schema},"columns":{{{cols}}}}}'
+
+
 @bp.route('/excel-convert', methods=['POST'])
+@file_store.accepts_file_ids('file')
 def convert_excel():
     try:
         if 'file' not in request.files:
             return jsonify(error='No file provided'), 400
 
         fmt = request.form.get('format', 'csv')
-        raw = request.files['file'].read()
-        df = pd.read_excel(io.BytesIO(raw))
-        del raw  # MEMORY MANAGEMENT: free raw bytes
+        sheet = request.form.get('sheet') or request.args.get('sheet')
+
+        if fmt in _STREAMED:
+            wb = openpyxl.load_workbook(spool.open_input(request.files['file']), read_only=True, data_only=True)
+            try:
+                sheets = _select_sheets(wb, sheet)
+            except KeyError as e:
+                wb.close()
+                return jsonify(error=e.args[0]), 400
+            mime, ext = _STREAMED[fmt]
+            if sheet == '*':
+                return stream_response(zip_stream(_stream_sheets(wb, sheets, fmt)),
+                                       'application/zip', 'converted.zip')
+            return stream_response(_stream_sheet(wb, sheets[0], fmt), mime, f'converted.{ext}')
+
+        if fmt not in ('json', 'html', 'json-columns') and fmt not in _COLUMNAR:
+            return jsonify(error='Unsupported format'), 400
+        if sheet == '*':
+            return jsonify(error='sheet=* is only supported for csv and ndjson'), 400
+
+        infer = request.form.get('infer', 'auto')
+        if infer not in _INFER_MODES:
+            return jsonify(error=f'infer must be one of {", ".join(_INFER_MODES)}'), 400
+        try:
+            dtypes = json.loads(request.form['dtypes']) if request.form.get('dtypes') else None
+        except ValueError:
+            return jsonify(error='dtypes must be a JSON object of column -> dtype'), 400
+
+        pa = None
+        if fmt in _COLUMNAR:
+            try:
+                import pyarrow as pa
+            except ImportError:
+                return jsonify(error=f'{fmt} output requires pyarrow, which is not installed'), 503
+
+        sheet_name = int(sheet) - 1 if sheet and sheet.isdigit() else (sheet or 0)
+        df = pd.read_excel(spool.open_input(request.files['file']), sheet_name=sheet_name)
         out = io.BytesIO()
 
-        if fmt == 'csv':
-            df.to_csv(out, index=False)
-            mime, name = 'text/csv', 'converted.csv'
-        elif fmt == 'json':
+        if fmt == 'json':
             out.write(df.to_json(orient='records', indent=2).encode('utf-8'))
             mime, name = 'application/json', 'converted.json'
         elif fmt == 'html':
             out.write(df.to_html(index=False).encode('utf-8'))
             mime, name = 'text/html', 'converted.html'
         else:
-            return jsonify(error='Unsupported format'), 400
+            try:
+                df = _typed_frame(df, infer, dtypes)
+            except (TypeError, ValueError) as e:
+                return jsonify(error='Could not apply column types', details=str(e)), 400
+            if fmt == 'json-columns':
+                out.write(_json_columns(df).encode('utf-8'))
+                mime, name = 'application/json', 'converted.json'
+            else:
+                codec = _compression(pa)
+                if fmt == 'parquet':
+                    df.to_parquet(out, engine='pyarrow', index=False, compression=codec)
+                else:
+                    df.to_feather(out, compression=codec or 'uncompressed')
+                mime, name = _COLUMNAR[fmt]
 
         del df  # MEMORY MANAGEMENT: free DataFrame
         out.seek(0)
         return send_file(out, mimetype=mime, as_attachment=True, download_name=name)
     except Exception as e:
         return jsonify(error='Failed to convert Excel file', details=str(e)), 500
-    finally:
-        gc.collect()
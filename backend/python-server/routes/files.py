@@ -0,0 +1,42 @@
+"""File store – upload once, then pass ``file_id`` to any route."""
+
+from flask import Blueprint, request, send_file, jsonify
+from utils import file_store
+
+bp = Blueprint('files', __name__)
+
+@bp.route('/files', methods=['POST'])
+def upload_file():
+    if 'file' not in request.files:
+        return jsonify(error='No file provided'), 400
+    try:
+        meta = file_store.put_file(request.files['file'])
+    except file_store.FileStoreError as e:
+        return jsonify(error=str(e)), e.status
+    return jsonify(meta), 201
+
+@bp.route('/files/<file_id>', methods=['GET'])
+def file_info(file_id):
+    try:
+        _, meta = file_store.get(file_id)
+    except file_store.FileStoreError as e:
+        return jsonify(error=str(e)), e.status
+    return jsonify(meta)
+
+@bp.route('/files/<file_id>/content', methods=['GET'])
+def file_content(file_id):
+    try:
+        path, meta = file_store.get(file_id)
+    except file_store.FileStoreError as e:
+        return jsonify(error=str(e)), e.status
+    return send_file(path, mimetype=meta['mimetype'], as_attachment=True,
+                     download_name=meta['name'])
+
+@bp.route('/files/<file_id>', methods=['DELETE'])
+def delete_file(file_id):
+    try:
+        file_store.get(file_id)
+    except file_store.FileStoreError as e:
+        return jsonify(error=str(e)), e.status
+    file_store.delete(file_id)
+    return '', 204
@@ -1,7 +1,9 @@
 """Format Converter – generic document conversion via LibreOffice."""
 
-from flask import Blueprint, request, send_file, jsonify
-import io, os, tempfile, subprocess, shutil, logging, gc
+from flask import Blueprint, request, jsonify
+from utils import libreoffice, result_cache, jobs, file_store
+from utils.streaming import send_temp_file, send_cached_file
+import os, tempfile, shutil, logging
 
 bp = Blueprint('format_converter', __name__)
 logger = logging.getLogger(__name__)
@@ -15,6 +17,7 @@ _MIME = {
 }
 
 @bp.route('/format-convert', methods=['POST'])
+@file_store.accepts_file_ids('file')
 def convert_format():
     temp_dir = None
     try:
@@ -27,27 +30,26 @@ def convert_format():
             return jsonify(error='Target format not specified'), 400
 
         src_ext = f.filename.rsplit('.', 1)[-1].lower() if '.' in f.filename else ''
+        mime = _MIME.get(target, 'application/octet-stream')
+        if jobs.wants_async():
+            return jobs.start('format_convert', f.save, libreoffice.convert_job, mime,
+                              f'converted.{target}', f'input.{src_ext}', f'converted.{target}', target)
+
         temp_dir = tempfile.mkdtemp()
         in_path = os.path.join(temp_dir, f'input.{src_ext}')
         f.save(in_path)
 
-        subprocess.run(
-            ['libreoffice', '--headless', '--convert-to', target, '--outdir', temp_dir, in_path],
-            capture_output=True, timeout=120, check=True
-        )
-
-        out_path = os.path.join(temp_dir, f'input.{target}')
-        if not os.path.exists(out_path):
-            return jsonify(error='Conversion produced no output'), 500
+        cache_key = result_cache.key_for('format_convert', in_path, src=src_ext, target=target)
+        cached = result_cache.get(cache_key)
+        if cached:
+            return send_cached_file(cached, mime, f'converted.{target}')
 
-        with open(out_path, 'rb') as fp:
-            out = io.BytesIO(fp.read())
-        out.seek(0)
+        out_path = libreoffice.convert(in_path, target)
+        result_cache.put(cache_key, out_path)
 
-        return send_file(out,
-                         mimetype=_MIME.get(target, 'application/octet-stream'),
-                         as_attachment=True, download_name=f'converted.{target}')
-    except subprocess.TimeoutExpired:
+        # Unlinked once opened, so removing temp_dir below does not cut the response short
+        return send_temp_file(out_path, mime, f'converted.{target}')
+    except libreoffice.ConversionTimeout:
         return jsonify(error='Conversion timed out'), 504
     except Exception as e:
         logger.exception('Format conversion failed')
@@ -55,4 +57,3 @@ def convert_format():
     finally:
         if temp_dir and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
-        gc.collect()
@@ -1,9 +1,13 @@
 """Image → PDF conversion – returns the PDF directly in the response."""
 
 from flask import Blueprint, request, send_file, jsonify
-import img2pdf, io, os, gc, logging
+from concurrent.futures import ThreadPoolExecutor
+from utils import pools, file_store, lazy, spool
+import io, os, logging, threading
 from PIL import Image
 
+img2pdf = lazy.module('img2pdf')
+
 bp = Blueprint('img_to_pdf', __name__)
 logger = logging.getLogger(__name__)
 
@@ -11,12 +15,67 @@ logger = logging.getLogger(__name__)
 _MAX_IMAGES = 20   # reduced from 200
 _MAX_SIZE = 10 * 1024 * 1024  # 10 MB per image (reduced from 20 MB)
 _ALLOWED_EXT = {'jpg','jpeg','png','gif','bmp','webp','tiff','tif','heic','heif','ico','svg'}
+_MAX_DIM = 3000
+
+# MEMORY MANAGEMENT: decode on a few threads, but never hold more decoded
+# pixels than the budget allows at once (cost = width × height × 4 bytes).
+_WORKERS = min(4, pools.cpu_count())
+_MEMORY_BUDGET = int(float(os.environ.get('IMG_TO_PDF_MEMORY_MB', 192)) * 1024 * 1024)
+
+
+class _Budget:
+    """Counting semaphore over bytes; a single oversized request still runs alone."""
+
+    def __init__(self, total):
+        self.total = self.free = total
+        self._cond = threading.Condition()
+
+    def acquire(self, n):
+        n = min(n, self.total)
+        with self._cond:
+            self._cond.wait_for(lambda: self.free >= n)
+            self.free -= n
+        return n
+
+    def release(self, n):
+        with self._cond:
+            self.free += n
+            self._cond.notify_all()
+
 
-def _process(image_bytes, filename):
-    """Convert any image to RGB JPEG bytes for img2pdf."""
+def _passthrough(img, src):
+    """True if img2pdf can embed the upload's bytes untouched (no decode, no re-encode)."""
+    if max(img.size) > _MAX_DIM or img.mode not in ('RGB', 'L'):
+        return False
+    if img.format == 'JPEG':
+        # Baseline only; progressive/MPO and CMYK go through the slow path
+        return not img.info.get('progressive') and not img.info.get('progression')
+    if img.format == 'PNG':
+        # img2pdf copies IDAT directly for non-interlaced PNGs without transparency
+        return src.getbuffer()[28] == 0 and 'transparency' not in img.info
+    return False
+
+
+def _process(src, filename, budget=None):
+    """Return bytes img2pdf can embed: the original JPEG/PNG if compatible, else RGB JPEG.
+
+    *src* is the seekable upload; it is decoded in place and only copied
+    when its bytes are embedded unchanged.
+    """
     img = None
+    reserved = 0
     try:
-        img = Image.open(io.BytesIO(image_bytes))
+        img = Image.open(src)   # reads the header only
+        if _passthrough(img, src):
+            return src.getvalue(), None
+
+        if img.format == 'JPEG' and max(img.size) > _MAX_DIM:
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale straight away
+            r = _MAX_DIM / max(img.size)
+            img.draft('RGB', (int(img.size[0]*r), int(img.size[1]*r)))
+
+        if budget:
+            reserved = budget.acquire(img.size[0] * img.size[1] * 4)
         if img.mode not in ('RGB', 'L'):
             if img.mode == 'RGBA':
                 bg = Image.new('RGB', img.size, (255, 255, 255))
@@ -27,8 +86,8 @@ def _process(image_bytes, filename):
                 new_img = img.convert('RGB')
                 img.close()  # MEMORY MANAGEMENT: close original
                 img = new_img
-        if max(img.size) > 3000:
-            r = 3000 / max(img.size)
+        if max(img.size) > _MAX_DIM:
+            r = _MAX_DIM / max(img.size)
             new_img = img.resize((int(img.size[0]*r), int(img.size[1]*r)), Image.Resampling.BILINEAR)
             img.close()
             img = new_img
@@ -43,10 +102,13 @@ def _process(image_bytes, filename):
         if img:
             try: img.close()
             except: pass
+        if reserved:
+            budget.release(reserved)
 
 # ── Routes ──────────────────────────────────────────────────────────────────
 
 @bp.route('/image-to-pdf', methods=['POST'])
+@file_store.accepts_file_ids('images')
 def image_to_pdf():
     if 'images' not in request.files:
         return jsonify(error='No images uploaded'), 400
@@ -57,22 +119,27 @@ def image_to_pdf():
     if len(files) > _MAX_IMAGES:
         return jsonify(error=f'Maximum {_MAX_IMAGES} images allowed'), 400
 
-    # MEMORY MANAGEMENT: Process images sequentially instead of using ThreadPoolExecutor
-    # This uses less peak RAM since only 1 image is in memory at a time
+    # MEMORY MANAGEMENT: bounded thread pool; the byte budget caps how many
+    # decoded images are alive at once.  Results keep upload order.
+    budget = _Budget(_MEMORY_BUDGET)
+
+    def work(item):
+        src, filename = item
+        return _process(src, filename, budget)
+
+    # Opened here, in the request thread, so teardown can close the mappings
+    inputs = [(spool.open_input(f), f.filename) for f in files if f.filename]
     images_bytes = []
     try:
-        for f in files:
-            if not f.filename:
-                continue
-            raw = f.read()
-            data, err = _process(raw, f.filename)
-            del raw  # MEMORY MANAGEMENT: free raw bytes immediately
-            if err:
-                del images_bytes
-                gc.collect()
-                return jsonify(error=f'Image processing failed: {err}'), 400
-            if data:
-                images_bytes.append(data)
+        with ThreadPoolExecutor(max_workers=_WORKERS) as ex:
+            results = ex.map(work, inputs)
+            for data, err in results:
+                if err:
+                    ex.shutdown(cancel_futures=True)
+                    del images_bytes
+                    return jsonify(error=f'Image processing failed: {err}'), 400
+                if data:
+                    images_bytes.append(data)
 
         if not images_bytes:
             return jsonify(error='No valid images after processing'), 400
@@ -82,7 +149,6 @@ def image_to_pdf():
 
         # MEMORY MANAGEMENT: free all image bytes before sending
         del images_bytes
-        gc.collect()
 
         logger.info(f'Converted {count} images to PDF ({len(pdf_bytes)} bytes)')
 
@@ -92,5 +158,3 @@ def image_to_pdf():
                          as_attachment=True, download_name='converted.pdf')
     except Exception as e:
         return jsonify(error='Failed to convert images to PDF', details=str(e)), 500
-    finally:
-        gc.collect()
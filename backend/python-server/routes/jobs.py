@@ -0,0 +1,38 @@
+"""Async job status & result download for routes called with ``async=1``."""
+
+from flask import Blueprint, send_file, jsonify
+from utils import jobs
+
+bp = Blueprint('jobs', __name__)
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify(error='Job not found'), 404
+    body = {
+        'job_id': job['id'],
+        'operation': job['op'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'created': job['created'],
+        'updated': job['updated'],
+    }
+    if job['status'] == 'failed':
+        body['error'] = job['error']
+    return jsonify(body)
+
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify(error='Job not found'), 404
+    if job['status'] == 'failed':
+        return jsonify(error='Job failed', details=job['error']), 500
+    if job['status'] != 'done':
+        resp = jsonify(error='Job not finished', status=job['status'], progress=job['progress'])
+        resp.status_code = 409
+        resp.headers['Retry-After'] = '5'
+        return resp
+    return send_file(job['result_path'], mimetype=job['mimetype'] or 'application/octet-stream',
+                     as_attachment=True, download_name=job['download_name'])
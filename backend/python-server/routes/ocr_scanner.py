@@ -1,35 +1,179 @@
-"""OCR Scanner – extract text from images via Tesseract."""
+"""OCR Scanner – extract text from images, multi-page TIFFs and PDFs via Tesseract."""
 
 from flask import Blueprint, request, send_file, jsonify
-import pytesseract
-from PIL import Image
-import io, gc
+from PIL import Image, ImageSequence
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from utils import result_cache, jobs, pools, file_store, metrics, lazy, spool
+from utils.streaming import send_cached_file
+import io, os, json, shutil, tempfile
+
+pytesseract = lazy.module('pytesseract')
+pdf2image = lazy.module('pdf2image')
 
 bp = Blueprint('ocr_scanner', __name__)
 
+# Every page runs in its own tesseract process; the threads here only feed
+# and wait on them.  One OpenMP thread per tesseract keeps N pages on N cores
+# instead of N × cores threads fighting each other.
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+_WORKERS = int(os.environ.get('OCR_WORKERS', pools.cpu_count()))
+
+# MEMORY MANAGEMENT: PDF pages are rasterised this many at a time (one
+# pdftoppm run on as many threads), ~9 MB per grey A4 page at 300 dpi
+_RENDER_WINDOW = max(1, min(_WORKERS, 8))
+_TARGET_DPI = 300
+_MAX_SIDE = 3508            # A4 long side at 300 dpi, used when DPI is unknown
+_UPLOAD_FIELDS = ('image', 'images', 'file')
+
+
+def _pdf_pages(path):
+    total = pdf2image.pdfinfo_from_path(path)['Pages']
+    for first in range(1, total + 1, _RENDER_WINDOW):
+        # Already at the target DPI and in grey; poppler parses the file once per window
+        with metrics.timed('poppler'):
+            images = pdf2image.convert_from_path(path, dpi=_TARGET_DPI, grayscale=True, first_page=first,
+                                                 last_page=min(first + _RENDER_WINDOW - 1, total),
+                                                 thread_count=_RENDER_WINDOW)
+        for image in images:
+            yield image, _TARGET_DPI
+        del images
+
+
+def _pages(src):
+    """Yield ``(PIL image, dpi or None)`` for every page of one upload (a seekable file)."""
+    head = src.read(5)
+    src.seek(0)
+    if head == b'%PDF-':
+        path = getattr(src, 'name', None)
+        if isinstance(path, str) and os.path.isfile(path):
+            yield from _pdf_pages(path)
+            return
+        # pdftoppm needs a path: write the upload out once for all windows
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(src, out)
+            yield from _pdf_pages(path)
+        finally:
+            os.unlink(path)
+        return
+    with Image.open(src) as img:
+        dpi = img.info.get('dpi')
+        for frame in ImageSequence.Iterator(img):   # multi-page TIFF / GIF frames
+            yield frame.copy(), (dpi[0] if dpi else None)
+
+
+def _prepare(img, dpi):
+    """Greyscale + rescale to ~300 DPI-equivalent, which shortens tesseract runs."""
+    if img.mode != 'L':
+        grey = img.convert('L')
+        img.close()
+        img = grey
+    if dpi and dpi >= 50:
+        scale = min(max(_TARGET_DPI / float(dpi), 0.25), 2.0)
+    else:
+        scale = min(1.0, _MAX_SIDE / max(img.size))
+    if abs(scale - 1.0) > 0.1:
+        resized = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+                             Image.Resampling.LANCZOS)
+        img.close()
+        img = resized
+    return img
+
+
+def _ocr_page(img, dpi, lang):
+    img = _prepare(img, dpi)
+    try:
+        with metrics.timed('tesseract'):
+            return pytesseract.image_to_string(img, lang=lang)
+    finally:
+        img.close()  # MEMORY MANAGEMENT: close PIL Image
+
+
+def _ocr_uploads(uploads, lang):
+    """OCR every page of every ``(name, file)`` upload; returns page dicts in order.
+
+    Pages are rendered lazily and at most 2 × workers are in flight, so
+    memory is bounded no matter how many pages a PDF has.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=_WORKERS) as ex:
+        pending = deque()
+        for name, src in uploads:
+            for n, (img, dpi) in enumerate(_pages(src), 1):
+                pending.append((name, n, ex.submit(_ocr_page, img, dpi, lang)))
+                if len(pending) >= 2 * _WORKERS:
+                    src, page, fut = pending.popleft()
+                    results.append({'source': src, 'page': page, 'text': fut.result()})
+        while pending:
+            src, page, fut = pending.popleft()
+            results.append({'source': src, 'page': page, 'text': fut.result()})
+    return results
+
+
+def _render(pages, output):
+    if output == 'json':
+        return json.dumps({'pages': pages}, ensure_ascii=False), 'application/json', 'ocr_result.json'
+    if len(pages) == 1:
+        return pages[0]['text'], 'text/plain', 'ocr_result.txt'
+    multi_source = len({p['source'] for p in pages}) > 1
+    lines = []
+    for i, p in enumerate(pages, 1):
+        label = f'{p["source"]} – page {p["page"]}' if multi_source else f'Page {i}'
+        lines.append(f'--- {label} ---')
+        lines.append(p['text'])
+    return '\n'.join(lines), 'text/plain', 'ocr_result.txt'
+
+
+def _ocr_file(img_path, out_path, lang, output='text'):
+    """Async job entry point: OCR every page of one file into *out_path*."""
+    with open(img_path, 'rb') as src:   # named, so PDFs are rendered in place
+        body, _, _ = _render(_ocr_uploads([(os.path.basename(img_path), src)], lang), output)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(body)
+    return out_path
+
+
 @bp.route('/scan', methods=['POST'])
+@file_store.accepts_file_ids('image')
 def scan_image():
-    img = None
     try:
-        if 'image' not in request.files:
+        files = [f for field in _UPLOAD_FIELDS for f in request.files.getlist(field) if f.filename]
+        if not files:
             return jsonify(error='No image provided'), 400
 
         lang = request.form.get('language', 'eng')
-        raw = request.files['image'].read()
-        img = Image.open(io.BytesIO(raw))
-        del raw  # MEMORY MANAGEMENT: free raw bytes
-        text = pytesseract.image_to_string(img, lang=lang)
-        img.close()  # MEMORY MANAGEMENT: close PIL Image
-        img = None
+        output = request.form.get('output', 'text').lower()
+        if output not in ('text', 'json'):
+            return jsonify(error='Unsupported output format'), 400
+
+        if jobs.wants_async():
+            if len(files) > 1:
+                return jsonify(error='Async OCR accepts one file per job'), 400
+            ext = 'json' if output == 'json' else 'txt'
+            return jobs.start('ocr_scan', files[0].save, _ocr_file,
+                              'application/json' if output == 'json' else 'text/plain',
+                              f'ocr_result.{ext}', 'input.img', f'ocr_result.{ext}', lang, output)
+
+        uploads = [(f.filename, spool.open_input(f)) for f in files]
 
-        out = io.BytesIO(text.encode('utf-8'))
+        cache_key = None
+        if len(uploads) == 1:
+            cache_key = result_cache.key_for('ocr_scan', uploads[0][1].getbuffer(), language=lang, output=output)
+            cached = result_cache.get(cache_key)
+            if cached:
+                _, mime, name = _render([{'source': '', 'page': 1, 'text': ''}], output)
+                return send_cached_file(cached, mime, name)
+
+        pages = _ocr_uploads(uploads, lang)
+        body, mime, name = _render(pages, output)
+        data = body.encode('utf-8')
+        if cache_key:
+            result_cache.put(cache_key, data)
+
+        out = io.BytesIO(data)
         out.seek(0)
-        return send_file(out, mimetype='text/plain',
-                         as_attachment=True, download_name='ocr_result.txt')
+        return send_file(out, mimetype=mime, as_attachment=True, download_name=name)
     except Exception as e:
         return jsonify(error='Failed to perform OCR', details=str(e)), 500
-    finally:
-        if img:
-            try: img.close()
-            except: pass
-        gc.collect()
@@ -1,34 +1,325 @@
 """PDF Compress – multi-level compression with image downsampling & metadata stripping."""
 
 from flask import Blueprint, request, send_file, jsonify
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfReader
+from PyPDF2.generic import IndirectObject, NameObject, NumberObject
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image
-import io, re, gc
+from routes.pdf_split import select_pages
+from utils import result_cache, pools, file_store, spool
+from utils.streaming import send_cached_file
+import io, os, re, threading, logging
 
 bp = Blueprint('pdf_compress', __name__)
+logger = logging.getLogger(__name__)
 
+# Image recompression runs on a process pool once a document has enough
+# unique images to amortise the IPC cost.
+_WORKERS = int(os.environ.get('PDF_COMPRESS_WORKERS', min(4, pools.cpu_count())))
+_PARALLEL_MIN_IMAGES = 4
 
-def _compress_image(image_data, quality, max_dim):
-    """Compress an embedded image: resize + JPEG-recompress."""
+# Image stream keys touched by _patch_image (restored on fallback)
+_IMAGE_KEYS = ('/Filter', '/Length', '/Width', '/Height', '/BitsPerComponent',
+               '/ColorSpace', '/DecodeParms')
+
+
+def _decode_image(image_data):
+    """Decode an embedded image stream to an RGB PIL image (None if undecodable)."""
     try:
         img = Image.open(io.BytesIO(image_data))
         # Convert RGBA / palette to RGB for JPEG output
-        if img.mode in ('RGBA', 'P', 'LA'):
-            img = img.convert('RGB')
-        elif img.mode != 'RGB':
+        if img.mode != 'RGB':
             img = img.convert('RGB')
+        img.load()
+        return img
+    except Exception:
+        return None
 
-        # Down-scale large images
-        w, h = img.size
-        if max(w, h) > max_dim:
-            ratio = max_dim / max(w, h)
-            img = img.resize((int(w * ratio), int(h * ratio)), Image.LANCZOS)
 
-        buf = io.BytesIO()
-        img.save(buf, format='JPEG', quality=quality, optimize=True)
-        return buf.getvalue()
-    except Exception:
+def _encode_image(img, quality, max_dim):
+    """Down-scale to *max_dim* and JPEG-encode → ``(jpeg, w, h)``."""
+    w, h = img.size
+    if max(w, h) > max_dim:
+        ratio = max_dim / max(w, h)
+        img = img.resize((max(1, int(w * ratio)), max(1, int(h * ratio))), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality, optimize=True)
+    return buf.getvalue(), img.width, img.height
+
+
+def _compress_image(image_data, quality, max_dim):
+    """Compress an embedded image: resize + JPEG-recompress → ``(jpeg, w, h)``."""
+    img = _decode_image(image_data)
+    if img is None:
         return None            # leave the image untouched on failure
+    try:
+        return _encode_image(img, quality, max_dim)
+    except Exception:
+        return None
+
+
+def _compress_job(args):
+    return _compress_image(*args)
+
+
+def _collect_images(writer):
+    """Unique image XObjects across all pages, keyed by indirect reference.
+
+    Logos and backgrounds shared by many pages appear once here, so each is
+    recompressed exactly once.
+    """
+    images = {}
+    for page in writer.pages:
+        if '/Resources' not in page or '/XObject' not in page['/Resources']:
+            continue
+        x_objects = page['/Resources']['/XObject'].get_object()
+        for obj_name in x_objects:
+            ref = x_objects[obj_name]
+            x_obj = ref.get_object()
+            # Only process image XObjects
+            if x_obj.get('/Subtype') != '/Image':
+                continue
+            key = (ref.idnum, ref.generation) if isinstance(ref, IndirectObject) else id(x_obj)
+            images.setdefault(key, x_obj)
+    return list(images.values())
+
+
+def _patch_image(x_obj, jpeg, width, height):
+    """Replace an image XObject's stream with a recompressed RGB JPEG."""
+    x_obj._data = jpeg
+    x_obj[NameObject('/Filter')] = NameObject('/DCTDecode')
+    x_obj[NameObject('/Length')] = NumberObject(len(jpeg))
+    x_obj[NameObject('/Width')] = NumberObject(width)
+    x_obj[NameObject('/Height')] = NumberObject(height)
+    x_obj[NameObject('/BitsPerComponent')] = NumberObject(8)
+    x_obj[NameObject('/ColorSpace')] = NameObject('/DeviceRGB')
+    if '/DecodeParms' in x_obj:
+        del x_obj['/DecodeParms']
+
+
+def _snapshot(x_objs):
+    return [(x_obj, x_obj._data, {k: x_obj[k] for k in _IMAGE_KEYS if k in x_obj})
+            for x_obj in x_objs]
+
+
+def _restore(snapshot):
+    """Undo _patch_image on every image, so the fallback needs no second parse."""
+    for x_obj, data, entries in snapshot:
+        x_obj._data = data
+        for k in _IMAGE_KEYS:
+            if k in entries:
+                x_obj[NameObject(k)] = entries[k]
+            elif k in x_obj:
+                del x_obj[k]
+
+
+def _recompress_images(x_objs, quality, max_dim):
+    """Recompress unique image XObjects (in parallel when worthwhile) and patch them back."""
+    tasks = [(x_obj._data, quality, max_dim) for x_obj in x_objs]
+    results = None
+    if _WORKERS > 1 and len(tasks) >= _PARALLEL_MIN_IMAGES:
+        try:
+            pool = pools.process_pool('pdf_compress', _WORKERS)
+            results = list(pool.map(_compress_job, tasks,
+                                    chunksize=max(1, len(tasks) // (_WORKERS * 4))))
+        except BrokenProcessPool:
+            logger.warning('Compression pool broke – recompressing serially')
+            pools.discard('pdf_compress')
+    if results is None:
+        results = [_compress_job(t) for t in tasks]
+    del tasks
+
+    replaced = 0
+    for x_obj, result in zip(x_objs, results):
+        if result and len(result[0]) < len(x_obj._data):
+            _patch_image(x_obj, *result)
+            replaced += 1
+    return replaced
+
+
+class _CountingSink:
+    """Write target that only counts bytes – sizes a document without buffering it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, b):
+        self.size += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.size
+
+
+# Target-size search  ─────────────────────────────────────────────────────
+# One "effort" knob in [0, 1] drives both JPEG quality and the downscale
+# factor, so predicted size falls monotonically and can be bisected.  At
+# effort 0 images keep their size; the _TARGET_MAX_DIM cap is phased in
+# over the first quarter of the range.
+_TARGET_MAX_DIM = 2500
+_TARGET_STEPS = 7
+# MEMORY MANAGEMENT: decoded images kept between search steps; the rest are
+# decoded again for every step instead of all being held at once
+TARGET_DECODE_MB = float(os.environ.get('PDF_COMPRESS_TARGET_MB', 96))
+
+
+def _effort_params(effort):
+    quality = int(round(85 - 70 * effort))             # 85 → 15
+    scale = 1.0 - 0.75 * effort                        # 100 % → 25 %
+    return quality, scale
+
+
+def _native_dim(x_obj):
+    """Longest side of an image XObject as stored (``/Width`` may be an indirect object)."""
+    try:
+        return max(int(x_obj.raw_get(k).get_object()) for k in ('/Width', '/Height'))
+    except (KeyError, TypeError, ValueError):
+        return _TARGET_MAX_DIM
+
+
+def _target_dim(native, effort):
+    cap = native + (min(native, _TARGET_MAX_DIM) - native) * min(1.0, 4 * effort)
+    return max(16, int(cap * _effort_params(effort)[1]))
+
+
+def _decode_scaled(image_data, max_dim=None):
+    """Decode like ``_decode_image`` but no larger than *max_dim* (if given).
+
+    JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale straight away.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        if max_dim is None:
+            max_dim = max(img.size)
+        if img.format == 'JPEG' and max(img.size) > max_dim:
+            r = max_dim / max(img.size)
+            img.draft('RGB', (int(img.size[0] * r), int(img.size[1] * r)))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.load()
+        if max(img.size) > max_dim:
+            r = max_dim / max(img.size)
+            small = img.resize((max(1, int(img.width * r)), max(1, int(img.height * r))), Image.LANCZOS)
+            img.close()
+            img = small
+        return img
+    except Exception:
+        return None
+
+
+class _Decoded:
+    """Decoded images for the target search, kept while they fit in ``TARGET_DECODE_MB``.
+
+    Images past the budget are decoded again at every step, at only the
+    size that step needs, so memory is the budget plus one image per
+    encoding thread, however many pages.
+    """
+
+    def __init__(self, x_objs):
+        self._x_objs = x_objs
+        self._kept = {}
+        self._spilled = set()
+        self._bad = set()
+        self._free = int(TARGET_DECODE_MB * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._x_objs)
+
+    def get(self, i, dim):
+        """``(image, owned)`` for image *i*, at least *dim* wide – the caller closes owned images."""
+        img = self._kept.get(i)
+        if img is not None or i in self._bad:
+            return img, False
+        spilled = i in self._spilled
+        img = _decode_scaled(self._x_objs[i]._data, dim if spilled else None)
+        with self._lock:
+            if img is None:
+                self._bad.add(i)
+                return None, False
+            if spilled:
+                return img, True
+            cost = img.width * img.height * 3
+            if cost <= self._free:
+                self._kept[i] = img
+                self._free -= cost
+                return img, False
+            self._spilled.add(i)
+        return img, True
+
+    def close(self):
+        for img in self._kept.values():
+            img.close()
+        self._kept.clear()
+
+
+def _encode_at(decoded, effort):
+    """Re-encode every image at *effort* (threads: PIL drops the GIL)."""
+    quality, scale = _effort_params(effort)
+    dims = [_target_dim(_native_dim(x), effort) for x in decoded._x_objs]
+
+    def enc(i):
+        img, owned = decoded.get(i, dims[i])
+        if img is None:
+            return None
+        try:
+            return _encode_image(img, quality, dims[i])
+        finally:
+            if owned:
+                img.close()
+
+    with ThreadPoolExecutor(max_workers=_WORKERS) as ex:
+        return list(ex.map(enc, range(len(decoded))))
+
+
+def _compress_to_target(writer, x_objs, target_bytes):
+    """Find the mildest effort whose predicted size fits *target_bytes* and apply it.
+
+    Nothing is re-encoded when the document already fits.  Otherwise
+    images are decoded, within ``TARGET_DECODE_MB`` only once, and every
+    search step re-encodes.  The output size is predicted as (document
+    size without image streams) + (sum of chosen image stream sizes), so
+    the document is serialised just once up front and once at the end.
+    """
+    sink = _CountingSink()
+    writer.write(sink)
+    orig_sizes = [len(x._data) for x in x_objs]
+    base = sink.size - sum(orig_sizes)
+
+    def predict(results):
+        return base + sum(min(len(r[0]), o) if r else o for r, o in zip(results, orig_sizes))
+
+    if base + sum(orig_sizes) <= target_bytes:
+        return base + sum(orig_sizes)   # the lossless rewrite already fits
+
+    decoded = _Decoded(x_objs)
+    try:
+        lo, hi = 0.0, 1.0
+        best = _encode_at(decoded, hi)
+        best_size = predict(best)
+        if best_size <= target_bytes:
+            mildest = _encode_at(decoded, lo)
+            if predict(mildest) <= target_bytes:
+                best, best_size = mildest, predict(mildest)
+                hi = lo
+        if best_size <= target_bytes and hi > lo:
+            for _ in range(_TARGET_STEPS):
+                mid = (lo + hi) / 2
+                results = _encode_at(decoded, mid)
+                size = predict(results)
+                if size <= target_bytes:
+                    hi, best, best_size = mid, results, size
+                else:
+                    lo = mid
+    finally:
+        decoded.close()
+
+    for x_obj, result in zip(x_objs, best):
+        if result and len(result[0]) < len(x_obj._data):
+            _patch_image(x_obj, *result)
+    return best_size
 
 
 # Compression presets  ────────────────────────────────────────────────────
@@ -38,73 +329,150 @@ PRESETS = {
     'high':   {'img_quality': 30, 'max_dim': 1000},   # ~70-90 % reduction
 }
 
+_ESTIMATE_SAMPLES = 8
+
+
+def _sample(x_objs, n):
+    """Pick up to *n* images spread evenly across the size distribution."""
+    ranked = sorted(x_objs, key=lambda x: len(x._data))
+    if len(ranked) <= n:
+        return ranked
+    step = (len(ranked) - 1) / (n - 1)
+    return [ranked[round(i * step)] for i in range(n)]
+
+
+def _estimate(reader, original_size):
+    """Predict per-preset output sizes from a sample of the document's images.
+
+    Non-image bytes are assumed unchanged, which slightly over-estimates the
+    output (content-stream compression usually saves a little more).
+    """
+    x_objs = _collect_images(reader)
+    image_bytes = sum(len(x._data) for x in x_objs)
+    sample = _sample(x_objs, _ESTIMATE_SAMPLES)
+    sample_bytes = sum(len(x._data) for x in sample)
+
+    def sizes_per_preset(data):
+        # Decode once, encode at every preset → {level: new stream size}
+        img = _decode_image(data)
+        if img is None:
+            return {level: len(data) for level in PRESETS}
+        try:
+            return {level: min(len(_encode_image(img, p['img_quality'], p['max_dim'])[0]), len(data))
+                    for level, p in PRESETS.items()}
+        finally:
+            img.close()
+
+    with ThreadPoolExecutor(max_workers=_WORKERS) as ex:
+        sampled = list(ex.map(sizes_per_preset, (x._data for x in sample)))
+
+    estimates = {}
+    for level in PRESETS:
+        ratio = sum(s[level] for s in sampled) / sample_bytes if sample_bytes else 1.0
+        size = min(original_size, int(original_size - image_bytes + image_bytes * ratio))
+        estimates[level] = {
+            'bytes': size,
+            'reduction_pct': round(100 * (1 - size / original_size), 1) if original_size else 0.0,
+        }
+
+    return {
+        'original_size': original_size,
+        'pages': len(reader.pages),
+        'image_count': len(x_objs),
+        'image_bytes': image_bytes,
+        'sampled_images': len(sample),
+        'estimates': estimates,
+    }
+
+
+# ── Transform (shared with /api/pdf/pipeline) ──────────────────────────────
+
+def compress(writer, level='medium', target_bytes=None):
+    """Compress *writer* in place: content streams, metadata, then images.
+
+    With *target_bytes* the image effort is searched to fit that size,
+    otherwise the *level* preset applies.  Returns ``(snapshot, predicted)``:
+    ``_restore(snapshot)`` undoes the image recompression, and *predicted* is
+    the target search's size estimate (``None`` without a target).
+    """
+    # ── 1. Compress content streams ──────────────────────────────────
+    for page in writer.pages:
+        page.compress_content_streams()
+
+    # ── 2. Strip metadata to save a few more KB ──────────────────────
+    writer.add_metadata({
+        '/Producer': 'AllFileChanger',
+        '/Creator': 'AllFileChanger PDF Compressor',
+    })
+
+    # ── 3. Remove unused objects ─────────────────────────────────────
+    try:
+        writer.remove_unreferenced_resources()
+    except Exception:
+        pass
+
+    # ── 4. Compress each unique embedded image once ──────────────────
+    images = _collect_images(writer)
+    snapshot = _snapshot(images)
+    predicted = None
+    if target_bytes:
+        predicted = _compress_to_target(writer, images, target_bytes)
+    else:
+        preset = PRESETS[level]
+        _recompress_images(images, preset['img_quality'], preset['max_dim'])
+    return snapshot, predicted
+
+
+@bp.route('/compress/estimate', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
+def estimate_compression():
+    try:
+        if 'pdf' not in request.files:
+            return jsonify(error='No PDF file provided'), 400
+
+        src = spool.open_input(request.files['pdf'])
+        original_size = src.seek(0, os.SEEK_END)
+        src.seek(0)
+        return jsonify(_estimate(PdfReader(src), original_size))
+    except Exception as e:
+        return jsonify(error='Failed to estimate compression', details=str(e)), 500
+
 
 @bp.route('/compress', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def compress_pdf():
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
 
         level = request.form.get('level', 'medium').lower()
-        preset = PRESETS.get(level, PRESETS['medium'])
+        if level not in PRESETS:
+            level = 'medium'
 
-        raw = request.files['pdf'].read()
-        original_size = len(raw)
-        reader = PdfReader(io.BytesIO(raw))
-        writer = PdfWriter()
+        target_bytes = request.form.get('target_bytes')
+        if target_bytes:
+            try:
+                target_bytes = int(target_bytes)
+            except ValueError:
+                target_bytes = 0
+            if target_bytes <= 0:
+                return jsonify(error='target_bytes must be a positive integer'), 400
 
-        # ── 1. Add pages & compress content streams ──────────────────
-        for page in reader.pages:
-            page.compress_content_streams()
-            writer.add_page(page)
+        src = spool.open_input(request.files['pdf'])
+        original_size = src.seek(0, os.SEEK_END)
+        src.seek(0)
 
-        # ── 2. Compress embedded images across all pages ─────────────
-        for page in writer.pages:
-            if '/Resources' not in page or '/XObject' not in page['/Resources']:
-                continue
-            x_objects = page['/Resources']['/XObject'].get_object()
-            for obj_name in x_objects:
-                x_obj = x_objects[obj_name].get_object()
-                # Only process image XObjects
-                if x_obj.get('/Subtype') != '/Image':
-                    continue
-                try:
-                    w = int(x_obj['/Width'])
-                    h = int(x_obj['/Height'])
-
-                    # Decode image data from the PDF stream
-                    img_data = x_obj._data  # raw decoded stream bytes
-
-                    compressed = _compress_image(
-                        img_data, preset['img_quality'], preset['max_dim']
-                    )
-                    if compressed and len(compressed) < len(img_data):
-                        # Replace the stream with compressed JPEG
-                        x_obj._data = compressed
-                        x_obj['/Filter'] = '/DCTDecode'
-                        x_obj['/Length'] = len(compressed)
-                        # Update dimensions if resized
-                        pil = Image.open(io.BytesIO(compressed))
-                        x_obj['/Width'] = pil.width
-                        x_obj['/Height'] = pil.height
-                        if '/DecodeParms' in x_obj:
-                            del x_obj['/DecodeParms']
-                        if '/ColorSpace' not in x_obj:
-                            x_obj['/ColorSpace'] = '/DeviceRGB'
-                except Exception:
-                    continue  # skip problematic images
-
-        # ── 3. Strip metadata to save a few more KB ──────────────────
-        writer.add_metadata({
-            '/Producer': 'AllFileChanger',
-            '/Creator': 'AllFileChanger PDF Compressor',
-        })
-
-        # ── 4. Remove unused objects & write ─────────────────────────
-        try:
-            writer.remove_unreferenced_resources()
-        except Exception:
-            pass
+        if target_bytes:
+            cache_key = result_cache.key_for('pdf_compress', src.getbuffer(), target_bytes=target_bytes)
+        else:
+            cache_key = result_cache.key_for('pdf_compress', src.getbuffer(), level=level)
+        cached = result_cache.get(cache_key)
+        if cached:
+            return send_cached_file(cached, 'application/pdf', 'compressed.pdf')
+
+        reader = PdfReader(src)
+        writer = select_pages(reader)
+        snapshot, predicted = compress(writer, level, target_bytes)
 
         out = io.BytesIO()
         writer.write(out)
@@ -114,31 +482,28 @@ def compress_pdf():
         # If the "compressed" version ended up larger, just return the
         # original with only stream-compression applied (fallback).
         if compressed_size >= original_size:
-            fallback_writer = PdfWriter()
-            fallback_reader = PdfReader(io.BytesIO(raw))
-            for p in fallback_reader.pages:
-                p.compress_content_streams()
-                fallback_writer.add_page(p)
-            fallback_writer.add_metadata({
-                '/Producer': 'AllFileChanger',
-                '/Creator': 'AllFileChanger PDF Compressor',
-            })
+            _restore(snapshot)
             out2 = io.BytesIO()
-            fallback_writer.write(out2)
+            writer.write(out2)
             if out2.tell() < original_size:
                 out2.seek(0)
                 out = out2
             else:
                 # Even stream-compression didn't help → return original
-                out = io.BytesIO(raw)
+                out = io.BytesIO(src.getvalue())
+        del snapshot
+
+        result_cache.put(cache_key, out.getbuffer())
+        final_size = out.getbuffer().nbytes
 
         # MEMORY MANAGEMENT: free intermediate objects
-        del raw, reader, writer
-        gc.collect()
+        del reader, writer
 
-        return send_file(out, mimetype='application/pdf',
+        resp = send_file(out, mimetype='application/pdf',
                          as_attachment=True, download_name='compressed.pdf')
+        if target_bytes:
+            resp.headers['X-Target-Met'] = 'true' if final_size <= target_bytes else 'false'
+            resp.headers['X-Predicted-Size'] = str(predicted)
+        return resp
     except Exception as e:
         return jsonify(error='Failed to compress PDF', details=str(e)), 500
-    finally:
-        gc.collect()
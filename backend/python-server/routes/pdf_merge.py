@@ -1,15 +1,101 @@
-"""PDF Merge – combine multiple PDFs into one."""
+"""PDF Merge – combine multiple PDFs into one.
 
-from flask import Blueprint, request, send_file, jsonify
-from PyPDF2 import PdfMerger
-import io, gc
+Uploads are spooled to temp files and opened one at a time; only the
+selected pages of each input are parsed and copied into the output, which
+is written to disk and streamed from there.
+"""
+
+from flask import Blueprint, request, jsonify
+from PyPDF2 import PdfReader, PdfWriter
+from utils import page_ranges, file_store
+from utils.streaming import send_temp_file
+import os, json, shutil, tempfile
 
 bp = Blueprint('pdf_merge', __name__)
 
+
+def range_spec(value):
+    """Normalise one ranges value to a ``page_ranges`` spec (``None`` = all pages).
+
+    *value* is either a list (or JSON list) of ``[first, last]`` pairs or
+    single page numbers, e.g. ``[[1,5],[9,12]]``, or a spec like ``1-5,9-12``.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise page_ranges.PageRangeError(f'Invalid ranges value {value}') from None
+    if isinstance(value, list):
+        value = ','.join(f'{r[0]}-{r[-1]}' if isinstance(r, list) else str(r) for r in value)
+    return value or None
+
+
+def parse_ranges(values, count):
+    """Per-input page specs from repeated ``ranges`` fields (see ``range_spec``)."""
+    if not values:
+        return [None] * count
+    if len(values) != count:
+        raise page_ranges.PageRangeError(
+            f'Got {len(values)} ranges values for {count} files (use one per file, empty for all)')
+    return [range_spec(value) for value in values]
+
+
+def spool(files, directory):
+    """Save uploads to *directory* without reading them into memory; returns the paths."""
+    paths = []
+    for i, f in enumerate(files):
+        path = os.path.join(directory, f'{i}.pdf')
+        f.save(path)
+        paths.append(path)
+    return paths
+
+
+# ── Transform (shared with /api/pdf/pipeline) ──────────────────────────────
+
+def append(writer, source, spec=None):
+    """Append pages *spec* (default: all) of the PDF *source* (path or stream) to *writer*."""
+    reader = PdfReader(source)
+    writer.append(reader, pages=page_ranges.parse(spec, len(reader.pages)))
+    return writer
+
+
+def merge_files(paths, out_path, ranges=None):
+    """Merge the PDFs at *paths* (optionally only *ranges* pages of each) into *out_path*.
+
+    Each input is opened lazily and closed as soon as its pages are copied,
+    so only one input file is open at a time and unselected pages are
+    never parsed.
+    """
+    writer = PdfWriter()
+    for path, spec in zip(paths, ranges or [None] * len(paths)):
+        with open(path, 'rb') as fh:
+            append(writer, fh, spec)  # pages are cloned into the writer
+    with open(out_path, 'wb') as out:
+        writer.write(out)
+    writer.close()
+    return out_path
+
+
+def merge_uploads(files, ranges_values):
+    """Spool *files*, merge them and return the path of the merged temp file."""
+    ranges = parse_ranges(ranges_values, len(files))
+    spool_dir = tempfile.mkdtemp()
+    fd, out_path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        return merge_files(spool(files, spool_dir), out_path, ranges)
+    except Exception:
+        os.unlink(out_path)
+        raise
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
 @bp.route('/merge', methods=['POST'])
+@file_store.accepts_file_ids('pdfs')
 def merge_pdfs():
-    input_buffers = []
-    merger = None
     try:
         if 'pdfs' not in request.files:
             return jsonify(error='No PDF files provided'), 400
@@ -18,33 +104,10 @@ def merge_pdfs():
         if len(files) < 2:
             return jsonify(error='At least 2 PDF files required'), 400
 
-        merger = PdfMerger()
-        for f in files:
-            buf = io.BytesIO(f.read())
-            input_buffers.append(buf)
-            merger.append(buf)
-
-        out = io.BytesIO()
-        merger.write(out)
-        merger.close()
-        merger = None
-
-        # MEMORY MANAGEMENT: close input buffers immediately
-        for buf in input_buffers:
-            buf.close()
-        input_buffers.clear()
-
-        out.seek(0)
-        return send_file(out, mimetype='application/pdf',
-                         as_attachment=True, download_name='merged.pdf')
+        try:
+            out_path = merge_uploads(files, request.form.getlist('ranges'))
+        except page_ranges.PageRangeError as e:
+            return jsonify(error=str(e)), 400
+        return send_temp_file(out_path, 'application/pdf', 'merged.pdf')
     except Exception as e:
         return jsonify(error='Failed to merge PDFs', details=str(e)), 500
-    finally:
-        # MEMORY MANAGEMENT: ensure cleanup on error too
-        if merger:
-            try: merger.close()
-            except: pass
-        for buf in input_buffers:
-            try: buf.close()
-            except: pass
-        gc.collect()
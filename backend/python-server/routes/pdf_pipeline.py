@@ -0,0 +1,187 @@
+"""PDF Pipeline – run several PDF operations in one request.
+
+``ops`` is a JSON list applied in order to one PyPDF2 document, which is
+parsed once and serialised once at the end::
+
+    [{"op": "unlock", "password": "secret"},
+     {"op": "compress", "level": "high"},
+     {"op": "split", "mode": "range", "start": 2, "end": 5},
+     {"op": "protect", "password": "new"}]
+
+Each op calls the same transform as its single-purpose route.  ``unlock``
+must come first and ``protect`` / ``split`` with ``mode: all`` (a ZIP of
+single pages) last.  ``merge`` appends another PDF – upload number
+``file`` of the ``pdfs`` field, or a stored ``file_id`` – optionally only
+its ``pages``.
+"""
+
+from flask import Blueprint, request, jsonify
+from PyPDF2 import PdfReader
+from routes import pdf_compress, pdf_merge, pdf_protect, pdf_split, pdf_unlock
+from utils import page_ranges, file_store, spool
+from utils.streaming import send_temp_file, stream_response, zip_stream
+import os, json, tempfile
+
+bp = Blueprint('pdf_pipeline', __name__)
+
+_OPS = ('unlock', 'compress', 'split', 'merge', 'protect')
+
+
+class PipelineError(ValueError):
+    """The ``ops`` list is malformed."""
+
+
+def _int(op, key):
+    try:
+        value = int(op[key])
+    except (TypeError, ValueError):
+        raise PipelineError(f'{op["op"]}: {key} must be an integer') from None
+    return value
+
+
+def _str(op, key):
+    """``op[key]`` if it is a string – lists and objects would reach dict lookups."""
+    if not isinstance(op[key], str):
+        raise PipelineError(f'{op["op"]}: {key} must be a string')
+    return op[key]
+
+
+def parse_ops(raw):
+    """Validate the ``ops`` JSON up front, before any PDF is parsed."""
+    try:
+        ops = json.loads(raw or '')
+    except ValueError:
+        raise PipelineError('ops must be a JSON list of operations') from None
+    if not isinstance(ops, list) or not ops:
+        raise PipelineError('ops must be a non-empty JSON list of operations')
+
+    last = len(ops) - 1
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get('op') not in _OPS:
+            raise PipelineError(f'Op {n + 1}: expected {{"op": ...}} with one of {", ".join(_OPS)}')
+        name = op['op']
+        if name == 'unlock':
+            if n:
+                raise PipelineError('unlock must be the first op')
+            if op.get('password') is not None:
+                _str(op, 'password')
+        if name == 'protect':
+            if n != last:
+                raise PipelineError('protect must be the last op')
+            if not op.get('password'):
+                raise PipelineError('protect: password is required')
+            _str(op, 'password')
+        if name == 'compress':
+            op.setdefault('level', 'medium')
+            if _str(op, 'level') not in pdf_compress.PRESETS:
+                raise PipelineError(f'compress: level must be one of {", ".join(pdf_compress.PRESETS)}')
+            if op.get('target_bytes') is not None and _int(op, 'target_bytes') <= 0:
+                raise PipelineError('compress: target_bytes must be a positive integer')
+        if name == 'split':
+            op.setdefault('mode', 'range')
+            if _str(op, 'mode') not in ('range', 'all'):
+                raise PipelineError('split: mode must be range or all')
+            if op['mode'] == 'all' and n != last:
+                raise PipelineError('split with mode all must be the last op')
+            for key in ('start', 'end'):
+                if op.get(key) is not None:
+                    _int(op, key)
+        if name in ('split', 'merge') and op.get('pages') is not None \
+                and not isinstance(op['pages'], (str, list)):
+            raise PipelineError(f'{name}: pages must be a range string or a list of ranges')
+        if name == 'merge':
+            if op.get('file_id') is None and op.get('file') is None:
+                raise PipelineError('merge: file (index into pdfs) or file_id is required')
+            if op.get('file_id') is not None:
+                _str(op, 'file_id')
+            if op.get('file') is not None:
+                _int(op, 'file')
+    return ops
+
+
+def _split_indices(doc, op):
+    total = len(doc.pages)
+    if op.get('pages') is not None:
+        return page_ranges.parse(pdf_merge.range_spec(op['pages']), total)
+    start, end = int(op.get('start') or 1), int(op.get('end') or total)
+    if start < 1 or end > total or start > end:
+        raise page_ranges.PageRangeError(f'Page range "{start}-{end}" is outside 1-{total}')
+    return list(range(start - 1, end))
+
+
+def _merge(doc, op, uploads):
+    spec = pdf_merge.range_spec(op.get('pages'))
+    if op.get('file_id') is not None:
+        path, _ = file_store.get(op['file_id'])
+        with open(path, 'rb') as fh:
+            return pdf_merge.append(doc, fh, spec)
+    index = int(op['file'])
+    if not 0 <= index < len(uploads):
+        raise PipelineError(f'merge: file {index} is not one of the {len(uploads)} pdfs uploads')
+    return pdf_merge.append(doc, spool.open_input(uploads[index]), spec)
+
+
+def run(source, ops, uploads=()):
+    """Apply *ops* to the PDF *source*; returns ``(doc, split_all)``.
+
+    The document stays a ``PdfWriter`` object graph throughout; the caller
+    serialises it once (or per page when *split_all* is set).
+    """
+    reader = PdfReader(source)
+    if ops[0]['op'] == 'unlock':
+        pdf_unlock.unlock(reader, ops[0].get('password', ''))
+        ops = ops[1:]
+    elif reader.is_encrypted:
+        raise pdf_unlock.PasswordRequired('PDF is encrypted. Start the pipeline with an unlock op')
+
+    doc = pdf_split.select_pages(reader)
+    del reader  # MEMORY MANAGEMENT: pages were cloned into the writer
+    for op in ops:
+        name = op['op']
+        if name == 'compress':
+            target = op.get('target_bytes')
+            pdf_compress.compress(doc, op['level'], int(target) if target else None)
+        elif name == 'split':
+            if op['mode'] == 'all':
+                return doc, True
+            doc = pdf_split.select_pages(doc, _split_indices(doc, op))
+        elif name == 'merge':
+            _merge(doc, op, uploads)
+        elif name == 'protect':
+            pdf_protect.protect(doc, op['password'])
+    return doc, False
+
+
+@bp.route('/pipeline', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
+def pdf_pipeline():
+    try:
+        if 'pdf' not in request.files:
+            return jsonify(error='No PDF file provided'), 400
+
+        try:
+            ops = parse_ops(request.form.get('ops'))
+            doc, split_all = run(spool.open_input(request.files['pdf']), ops,
+                                 request.files.getlist('pdfs'))
+        except pdf_unlock.PasswordError as e:
+            return jsonify(error=str(e)), e.status
+        except file_store.FileStoreError as e:
+            return jsonify(error=str(e)), e.status
+        except ValueError as e:  # PipelineError, PageRangeError
+            return jsonify(error=str(e)), 400
+
+        if split_all:
+            return stream_response(zip_stream(pdf_split.single_pages(doc)),
+                                   'application/zip', 'split_pages.zip')
+
+        fd, out_path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                doc.write(out)
+        except Exception:
+            os.unlink(out_path)
+            raise
+        del doc
+        return send_temp_file(out_path, 'application/pdf', 'result.pdf')
+    except Exception as e:
+        return jsonify(error='Failed to run PDF pipeline', details=str(e)), 500
@@ -1,14 +1,25 @@
 """PDF Protect – add password encryption."""
 
 from flask import Blueprint, request, send_file, jsonify
-from PyPDF2 import PdfReader, PdfWriter
-import io, gc
+from PyPDF2 import PdfReader
+from routes.pdf_split import select_pages
+from utils import file_store, spool
+import io
 
 bp = Blueprint('pdf_protect', __name__)
 
+
+# ── Transform (shared with /api/pdf/pipeline) ──────────────────────────────
+
+def protect(writer, password):
+    """Encrypt *writer* with *password*; takes effect when it is written."""
+    writer.encrypt(user_password=password, owner_password=password, permissions_flag=-1)
+    return writer
+
+
 @bp.route('/protect', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def protect_pdf():
-    input_buf = None
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
@@ -17,30 +28,17 @@ def protect_pdf():
         if not password:
             return jsonify(error='Password is required'), 400
 
-        input_buf = io.BytesIO(request.files['pdf'].read())
-        reader = PdfReader(input_buf)
-        writer = PdfWriter()
-
-        for page in reader.pages:
-            writer.add_page(page)
-
-        writer.encrypt(user_password=password, owner_password=password, permissions_flag=-1)
+        reader = PdfReader(spool.open_input(request.files['pdf']))
+        writer = protect(select_pages(reader), password)
 
         out = io.BytesIO()
         writer.write(out)
 
-        # MEMORY MANAGEMENT: free input data
+        # MEMORY MANAGEMENT: free parsed objects
         del reader, writer
-        input_buf.close()
-        input_buf = None
 
         out.seek(0)
         return send_file(out, mimetype='application/pdf',
                          as_attachment=True, download_name='protected.pdf')
     except Exception as e:
         return jsonify(error='Failed to protect PDF', details=str(e)), 500
-    finally:
-        if input_buf:
-            try: input_buf.close()
-            except: pass
-        gc.collect()
@@ -2,53 +2,65 @@
 
 from flask import Blueprint, request, send_file, jsonify
 from PyPDF2 import PdfReader, PdfWriter
-import io, zipfile, gc
+from utils import file_store, spool
+from utils.streaming import zip_stream, stream_response
+import io
 
 bp = Blueprint('pdf_split', __name__)
 
+
+# ── Transforms (shared with /api/pdf/pipeline) ─────────────────────────────
+
+def select_pages(doc, indices=None):
+    """A new ``PdfWriter`` holding pages *indices* (default: all) of *doc*, in that order.
+
+    *doc* may be a ``PdfReader`` or a ``PdfWriter``; pages are cloned, so
+    nothing is serialised and unselected pages are never copied.
+    """
+    writer = PdfWriter()
+    for i in range(len(doc.pages)) if indices is None else indices:
+        writer.add_page(doc.pages[i])
+    return writer
+
+
+def single_pages(doc):
+    """Yield ``(name, pdf_bytes)`` per page, one page in memory at a time."""
+    for i, page in enumerate(doc.pages):
+        w = PdfWriter()
+        w.add_page(page)
+        pb = io.BytesIO()
+        w.write(pb)
+        del w
+        yield f'page_{i+1}.pdf', pb.getvalue()
+        pb.close()  # MEMORY MANAGEMENT: close per-page buffer
+
 @bp.route('/split', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def split_pdf():
-    input_buf = None
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
 
-        raw = request.files['pdf'].read()
-        input_buf = io.BytesIO(raw)
-        reader = PdfReader(input_buf)
-        total = len(reader.pages)
         mode = request.form.get('mode') or request.form.get('type', 'all')
 
+        reader = PdfReader(spool.open_input(request.files['pdf']))
+
         if mode == 'all':
-            buf = io.BytesIO()
-            with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for i in range(total):
-                    w = PdfWriter()
-                    w.add_page(reader.pages[i])
-                    pb = io.BytesIO()
-                    w.write(pb)
-                    zf.writestr(f'page_{i+1}.pdf', pb.getvalue())
-                    pb.close()  # MEMORY MANAGEMENT: close per-page buffer
-            # MEMORY MANAGEMENT: free input
-            del reader, raw
-            input_buf.close()
-            input_buf = None
-            buf.seek(0)
-            return send_file(buf, mimetype='application/zip',
-                             as_attachment=True, download_name='split_pages.zip')
-
-        elif mode == 'range':
+            # Stream the ZIP page by page straight from the mapped upload,
+            # so memory is flat in page count and bytes flow at once.
+            return stream_response(zip_stream(single_pages(reader)),
+                                   'application/zip', 'split_pages.zip')
+
+        total = len(reader.pages)
+
+        if mode == 'range':
             start = int(request.form.get('start', 1)) - 1
             end = int(request.form.get('end', total))
-            w = PdfWriter()
-            for i in range(start, end):
-                w.add_page(reader.pages[i])
+            w = select_pages(reader, range(start, end))
             out = io.BytesIO()
             w.write(out)
-            # MEMORY MANAGEMENT: free input
-            del reader, raw
-            input_buf.close()
-            input_buf = None
+            # MEMORY MANAGEMENT: free parsed objects
+            del reader, w
             out.seek(0)
             return send_file(out, mimetype='application/pdf',
                              as_attachment=True, download_name=f'pages_{start+1}-{end}.pdf')
@@ -56,8 +68,3 @@ def split_pdf():
         return jsonify(error='Invalid mode'), 400
     except Exception as e:
         return jsonify(error='Failed to split PDF', details=str(e)), 500
-    finally:
-        if input_buf:
-            try: input_buf.close()
-            except: pass
-        gc.collect()
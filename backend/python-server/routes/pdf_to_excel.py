@@ -1,42 +1,312 @@
-"""PDF → Excel conversion using tabula-py + pandas (FIX: added missing pandas import)."""
+"""PDF → Excel conversion using tabula-py + pandas.
 
-from flask import Blueprint, request, send_file, jsonify
-import pandas as pd
-import tabula
-import io, os, tempfile, logging, gc
+tabula-java runs in a long-lived in-process JVM (jpype) that is started once
+per worker and warmed by ``warm_up()``, instead of a ``java`` subprocess per
+request.  Pages are extracted in concurrent batches and the tables of every
+page are cached by a fingerprint of that page, so re-running a revised
+document only re-extracts the pages that changed.
+"""
+
+from flask import Blueprint, request, jsonify
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from concurrent.futures import ThreadPoolExecutor
+from utils import jobs, pools, result_cache, page_ranges, file_store, metrics, lazy
+from utils.streaming import send_temp_file
+import os, json, shutil, hashlib, tempfile, threading, logging
+
+pd = lazy.module('pandas')
+tabula = lazy.module('tabula')
+tabula_backend = lazy.module('tabula.backend')
+tabula_util = lazy.module('tabula.util')
 
 bp = Blueprint('pdf_to_excel', __name__)
 logger = logging.getLogger(__name__)
 
+_XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+TABULA_WORKERS = int(os.environ.get('TABULA_WORKERS', min(4, pools.cpu_count())))
+TABULA_BATCH_PAGES = int(os.environ.get('TABULA_BATCH_PAGES', 4))
+TABULA_JAVA_OPTIONS = os.environ.get('TABULA_JAVA_OPTIONS', '-Xmx512m').split()
+_MODES = ('auto', 'lattice', 'stream')
+
+
+class NoTablesFound(Exception):
+    pass
+
+
+# ── JVM ─────────────────────────────────────────────────────────────────────
+
+_vm = None
+_vm_pid = None
+_vm_lock = threading.Lock()
+
+
+def _jvm():
+    """This process's tabula JVM, or None when jpype is unavailable (subprocess mode)."""
+    global _vm, _vm_pid
+    with _vm_lock:
+        if _vm_pid != os.getpid():
+            vm = tabula_backend.TabulaVm(java_options=list(TABULA_JAVA_OPTIONS), silent=True)
+            _vm, _vm_pid = (vm if vm.tabula is not None else None), os.getpid()
+        return _vm
+
+
+def _call_tabula(pdf_path, options):
+    """Run tabula-java with *options* and return its parsed JSON output."""
+    vm = _jvm()
+    if vm is None:
+        with metrics.timed('tabula_subprocess'):
+            return tabula.read_pdf(pdf_path, output_format='json',
+                                   java_options=list(TABULA_JAVA_OPTIONS),
+                                   force_subprocess=True, **options)
+    # tabula-py shares one commons-cli parser, which is not thread-safe, so
+    # drive CommandLineApp directly with a parser per call.  The JVM itself
+    # runs batches concurrently; jpype releases the GIL inside Java calls.
+    from org.apache.commons.cli import DefaultParser
+    args = tabula_util.TabulaOption(format='JSON', silent=True, **options).build_option_list()
+    args.insert(0, pdf_path)
+    cmd = DefaultParser().parse(vm.tabula.CommandLineApp.buildOptions(), args)
+    sb = vm.lang.StringBuilder()
+    with metrics.timed('tabula_jvm'):
+        vm.tabula.CommandLineApp(sb, cmd).extractTables(cmd)
+    out = str(sb.toString())
+    return json.loads(out) if out else []
+
+
+def warm_up():
+    """Start the JVM and JIT tabula on a blank page in the background."""
+    if not shutil.which('java'):
+        return
+
+    def _warm():
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            w = PdfWriter()
+            w.add_blank_page(width=612, height=792)
+            with os.fdopen(fd, 'wb') as f:
+                w.write(f)
+            _call_tabula(path, {'pages': [1]})
+            logger.info('tabula JVM warmed up')
+        except Exception:
+            logger.warning('tabula warm-up failed', exc_info=True)
+        finally:
+            os.unlink(path)
+    threading.Thread(target=_warm, name='tabula-warmup', daemon=True).start()
+
+
+# ── Extraction ──────────────────────────────────────────────────────────────
+
+def _tabula_options(mode='auto', area=None, relative_area=False):
+    opts = {'lattice': mode == 'lattice', 'stream': mode == 'stream'}
+    if area:
+        opts.update(area=area, relative_area=relative_area, guess=False)
+    return opts
+
+
+_INHERITED = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+_BACK_REFS = ('/Parent', '/P')   # lead back up into the rest of the document
+
+
+def _feed(h, obj, seen):
+    """Hash *obj* and everything it references, stream data included.
+
+    Shared objects are hashed once and then referred to by the order they
+    were first met, so the digest does not depend on object numbering.
+    """
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in seen:
+            h.update(b'@%d;' % seen[ref])
+            return
+        seen[ref] = len(seen)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        data = obj._data or b''
+        h.update(b'S%d:' % len(data))
+        h.update(data)
+    if isinstance(obj, DictionaryObject):
+        h.update(b'<<')
+        for key in sorted(obj):
+            if key not in _BACK_REFS:
+                h.update(key.encode() + b' ')
+                _feed(h, obj.raw_get(key), seen)
+        h.update(b'>>')
+    elif isinstance(obj, ArrayObject):
+        h.update(b'[')
+        for item in obj:
+            _feed(h, item, seen)
+        h.update(b']')
+    else:
+        h.update(repr(obj).encode() + b';')
+
+
+def _page_fingerprint(page):
+    """Hash of everything tabula reads from a page.
+
+    Walks the page's whole object tree – content streams, Form XObjects,
+    fonts with their embedded programs, images – plus the attributes it
+    inherits from the page tree.  Pages that only differ inside a form or
+    a font must never share cached tables.
+    """
+    h = hashlib.sha256()
+    seen = {}
+    _feed(h, page, seen)
+    for key in _INHERITED:
+        node = page
+        while key not in node and '/Parent' in node:
+            node = node['/Parent']   # indexing resolves the reference
+        if node is not page and key in node:
+            h.update(key.encode() + b' ')
+            _feed(h, node.raw_get(key), seen)
+    return h.digest()
+
+
+def _rows(table):
+    return [[cell.get('text', '') for cell in row] for row in table.get('data', [])]
+
+
+def _extract_batch(pdf_path, pages, opts):
+    """Tables for 1-based *pages*, grouped as ``{page: [rows, ...]}``."""
+    found = {p: [] for p in pages}
+    for table in _call_tabula(pdf_path, dict(opts, pages=pages)):
+        rows = _rows(table)
+        if rows:
+            found.setdefault(table.get('page_number'), []).append(rows)
+    return found
+
+
+def _extract(pdf_path, pages=None, mode='auto', area=None, relative_area=False):
+    """All tables of the selected pages, in page order, as lists of rows."""
+    opts = _tabula_options(mode, area, relative_area)
+    reader = PdfReader(pdf_path)
+    indices = page_ranges.parse(pages, len(reader.pages))
+
+    per_page, keys, missing = {}, {}, []
+    for i in indices:
+        if i + 1 in keys:
+            continue
+        keys[i + 1] = result_cache.key_for('pdf_to_excel_page', _page_fingerprint(reader.pages[i]),
+                                           **opts)
+        cached = result_cache.get(keys[i + 1])
+        if cached:
+            with open(cached, 'rb') as f:
+                per_page[i + 1] = json.load(f)
+        else:
+            missing.append(i + 1)
+    del reader  # MEMORY MANAGEMENT: free reader before the JVM work
+
+    if missing:
+        logger.info(f'Extracting tables from {len(missing)} of {len(keys)} pages')
+        batches = page_ranges.chunks(missing, TABULA_BATCH_PAGES)
+        with ThreadPoolExecutor(max_workers=min(TABULA_WORKERS, len(batches))) as ex:
+            for done, found in enumerate(ex.map(lambda b: _extract_batch(pdf_path, b, opts),
+                                                batches), 1):
+                for page, tables in found.items():
+                    per_page[page] = tables
+                    result_cache.put(keys[page], json.dumps(tables).encode('utf-8'))
+                jobs.progress(done / len(batches))
+
+    return [t for i in indices for t in per_page.get(i + 1, [])]
+
+
+def _frames(tables):
+    """Table rows → DataFrames, the way tabula-py's read_pdf() builds them.
+
+    First row as header (blank → "Unnamed: n", duplicates → ".1"), empty
+    cells as NaN and columns that parse as numbers converted.  Done here
+    rather than through tabula-py's private ``_extract_from``.
+    """
+    frames = []
+    for rows in tables:
+        if not rows:
+            continue
+        header, unnamed, counts = [], 0, {}
+        for text in rows[0]:
+            if not text:
+                text, unnamed = f'Unnamed: {unnamed}', unnamed + 1
+            seen = counts.get(text, 0)
+            while seen:
+                counts[text] = seen + 1
+                text = f'{text}.{seen}'
+                seen = counts.get(text, 0)
+            counts[text] = 1
+            header.append(text)
+        df = pd.DataFrame([[text or float('nan') for text in row] for row in rows[1:]], columns=header)
+        for col in df.columns:
+            try:
+                df[col] = pd.to_numeric(df[col], errors='raise')
+            except (ValueError, TypeError):
+                pass
+        frames.append(df)
+    return frames
+
+
+def _convert(pdf_path, xlsx_path, options=None):
+    """Extract tables to one sheet each; top-level so the async job pool can call it."""
+    tables = _extract(pdf_path, **(options or {}))
+    if not tables:
+        raise NoTablesFound('No tables found in PDF')
+
+    frames = _frames(tables)
+    # MEMORY MANAGEMENT: free table rows
+    del tables
+
+    with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+        for i, tbl in enumerate(frames):
+            tbl.to_excel(writer, sheet_name=f'Table_{i+1}', index=False)
+    del frames
+    return xlsx_path
+
+
+def _request_options():
+    """``pages=``, ``mode=`` and ``area=`` form fields as ``_extract`` kwargs."""
+    mode = request.form.get('mode', 'auto').lower()
+    if mode not in _MODES:
+        raise ValueError(f'mode must be one of {", ".join(_MODES)}')
+    options = {'pages': request.form.get('pages') or None, 'mode': mode}
+    area = request.form.get('area')
+    if area:
+        # "top,left,bottom,right" or a JSON list of such boxes; "%" for percentages
+        relative = '%' in area
+        area = area.replace('%', '')
+        boxes = json.loads(area) if area.lstrip().startswith('[') else [float(v) for v in area.split(',')]
+        flat = boxes if boxes and not isinstance(boxes[0], list) else None
+        for box in ([flat] if flat else boxes):
+            if len(box) != 4:
+                raise ValueError('area needs four values: top,left,bottom,right')
+        options.update(area=boxes, relative_area=relative)
+    return options
+
+
 @bp.route('/to-excel', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def pdf_to_excel():
     pdf_path = xlsx_path = None
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
 
+        try:
+            options = _request_options()
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        if jobs.wants_async():
+            return jobs.start('pdf_to_excel', request.files['pdf'].save, _convert,
+                              _XLSX_MIME, 'converted.xlsx', 'input.pdf', 'converted.xlsx', options)
+
         pdf_path = tempfile.mktemp(suffix='.pdf')
         request.files['pdf'].save(pdf_path)
 
-        tables = tabula.read_pdf(pdf_path, pages='all', multiple_tables=True)
-        if not tables:
-            return jsonify(error='No tables found in PDF'), 400
-
         xlsx_path = pdf_path.replace('.pdf', '.xlsx')
-        with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
-            for i, tbl in enumerate(tables):
-                tbl.to_excel(writer, sheet_name=f'Table_{i+1}', index=False)
-
-        # MEMORY MANAGEMENT: free DataFrames
-        del tables
-
-        with open(xlsx_path, 'rb') as f:
-            out = io.BytesIO(f.read())
-        out.seek(0)
+        try:
+            _convert(pdf_path, xlsx_path, options)
+        except page_ranges.PageRangeError as e:
+            return jsonify(error=str(e)), 400
 
-        return send_file(out,
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                         as_attachment=True, download_name='converted.xlsx')
+        return send_temp_file(xlsx_path, _XLSX_MIME, 'converted.xlsx')
+    except NoTablesFound as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
         logger.exception('PDF→Excel failed')
         return jsonify(error='Failed to convert PDF to Excel', details=str(e)), 500
@@ -44,4 +314,3 @@ def pdf_to_excel():
         for p in (pdf_path, xlsx_path):
             if p and os.path.exists(p):
                 os.unlink(p)
-        gc.collect()
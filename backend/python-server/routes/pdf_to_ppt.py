@@ -1,59 +1,87 @@
 """PDF → PowerPoint (each page rendered as slide image)."""
 
-from flask import Blueprint, request, send_file, jsonify
-from pptx import Presentation
-from pptx.util import Inches
-from pdf2image import convert_from_path
-import io, os, tempfile, logging, gc
+from flask import Blueprint, request, jsonify
+from utils import jobs, pools, file_store, metrics, lazy
+from utils.streaming import send_temp_file
+import io, os, tempfile, logging
+
+pptx = lazy.module('pptx')
+pptx_util = lazy.module('pptx.util')
+pdf2image = lazy.module('pdf2image')
 
 bp = Blueprint('pdf_to_ppt', __name__)
 logger = logging.getLogger(__name__)
 
+_PPTX_MIME = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+_DPI = 150                 # reduced from default 200 dpi
+# MEMORY MANAGEMENT: only this many rendered pages are alive at once
+_WINDOW = int(os.environ.get('PDF_TO_PPT_WINDOW', 4))
+_THREADS = min(_WINDOW, pools.cpu_count())
+_FORMATS = {'png': ('PNG', {}), 'jpeg': ('JPEG', {'quality': 90}), 'jpg': ('JPEG', {'quality': 90})}
+
+def _convert(pdf_path, ppt_path, image_format='png'):
+    """Render pages window by window into slides; top-level so the async job pool can call it.
+
+    pdftoppm renders each window on several threads, and every page is encoded
+    straight into an in-memory stream for ``add_picture``, so the decoded
+    bitmaps alive at any time are bounded by the window size.  (The encoded
+    slide images themselves stay in the presentation until it is saved.)
+    """
+    fmt, save_opts = _FORMATS.get(image_format, _FORMATS['png'])
+    total = pdf2image.pdfinfo_from_path(pdf_path)['Pages']
+    prs = pptx.Presentation()
+    layout = prs.slide_layouts[6]  # blank
+
+    for first in range(1, total + 1, _WINDOW):
+        last = min(first + _WINDOW - 1, total)
+        with metrics.timed('poppler'):
+            images = pdf2image.convert_from_path(pdf_path, dpi=_DPI, first_page=first, last_page=last,
+                                       thread_count=_THREADS)
+        for image in images:
+            stream = io.BytesIO()
+            image.save(stream, fmt, **save_opts)
+            image.close()  # MEMORY MANAGEMENT: close PIL Image immediately
+            stream.seek(0)
+
+            slide = prs.slides.add_slide(layout)
+            slide.shapes.add_picture(stream, pptx_util.Inches(0), pptx_util.Inches(0), width=prs.slide_width)
+        # MEMORY MANAGEMENT: drop the window before rendering the next one
+        del images
+        jobs.progress(last / total)
+
+    prs.save(ppt_path)
+    del prs  # MEMORY MANAGEMENT: free presentation
+    return ppt_path
+
 @bp.route('/to-powerpoint', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def pdf_to_ppt():
     pdf_path = ppt_path = None
-    img_paths = []
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
 
-        pdf_path = tempfile.mktemp(suffix='.pdf')
-        request.files['pdf'].save(pdf_path)
-
-        # MEMORY MANAGEMENT: convert one page at a time to avoid loading all pages into RAM
-        images = convert_from_path(pdf_path, dpi=150)  # reduced from default 200 dpi
-        prs = Presentation()
-
-        for i, image in enumerate(images):
-            img_path = f'{pdf_path}_{i}.png'
-            img_paths.append(img_path)
-            image.save(img_path, 'PNG')
-            image.close()  # MEMORY MANAGEMENT: close PIL Image immediately
+        image_format = request.form.get('image_format', 'png').lower()
+        if image_format not in _FORMATS:
+            return jsonify(error=f'Unsupported image format: {image_format}'), 400
 
-            slide = prs.slides.add_slide(prs.slide_layouts[6])  # blank
-            slide.shapes.add_picture(img_path, Inches(0), Inches(0), width=prs.slide_width)
+        if jobs.wants_async():
+            return jobs.start('pdf_to_ppt', request.files['pdf'].save, _convert,
+                              _PPTX_MIME, 'converted.pptx', 'input.pdf', 'converted.pptx',
+                              image_format)
 
-        # MEMORY MANAGEMENT: free images list
-        del images
-        gc.collect()
-
-        ppt_path = pdf_path.replace('.pdf', '.pptx')
-        prs.save(ppt_path)
-        del prs  # MEMORY MANAGEMENT: free presentation
+        pdf_path = tempfile.mktemp(suffix='.pdf')
+        request.files['pdf'].save(pdf_path)
 
-        with open(ppt_path, 'rb') as f:
-            out = io.BytesIO(f.read())
-        out.seek(0)
+        ppt_path = _convert(pdf_path, pdf_path.replace('.pdf', '.pptx'), image_format)
 
-        return send_file(out,
-                         mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                         as_attachment=True, download_name='converted.pptx')
+        return send_temp_file(ppt_path, _PPTX_MIME, 'converted.pptx')
     except Exception as e:
         logger.exception('PDF→PPT failed')
         return jsonify(error='Failed to convert PDF to PowerPoint', details=str(e)), 500
     finally:
-        for p in [pdf_path, ppt_path] + img_paths:
+        for p in (pdf_path, ppt_path):
             if p and os.path.exists(p):
                 try: os.unlink(p)
                 except: pass
-        gc.collect()
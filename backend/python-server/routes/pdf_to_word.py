@@ -1,36 +1,52 @@
 """PDF → Word conversion using pdf2docx."""
 
-from flask import Blueprint, request, send_file, jsonify
-from pdf2docx import Converter
-import io, os, tempfile, logging, gc
+from flask import Blueprint, request, jsonify
+from utils import result_cache, jobs, file_store, lazy
+from utils.streaming import send_temp_file, send_cached_file
+import os, tempfile, logging
+
+pdf2docx = lazy.module('pdf2docx')
 
 bp = Blueprint('pdf_to_word', __name__)
 logger = logging.getLogger(__name__)
 
+_DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+def _convert(pdf_path, docx_path):
+    """Run pdf2docx; top-level so the async job pool can call it."""
+    cv = pdf2docx.Converter(pdf_path)
+    try:
+        cv.convert(docx_path)
+    finally:
+        cv.close()
+    return docx_path
+
 @bp.route('/to-word', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def pdf_to_word():
     pdf_path = docx_path = None
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
 
+        if jobs.wants_async():
+            return jobs.start('pdf_to_word', request.files['pdf'].save, _convert,
+                              _DOCX_MIME, 'converted.docx', 'input.pdf', 'converted.docx')
+
         pdf_path = tempfile.mktemp(suffix='.pdf')
         docx_path = tempfile.mktemp(suffix='.docx')
 
         request.files['pdf'].save(pdf_path)
 
-        cv = Converter(pdf_path)
-        cv.convert(docx_path)
-        cv.close()
-        del cv  # MEMORY MANAGEMENT: free converter
+        cache_key = result_cache.key_for('pdf_to_word', pdf_path)
+        cached = result_cache.get(cache_key)
+        if cached:
+            return send_cached_file(cached, _DOCX_MIME, 'converted.docx')
 
-        with open(docx_path, 'rb') as f:
-            out = io.BytesIO(f.read())
-        out.seek(0)
+        _convert(pdf_path, docx_path)
+        result_cache.put(cache_key, docx_path)
 
-        return send_file(out,
-                         mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                         as_attachment=True, download_name='converted.docx')
+        return send_temp_file(docx_path, _DOCX_MIME, 'converted.docx')
     except Exception as e:
         logger.exception('PDF→Word failed')
         return jsonify(error='Failed to convert PDF to Word', details=str(e)), 500
@@ -38,4 +54,3 @@ def pdf_to_word():
         for p in (pdf_path, docx_path):
             if p and os.path.exists(p):
                 os.unlink(p)
-        gc.collect()
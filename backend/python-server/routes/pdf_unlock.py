@@ -1,47 +1,64 @@
 """PDF Unlock – decrypt a password-protected PDF."""
 
 from flask import Blueprint, request, send_file, jsonify
-from PyPDF2 import PdfReader, PdfWriter
-import io, gc
+from PyPDF2 import PdfReader
+from routes.pdf_split import select_pages
+from utils import file_store, spool
+import io
 
 bp = Blueprint('pdf_unlock', __name__)
 
+
+class PasswordError(ValueError):
+    """Base class; ``status`` is the HTTP status to answer with."""
+    status = 400
+
+
+class PasswordRequired(PasswordError):
+    status = 400
+
+
+class InvalidPassword(PasswordError):
+    status = 401
+
+
+# ── Transform (shared with /api/pdf/pipeline) ──────────────────────────────
+
+def unlock(reader, password):
+    """Decrypt *reader* in place (a no-op for unencrypted files) and return it."""
+    if reader.is_encrypted:
+        if not password:
+            raise PasswordRequired('PDF is encrypted. Password required')
+        if not reader.decrypt(password):
+            raise InvalidPassword('Invalid password')
+    return reader
+
+
 @bp.route('/unlock', methods=['POST'])
+@file_store.accepts_file_ids('pdf')
 def unlock_pdf():
-    input_buf = None
     try:
         if 'pdf' not in request.files:
             return jsonify(error='No PDF file provided'), 400
 
         password = request.form.get('password', '')
-        input_buf = io.BytesIO(request.files['pdf'].read())
-        reader = PdfReader(input_buf)
+        reader = PdfReader(spool.open_input(request.files['pdf']))
 
-        if reader.is_encrypted:
-            if not password:
-                return jsonify(error='PDF is encrypted. Password required'), 400
-            if not reader.decrypt(password):
-                return jsonify(error='Invalid password'), 401
+        try:
+            unlock(reader, password)
+        except PasswordError as e:
+            return jsonify(error=str(e)), e.status
 
-        writer = PdfWriter()
-        for page in reader.pages:
-            writer.add_page(page)
+        writer = select_pages(reader)
 
         out = io.BytesIO()
         writer.write(out)
 
-        # MEMORY MANAGEMENT: free input data
+        # MEMORY MANAGEMENT: free parsed objects
         del reader, writer
-        input_buf.close()
-        input_buf = None
 
         out.seek(0)
         return send_file(out, mimetype='application/pdf',
                          as_attachment=True, download_name='unlocked.pdf')
     except Exception as e:
         return jsonify(error='Failed to unlock PDF', details=str(e)), 500
-    finally:
-        if input_buf:
-            try: input_buf.close()
-            except: pass
-        gc.collect()
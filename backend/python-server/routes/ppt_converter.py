@@ -1,22 +1,17 @@
 """PPT/PPTX Converter – convert to PDF (via LibreOffice) or TXT."""
 
 from flask import Blueprint, request, send_file, jsonify
-from pptx import Presentation
-import io, os, tempfile, subprocess, shutil, logging, gc
+from utils import libreoffice, jobs, file_store, lazy
+from utils.streaming import send_temp_file
+import io, os, tempfile, shutil, logging
+
+pptx = lazy.module('pptx')
 
 bp = Blueprint('ppt_converter', __name__)
 logger = logging.getLogger(__name__)
 
-def _has_libreoffice():
-    try:
-        subprocess.run(['libreoffice', '--version'], capture_output=True, timeout=5)
-        return True
-    except Exception:
-        return False
-
-_LO = _has_libreoffice()
-
 @bp.route('/ppt-convert', methods=['POST'])
+@file_store.accepts_file_ids('file')
 def convert_ppt():
     temp_dir = None
     try:
@@ -27,25 +22,25 @@ def convert_ppt():
         fmt = request.form.get('format', 'pdf').lower()
         ext = f.filename.rsplit('.', 1)[-1].lower() if '.' in f.filename else 'pptx'
 
+        if fmt == 'pdf' and jobs.wants_async():
+            if not libreoffice.available():
+                return jsonify(error='LibreOffice not available on server'), 503
+            return jobs.start('ppt_convert', f.save, libreoffice.convert_job, 'application/pdf',
+                              f.filename.rsplit('.', 1)[0] + '.pdf', f'input.{ext}', 'converted.pdf', 'pdf')
+
         temp_dir = tempfile.mkdtemp()
         in_path = os.path.join(temp_dir, f'input.{ext}')
         f.save(in_path)
 
         if fmt == 'pdf':
-            if not _LO:
+            if not libreoffice.available():
                 return jsonify(error='LibreOffice not available on server'), 503
-            subprocess.run(
-                ['libreoffice', '--headless', '--convert-to', 'pdf', '--outdir', temp_dir, in_path],
-                capture_output=True, timeout=120, check=True
-            )
-            out_path = os.path.join(temp_dir, 'input.pdf')
-            if not os.path.exists(out_path):
-                return jsonify(error='Conversion failed'), 500
-            return send_file(out_path, mimetype='application/pdf',
-                             as_attachment=True, download_name=f.filename.rsplit('.', 1)[0] + '.pdf')
+            out_path = libreoffice.convert(in_path, 'pdf')
+            # Unlinked once opened, so removing temp_dir below does not cut the response short
+            return send_temp_file(out_path, 'application/pdf', f.filename.rsplit('.', 1)[0] + '.pdf')
 
         elif fmt == 'txt':
-            prs = Presentation(in_path)
+            prs = pptx.Presentation(in_path)
             lines = []
             for i, slide in enumerate(prs.slides, 1):
                 lines.append(f'--- Slide {i} ---')
@@ -59,7 +54,7 @@ def convert_ppt():
                              as_attachment=True, download_name=f.filename.rsplit('.', 1)[0] + '.txt')
 
         return jsonify(error=f'Unsupported format: {fmt}'), 400
-    except subprocess.TimeoutExpired:
+    except libreoffice.ConversionTimeout:
         return jsonify(error='Conversion timed out'), 504
     except Exception as e:
         logger.exception('PPT convert failed')
@@ -67,4 +62,3 @@ def convert_ppt():
     finally:
         if temp_dir and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
-        gc.collect()
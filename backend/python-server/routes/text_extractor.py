@@ -2,13 +2,104 @@
 
 from flask import Blueprint, request, send_file, jsonify
 from PyPDF2 import PdfReader
-from docx import Document
-from pptx import Presentation
-import io, gc
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from utils import page_ranges, pools, file_store, lazy, spool
+from utils.streaming import stream_response
+import io, os, json, shutil, tempfile
+
+docx = lazy.module('docx')
+pptx = lazy.module('pptx')
 
 bp = Blueprint('text_extractor', __name__)
 
+TEXT_WORKERS = int(os.environ.get('TEXT_WORKERS', min(4, pools.cpu_count())))
+TEXT_CHUNK_PAGES = int(os.environ.get('TEXT_CHUNK_PAGES', 25))
+
+
+def _flag(name):
+    return (request.args.get(name) or request.form.get(name) or '').lower() in ('1', 'true', 'yes')
+
+
+# ── Page sources: each yields ``(number, text)`` ────────────────────────────
+
+def _extract_chunk(pdf_path, indices):
+    """Worker-process entry point: text of *indices* from the PDF at *pdf_path*."""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or '' for i in indices]
+
+
+def _pdf_pages(reader, indices):
+    # Only the selected pages are ever parsed; PyPDF2 loads page content lazily
+    for i in indices:
+        yield i + 1, reader.pages[i].extract_text() or ''
+
+
+def _pdf_pages_parallel(src, indices):
+    """Extract page chunks in worker processes, yielding pages in order.
+
+    At most 2 × TEXT_WORKERS chunks are outstanding, so memory stays flat
+    however large the document is.  The workers' copy of *src* is written
+    on the first ``next()`` and deleted at the end, so a generator that is
+    never started leaves nothing behind.
+    """
+    pool = pools.process_pool('text_extract', TEXT_WORKERS)
+    pending = deque()
+    fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+
+    def _drain():
+        chunk, fut = pending.popleft()
+        for i, text in zip(chunk, fut.result()):
+            yield i + 1, text
+
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            src.seek(0)
+            shutil.copyfileobj(src, out)
+        for chunk in page_ranges.chunks(indices, TEXT_CHUNK_PAGES):
+            pending.append((chunk, pool.submit(_extract_chunk, pdf_path, chunk)))
+            if len(pending) >= 2 * TEXT_WORKERS:
+                yield from _drain()
+        while pending:
+            yield from _drain()
+    except BrokenProcessPool:
+        pools.discard('text_extract')
+        raise
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+        try: os.remove(pdf_path)
+        except OSError: pass
+
+
+def _docx_paragraphs(source):
+    doc = docx.Document(source)
+    for n, p in enumerate(doc.paragraphs, 1):
+        yield n, p.text
+
+
+def _pptx_slides(prs, indices):
+    slides = list(prs.slides)
+    for i in indices:
+        yield i + 1, '\n'.join(shape.text for shape in slides[i].shapes if hasattr(shape, 'text'))
+
+
+# ── Output formats ──────────────────────────────────────────────────────────
+
+def _text_chunks(units):
+    first = True
+    for _, text in units:
+        yield (text if first else '\n\n' + text).encode('utf-8')
+        first = False
+
+
+def _ndjson_chunks(units, key):
+    for n, text in units:
+        yield (json.dumps({key: n, 'text': text}, ensure_ascii=False) + '\n').encode('utf-8')
+
+
 @bp.route('/extract', methods=['POST'])
+@file_store.accepts_file_ids('file')
 def extract_text():
     try:
         if 'file' not in request.files:
@@ -16,38 +107,51 @@ def extract_text():
 
         f = request.files['file']
         ext = f.filename.rsplit('.', 1)[-1].lower() if '.' in f.filename else ''
-        raw = f.read()
-        parts = []
-
-        if ext == 'pdf':
-            reader = PdfReader(io.BytesIO(raw))
-            for page in reader.pages:
-                parts.append(page.extract_text() or '')
-            del reader  # MEMORY MANAGEMENT: free reader
-        elif ext in ('docx', 'doc'):
-            doc = Document(io.BytesIO(raw))
-            for p in doc.paragraphs:
-                parts.append(p.text)
-            del doc  # MEMORY MANAGEMENT: free document
-        elif ext in ('pptx', 'ppt'):
-            prs = Presentation(io.BytesIO(raw))
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, 'text'):
-                        parts.append(shape.text)
-            del prs  # MEMORY MANAGEMENT: free presentation
-        elif ext == 'txt':
-            parts.append(raw.decode('utf-8'))
-        else:
-            return jsonify(error='Unsupported file type'), 400
-
-        del raw  # MEMORY MANAGEMENT: free raw bytes
-        out = io.BytesIO('\n\n'.join(parts).encode('utf-8'))
-        del parts  # MEMORY MANAGEMENT: free parts list
+        fmt = (request.args.get('format') or request.form.get('format') or 'text').lower()
+        if fmt not in ('text', 'ndjson'):
+            return jsonify(error='Unsupported output format'), 400
+        pages = request.args.get('pages') or request.form.get('pages')
+        key = 'page'
+
+        # Parse from the spooled upload (mapped, not copied into a bytes object)
+        try:
+            if ext == 'pdf':
+                # Only the xref and page tree are read here; page content is parsed lazily
+                src = spool.open_input(f)
+                reader = PdfReader(src)
+                indices = page_ranges.parse(pages, len(reader.pages))
+                if _flag('parallel') and len(indices) > TEXT_CHUNK_PAGES:
+                    del reader  # workers open their own copies
+                    units = _pdf_pages_parallel(src, indices)
+                else:
+                    units = _pdf_pages(reader, indices)
+            elif ext in ('pptx', 'ppt'):
+                prs = pptx.Presentation(spool.open_input(f))
+                units = _pptx_slides(prs, page_ranges.parse(pages, len(prs.slides)))
+                key = 'slide'
+            elif pages:
+                return jsonify(error='pages= is only supported for PDF and PPTX files'), 400
+            elif ext in ('docx', 'doc'):
+                units = _docx_paragraphs(spool.open_input(f))
+                key = 'paragraph'
+            elif ext == 'txt':
+                units = iter([(1, f.read().decode('utf-8'))])
+            else:
+                return jsonify(error='Unsupported file type'), 400
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        if fmt == 'ndjson':
+            return stream_response(_ndjson_chunks(units, key),
+                                   'application/x-ndjson', 'extracted_text.ndjson')
+        if _flag('stream'):
+            return stream_response(_text_chunks(units), 'text/plain', 'extracted_text.txt')
+
+        out = io.BytesIO()
+        for chunk in _text_chunks(units):
+            out.write(chunk)
         out.seek(0)
         return send_file(out, mimetype='text/plain',
                          as_attachment=True, download_name='extracted_text.txt')
     except Exception as e:
         return jsonify(error='Failed to extract text', details=str(e)), 500
-    finally:
-        gc.collect()
@@ -1,13 +1,17 @@
 """Word Converter – convert DOCX to PDF or TXT."""
 
 from flask import Blueprint, request, send_file, jsonify
-from docx import Document
-import io, os, tempfile, logging, gc
+from utils import libreoffice, jobs, file_store, lazy
+from utils.streaming import send_temp_file
+import io, os, tempfile, logging
+
+docx = lazy.module('docx')
 
 bp = Blueprint('word_converter', __name__)
 logger = logging.getLogger(__name__)
 
 @bp.route('/word-convert', methods=['POST'])
+@file_store.accepts_file_ids('file')
 def convert_word():
     temp_path = output_path = None
     try:
@@ -17,21 +21,19 @@ def convert_word():
         f = request.files['file']
         fmt = request.form.get('format', 'pdf')
 
+        if fmt == 'pdf' and jobs.wants_async():
+            return jobs.start('word_convert', f.save, libreoffice.convert_job, 'application/pdf',
+                              'converted.pdf', 'input.docx', 'converted.pdf', 'pdf')
+
         temp_path = tempfile.mktemp(suffix='.docx')
         f.save(temp_path)
 
         if fmt == 'pdf':
-            from docx2pdf import convert
-            output_path = temp_path.replace('.docx', '.pdf')
-            convert(temp_path, output_path)
-            with open(output_path, 'rb') as fp:
-                out = io.BytesIO(fp.read())
-            out.seek(0)
-            return send_file(out, mimetype='application/pdf',
-                             as_attachment=True, download_name='converted.pdf')
+            output_path = libreoffice.convert(temp_path, 'pdf')
+            return send_temp_file(output_path, 'application/pdf', 'converted.pdf')
 
         elif fmt == 'txt':
-            doc = Document(temp_path)
+            doc = docx.Document(temp_path)
             text = '\n'.join(p.text for p in doc.paragraphs)
             del doc  # MEMORY MANAGEMENT: free Document
             out = io.BytesIO(text.encode('utf-8'))
@@ -40,6 +42,8 @@ def convert_word():
                              as_attachment=True, download_name='converted.txt')
 
         return jsonify(error='Unsupported format'), 400
+    except libreoffice.ConversionTimeout:
+        return jsonify(error='Conversion timed out'), 504
     except Exception as e:
         logger.exception('Word convert failed')
         return jsonify(error='Failed to convert Word document', details=str(e)), 500
@@ -48,4 +52,3 @@ def convert_word():
             if p and os.path.exists(p):
                 try: os.unlink(p)
                 except: pass
-        gc.collect()
@@ -1,32 +1,40 @@
-"""Word → PDF conversion using docx2pdf (requires LibreOffice on Linux)."""
+"""Word → PDF conversion via the shared LibreOffice pool."""
 
-from flask import Blueprint, request, send_file, jsonify
-from docx2pdf import convert
-import io, os, tempfile, logging, gc
+from flask import Blueprint, request, jsonify
+from utils import libreoffice, result_cache, jobs, file_store
+from utils.streaming import send_temp_file, send_cached_file
+import os, tempfile, logging
 
 bp = Blueprint('word_to_pdf', __name__)
 logger = logging.getLogger(__name__)
 
 @bp.route('/word-to-pdf', methods=['POST'])
+@file_store.accepts_file_ids('file')
 def word_to_pdf():
     word_path = pdf_path = None
     try:
         if 'file' not in request.files and 'word' not in request.files:
             return jsonify(error='No Word file provided'), 400
 
-        word_path = tempfile.mktemp(suffix='.docx')
-        pdf_path = tempfile.mktemp(suffix='.pdf')
-
         f = request.files.get('file') or request.files.get('word')
+        if jobs.wants_async():
+            return jobs.start('word_to_pdf', f.save, libreoffice.convert_job, 'application/pdf',
+                              'converted.pdf', 'input.docx', 'converted.pdf', 'pdf')
+
+        word_path = tempfile.mktemp(suffix='.docx')
         f.save(word_path)
-        convert(word_path, pdf_path)
 
-        with open(pdf_path, 'rb') as f:
-            out = io.BytesIO(f.read())
-        out.seek(0)
+        cache_key = result_cache.key_for('word_to_pdf', word_path)
+        cached = result_cache.get(cache_key)
+        if cached:
+            return send_cached_file(cached, 'application/pdf', 'converted.pdf')
+
+        pdf_path = libreoffice.convert(word_path, 'pdf')
+        result_cache.put(cache_key, pdf_path)
 
-        return send_file(out, mimetype='application/pdf',
-                         as_attachment=True, download_name='converted.pdf')
+        return send_temp_file(pdf_path, 'application/pdf', 'converted.pdf')
+    except libreoffice.ConversionTimeout:
+        return jsonify(error='Conversion timed out'), 504
     except Exception as e:
         logger.exception('Word→PDF failed')
         return jsonify(error='Failed to convert Word to PDF', details=str(e)), 500
@@ -35,4 +43,3 @@ def word_to_pdf():
             if p and os.path.exists(p):
                 try: os.unlink(p)
                 except: pass
-        gc.collect()
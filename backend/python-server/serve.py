@@ -0,0 +1,29 @@
+"""Development server – ``python serve.py``.
+
+Kept apart from app.py because process pools start their children with
+``spawn``, which re-imports this script in every child: everything with a
+side effect stays under the ``__main__`` guard so the children skip it.
+"""
+
+import os, sys, signal, atexit, logging
+
+
+def main():
+    from app import app, cleanup_temp, warm_up_worker
+
+    def _shutdown(signum, frame):
+        logging.getLogger('allfilechanger').info(f'Received signal {signum} – shutting down')
+        sys.exit(0)     # atexit runs cleanup_temp
+
+    atexit.register(cleanup_temp)
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT,  _shutdown)
+    warm_up_worker()
+
+    port = int(os.environ.get('PORT', 5050))
+    logging.getLogger('allfilechanger').info(f'🚀 AllFileChanger Python Backend starting on port {port}')
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
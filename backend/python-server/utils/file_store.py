@@ -0,0 +1,202 @@
+"""File store – short-lived server-side files for multi-step workflows.
+
+``POST /api/files`` stores an upload and returns an id.  Every route that
+takes multipart input also accepts ``file_id`` (repeatable for multi-file
+routes) through the ``accepts_file_ids`` decorator, and any route called
+with ``store=1`` keeps its result here and answers with the new id instead
+of the file.  Entries expire after ``FILE_STORE_TTL`` seconds; total size is
+capped by ``FILE_STORE_QUOTA_MB``.  Data and ``.json`` metadata sit side by
+side in ``FILE_STORE_DIR`` so every gunicorn worker sees the same files.
+"""
+
+from flask import request, jsonify
+from functools import wraps
+from werkzeug.datastructures import FileStorage, MultiDict
+import os, re, json, time, uuid, fcntl, tempfile
+
+STORE_DIR = os.environ.get('FILE_STORE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'allfilechanger-files'))
+FILE_TTL = int(os.environ.get('FILE_STORE_TTL', 3600))
+QUOTA_BYTES = int(float(os.environ.get('FILE_STORE_QUOTA_MB', 1024)) * 1024 * 1024)
+_LOCK = os.path.join(STORE_DIR, '.lock')
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_CHUNK = 1024 * 1024
+
+os.makedirs(STORE_DIR, exist_ok=True)
+
+
+class FileStoreError(Exception):
+    """Base class; ``status`` is the HTTP status to answer with."""
+    status = 400
+
+
+class FileNotStored(FileStoreError):
+    status = 404
+
+
+class QuotaExceeded(FileStoreError):
+    status = 507
+
+
+def _paths(file_id):
+    base = os.path.join(STORE_DIR, file_id)
+    return base, base + '.json'
+
+
+def _public(meta):
+    return {k: meta[k] for k in ('file_id', 'name', 'mimetype', 'size', 'expires')}
+
+
+# ── Storage ─────────────────────────────────────────────────────────────────
+
+def purge_expired():
+    now = time.time()
+    for e in os.scandir(STORE_DIR):
+        if not e.name.endswith('.json'):
+            continue
+        try:
+            with open(e.path) as f:
+                expired = json.load(f)['expires'] < now
+        except (OSError, ValueError, KeyError):
+            expired = True
+        if expired:
+            delete(e.name[:-5])
+
+
+def _used_bytes():
+    total = 0
+    for e in os.scandir(STORE_DIR):
+        if not e.name.startswith('.') and not e.name.endswith('.json'):
+            try:
+                total += e.stat().st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def put(chunks, name, mimetype):
+    """Store an iterable of ``bytes`` chunks; returns the public metadata dict."""
+    file_id = uuid.uuid4().hex
+    data_path, meta_path = _paths(file_id)
+    fd, tmp = tempfile.mkstemp(dir=STORE_DIR, prefix='.tmp-')
+    try:
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                size += len(chunk)
+        # Serialise the quota check so concurrent workers cannot overshoot it
+        with open(_LOCK, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            purge_expired()
+            if _used_bytes() + size > QUOTA_BYTES:
+                raise QuotaExceeded('File store is full, try again later')
+            os.replace(tmp, data_path)
+    except Exception:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+    meta = {'file_id': file_id, 'name': name or 'file', 'mimetype': mimetype,
+            'size': size, 'created': time.time(), 'expires': time.time() + FILE_TTL}
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return _public(meta)
+
+
+def put_file(storage):
+    """Store a werkzeug ``FileStorage`` upload."""
+    return put(iter(lambda: storage.stream.read(_CHUNK), b''),
+               storage.filename, storage.mimetype or 'application/octet-stream')
+
+
+def get(file_id):
+    """``(data_path, meta)`` for a live entry; raises ``FileNotStored`` otherwise."""
+    if not _ID_RE.match(file_id or ''):
+        raise FileNotStored(f'Unknown file_id {file_id!r}')
+    data_path, meta_path = _paths(file_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise FileNotStored(f'Unknown file_id {file_id!r}') from None
+    if meta['expires'] < time.time() or not os.path.exists(data_path):
+        delete(file_id)
+        raise FileNotStored(f'file_id {file_id!r} has expired')
+    return data_path, _public(meta)
+
+
+def delete(file_id):
+    for p in _paths(file_id):
+        try: os.unlink(p)
+        except OSError: pass
+
+
+def open_upload(file_id):
+    """A ``FileStorage`` reading the stored file, indistinguishable from an upload."""
+    data_path, meta = get(file_id)
+    return FileStorage(stream=open(data_path, 'rb'), filename=meta['name'],
+                       content_type=meta['mimetype'])
+
+
+def stats():
+    """Entry count and size for /health."""
+    try:
+        count = sum(1 for e in os.scandir(STORE_DIR) if e.name.endswith('.json'))
+        return {'files': count, 'size_mb': round(_used_bytes() / (1024 * 1024), 1),
+                'quota_mb': round(QUOTA_BYTES / (1024 * 1024))}
+    except OSError:
+        return {}
+
+
+# ── Request integration ─────────────────────────────────────────────────────
+
+def accepts_file_ids(field):
+    """Route decorator: ``file_id`` values become uploads in ``request.files[field]``.
+
+    Stored files are appended after any real uploads, so routes keep
+    reading ``request.files`` exactly as before.  Flask closes the injected
+    streams with the request, streamed responses included.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            ids = request.form.getlist('file_id') + request.args.getlist('file_id')
+            if ids:
+                stored = []
+                try:
+                    for i in ids:
+                        stored.append(open_upload(i))
+                except FileStoreError as e:
+                    for f in stored:
+                        f.close()
+                    return jsonify(error=str(e)), e.status
+                files = MultiDict(request.files)
+                files.setlist(field, files.getlist(field) + stored)
+                request.files = files
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wants_store():
+    flag = request.args.get('store') or request.form.get('store') or ''
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def store_response(response):
+    """Replace a successful file response with the id of its stored copy."""
+    disposition = response.headers.get('Content-Disposition', '')
+    if response.status_code != 200 or 'attachment' not in disposition:
+        return response
+    match = re.search(r'filename="?([^";]+)"?', disposition)
+    try:
+        resp = jsonify(put(response.iter_encoded(), match.group(1) if match else None,
+                           response.mimetype))
+        resp.status_code = 201
+    except QuotaExceeded as e:
+        resp = jsonify(error=str(e))
+        resp.status_code = e.status
+    finally:
+        response.close()  # runs cleanup callbacks, e.g. temp result files
+    return resp
@@ -0,0 +1,240 @@
+"""Async jobs – SQLite-backed job table + bounded local process pool.
+
+Slow routes accept ``async=1`` and, instead of converting inline, save their
+input into a job directory and hand a top-level conversion function to
+``submit()``.  The function runs in a worker process; status, progress and
+the result path live in a SQLite database in ``JOBS_DIR`` so any gunicorn
+worker can answer ``GET /api/jobs/<id>``.
+
+The pool belongs to the gunicorn worker that accepted the job, and workers
+exit all the time (``--max-requests`` recycling, timeouts, OOM kills).
+Every job therefore records its owner – the worker while it is queued,
+the pool process once it runs – and jobs whose owner is gone are failed
+at startup and whenever they are read, instead of being polled forever.
+"""
+
+from flask import request, jsonify, url_for
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from utils import pools
+import os, time, uuid, shutil, socket, sqlite3, tempfile, logging, psutil
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'allfilechanger-jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 20))
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))   # seconds a job and its files are kept
+_DB = os.path.join(JOBS_DIR, 'jobs.db')
+_HOST = socket.gethostname()
+_ORPHANED = 'The server process running this job exited; please resubmit'
+
+os.makedirs(JOBS_DIR, exist_ok=True)
+
+
+class QueueFull(Exception):
+    """Too many jobs are already queued or running."""
+
+
+# ── Storage ─────────────────────────────────────────────────────────────────
+
+@contextmanager
+def _connect():
+    conn = sqlite3.connect(_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _init_db():
+    with _connect() as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            op TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            result_path TEXT,
+            mimetype TEXT,
+            download_name TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL,
+            owner TEXT
+        )''')
+        if 'owner' not in [r['name'] for r in conn.execute('PRAGMA table_info(jobs)')]:
+            try:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+
+
+# ── Owners ──────────────────────────────────────────────────────────────────
+
+def _owner():
+    """This process as ``host:pid:start time`` – the start time tells reused pids apart."""
+    proc = psutil.Process()
+    return f'{_HOST}:{proc.pid}:{proc.create_time()}'
+
+
+def _owner_alive(owner):
+    try:
+        host, pid, started = owner.rsplit(':', 2)
+        if host != _HOST:
+            return True   # another machine sharing JOBS_DIR judges its own jobs
+        return abs(psutil.Process(int(pid)).create_time() - float(started)) < 0.01
+    except psutil.NoSuchProcess:
+        return False
+    except (AttributeError, ValueError):
+        return True       # no owner recorded: left to the JOB_TTL purge
+
+
+def _fail_orphans(job_id=None):
+    """Mark queued/running jobs (all, or just *job_id*) failed if their owner has exited."""
+    query = "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')"
+    params = ()
+    if job_id is not None:
+        query, params = query + ' AND id = ?', (job_id,)
+    with _connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+        for row in rows:
+            if not _owner_alive(row['owner']):
+                # Conditional, so a job that moved on meanwhile is left alone
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated = ? "
+                    "WHERE id = ? AND owner = ? AND status IN ('queued', 'running')",
+                    (_ORPHANED, time.time(), row['id'], row['owner']))
+                logger.warning(f'Job {row["id"]} orphaned by {row["owner"]}')
+
+_init_db()
+_fail_orphans()
+
+
+def _update(job_id, **fields):
+    fields['updated'] = time.time()
+    cols = ', '.join(f'{k} = ?' for k in fields)
+    with _connect() as conn:
+        conn.execute(f'UPDATE jobs SET {cols} WHERE id = ?', (*fields.values(), job_id))
+
+
+def get(job_id):
+    _fail_orphans(job_id)
+    with _connect() as conn:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def _purge_expired():
+    cutoff = time.time() - JOB_TTL
+    with _connect() as conn:
+        rows = conn.execute(
+            'SELECT id FROM jobs WHERE updated < ?',
+            (cutoff,)).fetchall()
+        for row in rows:
+            shutil.rmtree(os.path.join(JOBS_DIR, row['id']), ignore_errors=True)
+            conn.execute('DELETE FROM jobs WHERE id = ?', (row['id'],))
+
+
+def _pending():
+    _fail_orphans()
+    with _connect() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+
+# ── Worker side ─────────────────────────────────────────────────────────────
+
+_current_job = None
+
+
+def progress(fraction):
+    """Report progress (0-1) from inside a job; a no-op for synchronous calls."""
+    if _current_job is not None:
+        try:
+            _update(_current_job, progress=round(min(max(fraction, 0.0), 1.0), 3))
+        except sqlite3.Error:
+            pass
+
+
+def _run(job_id, fn, args):
+    global _current_job
+    _current_job = job_id
+    _update(job_id, status='running', owner=_owner())
+    try:
+        result_path = fn(*args)
+        if not result_path or not os.path.exists(result_path):
+            raise RuntimeError('Job produced no output')
+        _update(job_id, status='done', progress=1.0, result_path=result_path)
+    except Exception as e:
+        logger.exception(f'Job {job_id} failed')
+        _update(job_id, status='failed', error=str(e) or e.__class__.__name__)
+    finally:
+        _current_job = None
+
+
+# ── Submission side ─────────────────────────────────────────────────────────
+
+def wants_async():
+    """True if the caller asked for the async job API (``async=1``)."""
+    flag = request.args.get('async') or request.form.get('async') or ''
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def create(op, mimetype, download_name):
+    """Register a queued job and return ``(job_id, job_dir)`` for its input files."""
+    _purge_expired()
+    if _pending() >= JOB_MAX_PENDING:
+        raise QueueFull('Too many jobs in progress, try again later')
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir)
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            'INSERT INTO jobs (id, op, status, mimetype, download_name, created, updated, owner) '
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, op, mimetype, download_name, now, now, _owner()))
+    return job_id, job_dir
+
+
+def submit(job_id, fn, *args):
+    """Run ``fn(*args)`` in the pool; *fn* must be top-level and return the output path."""
+    future = pools.process_pool('jobs', JOB_WORKERS).submit(_run, job_id, fn, args)
+
+    def _on_done(f):
+        # _run records its own failures; this only catches a dead worker process
+        if f.exception() is not None:
+            _update(job_id, status='failed', error=str(f.exception()))
+            if isinstance(f.exception(), BrokenProcessPool):
+                pools.discard('jobs')
+    future.add_done_callback(_on_done)
+
+
+def accepted(job_id):
+    """202 response pointing the client at the status and result URLs."""
+    status_url = url_for('jobs.job_status', job_id=job_id)
+    resp = jsonify(job_id=job_id, status='queued', status_url=status_url,
+                   result_url=url_for('jobs.job_result', job_id=job_id))
+    resp.status_code = 202
+    resp.headers['Location'] = status_url
+    return resp
+
+
+def start(op, save_input, fn, mimetype, download_name, in_name, out_name, *extra):
+    """Create a job, let *save_input* write the upload into it, then submit ``fn``.
+
+    ``fn`` is called as ``fn(in_path, out_path, *extra)`` in a worker process.
+    """
+    try:
+        job_id, job_dir = create(op, mimetype, download_name)
+    except QueueFull as e:
+        resp = jsonify(error=str(e))
+        resp.status_code = 503
+        resp.headers['Retry-After'] = '30'
+        return resp
+    in_path = os.path.join(job_dir, in_name)
+    save_input(in_path)
+    submit(job_id, fn, in_path, os.path.join(job_dir, out_name), *extra)
+    return accepted(job_id)
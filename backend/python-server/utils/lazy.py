@@ -0,0 +1,80 @@
+"""Lazy imports – heavy converter libraries load on first use, not at boot.
+
+Route modules bind ``pd = lazy.module('pandas')`` instead of importing
+pandas, tabula, pdf2docx (PyMuPDF, OpenCV), python-pptx, python-docx,
+docxcompose, openpyxl, pdf2image, pytesseract or img2pdf at module level.
+The real import happens on the first attribute access, so a worker that
+only ever merges PDFs never pays for them – nor do the ``spawn`` pool
+children, which re-import route modules.
+
+Under ``gunicorn --preload`` the master calls ``preload()`` before forking
+(see ``gunicorn.conf.py``), so every worker shares those pages
+copy-on-write instead of importing its own copy.
+"""
+
+import sys, time, logging, importlib, threading
+
+logger = logging.getLogger(__name__)
+
+_modules = {}        # name → _LazyModule, in registration order
+_timings = {}        # name → import time in ms, for modules actually loaded
+_lock = threading.Lock()
+
+
+class _LazyModule:
+    __slots__ = ('_name', '_module')
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # importlib serialises concurrent imports of one module itself
+            already = self._name in sys.modules
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            if not already and self._name not in _timings:
+                _timings[self._name] = round((time.perf_counter() - start) * 1000, 1)
+                logger.info('Imported %s in %.0f ms', self._name, _timings[self._name])
+            self._module = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'deferred'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def module(name):
+    """A stand-in for ``import name`` that imports on first attribute access."""
+    with _lock:
+        if name not in _modules:
+            _modules[name] = _LazyModule(name)
+        return _modules[name]
+
+
+def preload():
+    """Import every registered module now; returns ``{name: ms}`` for those that were new."""
+    before = set(_timings)
+    for name, lazy in list(_modules.items()):
+        try:
+            lazy._load()
+        except ImportError as e:
+            logger.warning('Preload of %s failed: %s', name, e)
+    loaded = {name: ms for name, ms in _timings.items() if name not in before}
+    if loaded:
+        logger.info('Preloaded %d modules in %.0f ms (%s)', len(loaded), sum(loaded.values()),
+                    ', '.join(f'{n} {ms:.0f}' for n, ms in sorted(loaded.items(), key=lambda i: -i[1])))
+    return loaded
+
+
+def stats():
+    """Which heavy modules this process has loaded (and how long each took) – for /health."""
+    return {
+        'loaded_ms': dict(_timings),
+        'deferred': [name for name, lazy in _modules.items() if lazy._module is None],
+    }
@@ -0,0 +1,342 @@
+"""LibreOffice pool – long-lived headless soffice instances driven over UNO.
+
+Every LibreOffice-backed route (format-convert, ppt-convert, word-to-pdf,
+word-convert) goes through ``convert()`` instead of spawning a fresh
+``libreoffice --convert-to`` process per request.  Each instance owns its
+own user profile and UNO pipe, is health-checked before use, recycled after
+``LO_MAX_CONVERSIONS`` jobs and killed if a job exceeds its timeout.
+
+When the ``uno`` bindings are not importable (e.g. local development) the
+pool falls back to one-shot ``--convert-to`` runs that still reuse the
+slot's pre-initialised profile, which skips LibreOffice's first-start cost.
+"""
+
+import os, shutil, subprocess, tempfile, threading, queue, time, atexit, logging
+from utils import metrics
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+logger = logging.getLogger(__name__)
+
+LO_POOL_SIZE = int(os.environ.get('LO_POOL_SIZE', 1))
+LO_MAX_CONVERSIONS = int(os.environ.get('LO_MAX_CONVERSIONS', 200))
+LO_TIMEOUT = int(os.environ.get('LO_TIMEOUT', 120))
+LO_START_TIMEOUT = 30
+# Kept outside the request TEMP_DIR so temp-file sweeps never touch profiles
+LO_PROFILE_ROOT = os.path.join(tempfile.gettempdir(), 'allfilechanger-lo')
+
+
+class ConversionError(Exception):
+    """LibreOffice could not convert the document."""
+
+
+class ConversionTimeout(ConversionError):
+    """The conversion did not finish within its timeout."""
+
+
+# Export filter per (document family, target extension)  ────────────────────
+_FILTERS = {
+    'writer': {
+        'pdf':  'writer_pdf_Export',
+        'docx': 'MS Word 2007 XML',
+        'doc':  'MS Word 97',
+        'odt':  'writer8',
+        'rtf':  'Rich Text Format',
+        'txt':  'Text (encoded)',
+        'html': 'HTML (StarWriter)',
+        'epub': 'EPUB',
+    },
+    'calc': {
+        'pdf':  'calc_pdf_Export',
+        'xlsx': 'Calc MS Excel 2007 XML',
+        'xls':  'MS Excel 97',
+        'ods':  'calc8',
+        'csv':  'Text - txt - csv (StarCalc)',
+        'html': 'HTML (StarCalc)',
+    },
+    'impress': {
+        'pdf':  'impress_pdf_Export',
+        'pptx': 'Impress MS PowerPoint 2007 XML',
+        'ppt':  'MS PowerPoint 97',
+        'odp':  'impress8',
+    },
+    'draw': {
+        'pdf':  'draw_pdf_Export',
+        'odg':  'draw8',
+        'png':  'draw_png_Export',
+    },
+}
+
+_FILTER_OPTIONS = {
+    'Text (encoded)': 'UTF8',
+    'Text - txt - csv (StarCalc)': '44,34,76',   # comma, double quote, UTF-8
+}
+
+# Presentation documents also report the drawing service, so check them first
+_FAMILIES = (
+    ('com.sun.star.presentation.PresentationDocument', 'impress'),
+    ('com.sun.star.sheet.SpreadsheetDocument',         'calc'),
+    ('com.sun.star.drawing.DrawingDocument',           'draw'),
+    ('com.sun.star.text.TextDocument',                 'writer'),
+)
+
+
+def _binary():
+    return shutil.which('soffice') or shutil.which('libreoffice')
+
+
+def available():
+    """True if a LibreOffice binary is installed (no process is started)."""
+    return _binary() is not None
+
+
+def _props(**kwargs):
+    out = []
+    for name, value in kwargs.items():
+        p = PropertyValue()
+        p.Name, p.Value = name, value
+        out.append(p)
+    return tuple(out)
+
+
+def _family(doc):
+    for service, family in _FAMILIES:
+        if doc.supportsService(service):
+            return family
+    return None
+
+
+# ── Instance ────────────────────────────────────────────────────────────────
+
+class _Instance:
+    """One headless soffice process with a private profile and UNO pipe."""
+
+    def __init__(self, index):
+        self.index = index
+        self.pipe = f'afc_lo_{os.getpid()}_{index}'
+        self.profile = os.path.join(LO_PROFILE_ROOT, f'{os.getpid()}_{index}')
+        self.proc = None
+        self.desktop = None
+        self.conversions = 0
+        self.timed_out = False
+
+    @property
+    def _profile_url(self):
+        return 'file://' + self.profile
+
+    def start(self):
+        os.makedirs(self.profile, exist_ok=True)
+        self.conversions = 0
+        if uno is None:
+            return  # one-shot mode: nothing to keep running
+        started = time.monotonic()
+        self.proc = subprocess.Popen(
+            [_binary(), '--headless', '--invisible', '--nologo', '--nodefault',
+             '--norestore', '--nolockcheck',
+             f'-env:UserInstallation={self._profile_url}',
+             f'--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = started + LO_START_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(
+                    f'uno:pipe,name={self.pipe};urp;StarOffice.ComponentContext')
+                break
+            except NoConnectException:
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise ConversionError('LibreOffice failed to start')
+                time.sleep(0.25)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext(
+            'com.sun.star.frame.Desktop', ctx)
+        logger.info(f'LibreOffice instance {self.index} ready in '
+                    f'{time.monotonic() - started:.1f}s (pid {self.proc.pid})')
+
+    def stop(self):
+        if self.desktop is not None:
+            try: self.desktop.terminate()
+            except Exception: pass
+            self.desktop = None
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.terminate()
+                try: self.proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+                    self.proc.wait()
+            self.proc = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def healthy(self):
+        if uno is None:
+            return os.path.isdir(self.profile)
+        if self.proc is None or self.proc.poll() is not None or self.desktop is None:
+            return False
+        try:
+            self.desktop.getFrames()  # cheap UNO round-trip
+            return True
+        except Exception:
+            return False
+
+    def _kill(self):
+        self.timed_out = True
+        if self.proc is not None:
+            self.proc.kill()
+
+    def convert(self, in_path, out_path, target, timeout):
+        self.timed_out = False
+        with metrics.timed('libreoffice'):
+            if uno is None:
+                self._convert_oneshot(in_path, out_path, target, timeout)
+            else:
+                # A stuck UNO call cannot be interrupted, so kill the process
+                # instead; the pending call then fails and the slot restarts.
+                timer = threading.Timer(timeout, self._kill)
+                timer.start()
+                try:
+                    self._convert_uno(in_path, out_path, target)
+                except Exception as e:
+                    if self.timed_out:
+                        raise ConversionTimeout('Conversion timed out') from e
+                    raise
+                finally:
+                    timer.cancel()
+        self.conversions += 1
+
+    def _convert_uno(self, in_path, out_path, target):
+        doc = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(in_path), '_blank', 0,
+            _props(Hidden=True, ReadOnly=True))
+        if doc is None:
+            raise ConversionError('LibreOffice could not open the document')
+        try:
+            family = _family(doc)
+            flt = _FILTERS.get(family, {}).get(target)
+            if not flt:
+                raise ConversionError(f'Cannot convert {family or "this"} document to {target}')
+            opts = {'FilterName': flt, 'Overwrite': True}
+            if flt in _FILTER_OPTIONS:
+                opts['FilterOptions'] = _FILTER_OPTIONS[flt]
+            doc.storeToURL(uno.systemPathToFileUrl(out_path), _props(**opts))
+        finally:
+            try: doc.close(True)
+            except Exception: pass
+
+    def _convert_oneshot(self, in_path, out_path, target, timeout):
+        out_dir = os.path.dirname(out_path)
+        try:
+            subprocess.run(
+                [_binary(), '--headless', '--norestore',
+                 f'-env:UserInstallation={self._profile_url}',
+                 '--convert-to', target, '--outdir', out_dir, in_path],
+                capture_output=True, timeout=timeout, check=True
+            )
+        except subprocess.TimeoutExpired as e:
+            raise ConversionTimeout('Conversion timed out') from e
+        except subprocess.CalledProcessError as e:
+            raise ConversionError(e.stderr.decode('utf-8', 'replace').strip()
+                                  or 'LibreOffice conversion failed') from e
+        produced = os.path.join(out_dir, os.path.splitext(os.path.basename(in_path))[0] + '.' + target)
+        if produced != out_path and os.path.exists(produced):
+            os.replace(produced, out_path)
+
+
+# ── Pool ────────────────────────────────────────────────────────────────────
+
+class LibreOfficePool:
+    """Fixed-size pool of lazily started ``_Instance`` objects."""
+
+    def __init__(self, size=LO_POOL_SIZE, max_conversions=LO_MAX_CONVERSIONS, timeout=LO_TIMEOUT):
+        self.max_conversions = max_conversions
+        self.timeout = timeout
+        self._instances = [_Instance(i) for i in range(max(1, size))]
+        self._idle = queue.Queue()
+        for inst in self._instances:
+            self._idle.put(inst)
+
+    def convert(self, in_path, target, timeout=None):
+        """Convert *in_path* to *target* next to it and return the output path."""
+        if not available():
+            raise ConversionError('LibreOffice not available on server')
+        timeout = timeout or self.timeout
+        target = target.lower().lstrip('.')
+        out_path = os.path.splitext(in_path)[0] + '.' + target
+        if os.path.abspath(out_path) == os.path.abspath(in_path):
+            raise ConversionError(f'Document is already {target}')
+
+        try:
+            inst = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ConversionTimeout('No LibreOffice instance became available')
+        try:
+            if not inst.healthy():
+                inst.restart()
+            inst.convert(in_path, out_path, target, timeout)
+        except ConversionTimeout:
+            inst.stop()
+            raise
+        except Exception:
+            if not inst.healthy():
+                inst.stop()
+            raise
+        finally:
+            if inst.conversions >= self.max_conversions:
+                logger.info(f'Recycling LibreOffice instance {inst.index} '
+                            f'after {inst.conversions} conversions')
+                inst.stop()
+                inst.conversions = 0
+            self._idle.put(inst)
+
+        if not os.path.exists(out_path):
+            raise ConversionError('Conversion produced no output')
+        return out_path
+
+    def shutdown(self):
+        for inst in self._instances:
+            inst.stop()
+            shutil.rmtree(inst.profile, ignore_errors=True)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Per-process pool; rebuilt after fork so workers never share soffice pipes."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = LibreOfficePool()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def convert(in_path, target, timeout=None):
+    return get_pool().convert(in_path, target, timeout)
+
+
+def convert_job(in_path, out_path, target):
+    """Async job entry point: convert *in_path* and move the result to *out_path*."""
+    produced = convert(in_path, target)
+    if produced != out_path:
+        os.replace(produced, out_path)
+    return out_path
+
+
+@atexit.register
+def _shutdown():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown()
@@ -0,0 +1,318 @@
+"""Memory governor – admit requests against a machine-wide memory budget.
+
+Every POST is charged an estimated cost before its view runs:
+``GOVERNOR_BASE_MB + input MB × factor``.  The factor starts from a
+per-endpoint default and is learned from the peak RSS seen while a request
+of that endpoint ran alone.  Requests that do not fit in
+``MEMORY_BUDGET_MB`` wait up to ``ADMISSION_WAIT_S`` for running ones to
+finish, then get 503 with ``Retry-After``.  A machine with nothing in
+flight always admits, so one oversized upload can still run.
+
+Production runs sync gunicorn workers, one request each, so the budget
+cannot live in a worker: reservations are kept in a ledger file in
+``GOVERNOR_DIR`` that every worker updates under ``flock``.  The directory
+must be local to the host (or container) – entries of workers that died
+are dropped by checking their pid.  Waiting requests poll the ledger and
+keep their worker busy while they wait.
+
+Costs are released when the WSGI server closes the response, i.e. after
+streamed and file responses have been fully sent.
+
+GC is tuned once at boot (thresholds + ``gc.freeze()``) instead of being
+forced after every request; only requests that used a lot of memory are
+followed by a full collection.
+"""
+
+from flask import request, jsonify
+from contextlib import contextmanager
+from utils import file_store, metrics
+from utils.streaming import on_close
+import os, gc, json, math, time, uuid, fcntl, tempfile, threading, psutil
+
+MEMORY_BUDGET_MB = float(os.environ.get('MEMORY_BUDGET_MB', 320))
+ADMISSION_WAIT_S = float(os.environ.get('ADMISSION_WAIT_S', 15))
+BASE_MB = float(os.environ.get('GOVERNOR_BASE_MB', 8))
+GC_AFTER_MB = float(os.environ.get('GC_AFTER_MB', 64))
+GC_THRESHOLDS = os.environ.get('GC_THRESHOLDS', '20000,20,20')
+GOVERNOR_DIR = os.environ.get('GOVERNOR_DIR') or os.path.join(tempfile.gettempdir(), 'allfilechanger-governor')
+
+_MB = 1024 * 1024
+_ENVIRON_KEY = 'allfilechanger.admission'
+_EXEMPT_BLUEPRINTS = ('files', 'jobs')   # streaming copies and polling, not conversions
+_SMALL_BODY = 64 * 1024                  # bodies this small carry no upload, only fields
+_LEARN_RATE = 0.1                        # how fast a factor decays towards lower peaks
+_POLL_S = 0.2                            # how often a waiting request re-reads the ledger
+_LEDGER = os.path.join(GOVERNOR_DIR, 'reservations.json')
+
+os.makedirs(GOVERNOR_DIR, exist_ok=True)
+
+# Peak MB per MB of input until real peaks have been observed
+_DEFAULT_FACTOR = 4.0
+_FACTORS = {
+    'img_to_pdf.image_to_pdf':          8.0,
+    'pdf_compress.compress_pdf':        6.0,
+    'pdf_pipeline.pdf_pipeline':        6.0,
+    'pdf_to_word.pdf_to_word':          12.0,
+    'pdf_to_ppt.pdf_to_ppt':            10.0,
+    'pdf_to_excel.pdf_to_excel':        6.0,
+    'ocr_scanner.scan_image':           10.0,
+    'excel_converter.convert_excel':    6.0,
+    'data_to_excel.data_to_excel':      3.0,
+    'pdf_merge.merge_pdfs':             2.0,
+    'doc_merger.merge_documents':       3.0,
+    'text_extractor.extract_text':      3.0,
+}
+
+
+class _Ticket:
+    __slots__ = ('id', 'endpoint', 'input_mb', 'cost', 'started', 'rss', 'solo', 'status')
+
+    def __init__(self, endpoint, input_mb, cost):
+        self.id = f'{os.getpid()}-{uuid.uuid4().hex}'
+        self.endpoint, self.input_mb, self.cost = endpoint, input_mb, cost
+        self.started = time.monotonic()
+        self.rss = 0
+        self.solo = False
+        self.status = None
+
+
+_lock = threading.Lock()
+_in_flight = set()      # this worker's requests; peaks are per process
+_factors = dict(_FACTORS)
+_durations = {}
+_counts = {'admitted': 0, 'queued': 0, 'rejected': 0}
+
+
+# ── Memory probes ───────────────────────────────────────────────────────────
+
+def _rss():
+    return psutil.Process().memory_info().rss
+
+
+def _reset_peak():
+    """Reset the kernel's RSS high-water mark (Linux); harmless elsewhere."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return _rss()
+
+
+# ── Machine-wide ledger ─────────────────────────────────────────────────────
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _ledger():
+    """All reservations on this machine, ``{id: {pid, endpoint, cost, started}}``, locked for update."""
+    with open(_LEDGER, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            entries = json.loads(f.read() or '{}')
+        except ValueError:
+            entries = {}
+        # A worker killed on timeout or OOM never releases; its reservations go with it
+        entries = {k: e for k, e in entries.items() if _alive(e['pid'])}
+        yield entries
+        f.seek(0)
+        f.truncate()
+        json.dump(entries, f)
+
+
+def release_pid(pid):
+    """Drop every reservation of worker *pid* (gunicorn ``child_exit``)."""
+    with _ledger() as entries:
+        for k in [k for k, e in entries.items() if e['pid'] == pid]:
+            del entries[k]
+
+
+def reset():
+    """Forget all reservations; called once by the gunicorn master at startup."""
+    try: os.unlink(_LEDGER)
+    except OSError: pass
+
+
+# ── Admission ───────────────────────────────────────────────────────────────
+
+def _input_bytes():
+    size = request.content_length or 0
+    ids = request.args.getlist('file_id')
+    if size <= _SMALL_BODY:
+        ids += request.form.getlist('file_id')  # parsed once, cached for the view
+    for file_id in ids:
+        try:
+            size += file_store.get(file_id)[1]['size']
+        except file_store.FileStoreError:
+            pass  # the route reports it
+    return size
+
+
+def _fits(entries, cost):
+    return not entries or sum(e['cost'] for e in entries.values()) + cost <= MEMORY_BUDGET_MB
+
+
+def _retry_after(entries):
+    """Seconds until the soonest in-flight request is expected to finish."""
+    now = time.time()
+    left = [_durations.get(e['endpoint'], 5.0) - (now - e['started']) for e in entries.values()]
+    return max(1, min(60, math.ceil(min(left, default=1))))
+
+
+def _count(name):
+    with _lock:
+        _counts[name] += 1
+
+
+def admit():
+    """``before_request`` hook: reserve the request's estimated cost or answer 503."""
+    if request.method != 'POST' or request.endpoint is None \
+            or request.blueprint in _EXEMPT_BLUEPRINTS:
+        return None
+    input_mb = _input_bytes() / _MB
+    cost = BASE_MB + input_mb * _factors.get(request.endpoint, _DEFAULT_FACTOR)
+    ticket = _Ticket(request.endpoint, input_mb, cost)
+    deadline = time.monotonic() + ADMISSION_WAIT_S
+
+    queued = False
+    while True:
+        with _ledger() as entries:
+            if _fits(entries, cost):
+                entries[ticket.id] = {'pid': os.getpid(), 'endpoint': ticket.endpoint,
+                                      'cost': cost, 'started': time.time()}
+                break
+            retry_after = _retry_after(entries)
+        if not queued:
+            _count('queued')
+            queued = True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _count('rejected')
+            resp = jsonify(error='Server is busy, please retry shortly')
+            resp.status_code = 503
+            resp.headers['Retry-After'] = str(retry_after)
+            return resp
+        time.sleep(min(_POLL_S, remaining))
+
+    with _lock:
+        if not _in_flight:
+            _reset_peak()
+            ticket.solo = True
+        for other in _in_flight:
+            other.solo = False  # overlapping peaks cannot be attributed
+        ticket.rss = _rss()
+        _in_flight.add(ticket)
+        _counts['admitted'] += 1
+    request.environ[_ENVIRON_KEY] = ticket
+    return None
+
+
+def note_status(response):
+    """``after_request`` hook: only successful requests teach the cost model."""
+    ticket = request.environ.get(_ENVIRON_KEY)
+    if ticket is not None:
+        ticket.status = response.status_code
+    return response
+
+
+def _learn(ticket, elapsed):
+    prev = _durations.get(ticket.endpoint)
+    _durations[ticket.endpoint] = elapsed if prev is None else prev + (elapsed - prev) * _LEARN_RATE
+    peak = _peak_rss() - ticket.rss
+    metrics.observe_peak(ticket.endpoint, peak)
+    if ticket.input_mb < 1:
+        return  # fixed overhead dominates; says nothing about the per-MB factor
+    observed = max(0.0, peak / _MB - BASE_MB) / ticket.input_mb
+    factor = _factors.get(ticket.endpoint, _DEFAULT_FACTOR)
+    # Rise to a new peak at once, relax towards lower ones slowly
+    _factors[ticket.endpoint] = observed if observed > factor else factor + (observed - factor) * _LEARN_RATE
+
+
+def _release(ticket):
+    with _lock:
+        if ticket not in _in_flight:
+            return
+        _in_flight.discard(ticket)
+        if ticket.solo and ticket.status == 200:
+            _learn(ticket, time.monotonic() - ticket.started)
+        idle = not _in_flight
+    with _ledger() as entries:
+        entries.pop(ticket.id, None)
+    if idle and ticket.cost >= GC_AFTER_MB:
+        gc.collect()  # big PyPDF2/openpyxl object graphs are full of cycles
+
+
+class ReleaseOnClose:
+    """WSGI middleware: release a request's reservation once the server closes its response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            ticket = environ.get(_ENVIRON_KEY)
+            if ticket is not None:
+                _release(ticket)
+            raise
+        ticket = environ.get(_ENVIRON_KEY)
+        if ticket is None:
+            return body
+        return on_close(environ, body, lambda sent: _release(ticket))
+
+
+def install(app):
+    app.before_request(admit)
+    app.after_request(note_status)
+    app.wsgi_app = ReleaseOnClose(app.wsgi_app)
+
+
+# ── GC tuning ───────────────────────────────────────────────────────────────
+
+def tune_gc():
+    """Freeze the boot-time heap and raise GC thresholds; call once the app is imported.
+
+    Frozen objects (modules, routes, library state) are never scanned
+    again, and under ``gunicorn --preload`` their pages stay shared with
+    the workers instead of being dirtied by collections.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(*(int(n) for n in GC_THRESHOLDS.split(',')))
+
+
+def stats():
+    """Budget (machine-wide) and this worker's counters and learned costs for /health."""
+    with _ledger() as entries:
+        reserved = sum(e['cost'] for e in entries.values())
+        machine = len(entries)
+    with _lock:
+        return {
+            'budget_mb': MEMORY_BUDGET_MB,
+            'reserved_mb': round(reserved, 1),
+            'in_flight': machine,
+            'worker_in_flight': len(_in_flight),
+            **_counts,
+            'factors': {k: round(v, 2) for k, v in sorted(_factors.items())},
+            'gc_thresholds': gc.get_threshold(),
+        }
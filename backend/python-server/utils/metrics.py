@@ -0,0 +1,179 @@
+"""Metrics – Prometheus counters and histograms behind ``GET /metrics``.
+
+Every gunicorn worker (and every pool process it spawns) writes its samples
+to files in ``PROMETHEUS_MULTIPROC_DIR``; ``/metrics`` merges them, so any
+worker answers for the whole deployment.  ``gunicorn.conf.py`` empties the
+directory when the master starts and retires dead workers' files.
+
+Requests are observed when the WSGI server closes the response, so streamed
+and file responses count their full transfer time and size.  Without
+``prometheus-client`` installed every hook is a no-op and ``/metrics``
+answers 503.
+"""
+
+from flask import request, jsonify, Response
+from contextlib import contextmanager
+from utils.streaming import on_close
+import os, time, shutil, tempfile
+
+# Must be set before prometheus_client is imported
+METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'allfilechanger-metrics'))
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+try:
+    from prometheus_client import (CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST,
+                                   generate_latest, multiprocess)
+except ImportError:  # metrics are optional
+    multiprocess = None
+
+_ENVIRON_KEY = 'allfilechanger.metrics'
+_LATENCY_BUCKETS = (.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+_BYTES_BUCKETS = tuple(2 ** n for n in range(10, 28, 2))   # 1 KB … 128 MB
+
+if multiprocess is not None:
+    REQUESTS = Counter('http_requests_total', 'Requests handled',
+                       ['blueprint', 'endpoint', 'method', 'status'])
+    ERRORS = Counter('http_request_errors_total', 'Failed requests by error type',
+                     ['blueprint', 'endpoint', 'type'])
+    LATENCY = Histogram('http_request_duration_seconds', 'Time until the response was fully sent',
+                        ['blueprint', 'endpoint'], buckets=_LATENCY_BUCKETS)
+    CPU = Histogram('http_request_cpu_seconds', 'CPU time of the request thread',
+                    ['blueprint', 'endpoint'], buckets=_LATENCY_BUCKETS)
+    REQUEST_BYTES = Histogram('http_request_size_bytes', 'Request body size',
+                              ['blueprint', 'endpoint'], buckets=_BYTES_BUCKETS)
+    RESPONSE_BYTES = Histogram('http_response_size_bytes', 'Response body size',
+                               ['blueprint', 'endpoint'], buckets=_BYTES_BUCKETS)
+    PEAK_RSS = Histogram('http_request_peak_rss_bytes',
+                         'Peak RSS growth of requests that ran alone in their worker',
+                         ['endpoint'], buckets=tuple(2 ** n for n in range(20, 32)))
+    TOOL_SECONDS = Histogram('subprocess_duration_seconds',
+                             'Time spent in external tools (LibreOffice, tesseract, JVM, poppler)',
+                             ['tool', 'outcome'], buckets=_LATENCY_BUCKETS)
+
+
+class _Sample:
+    __slots__ = ('started', 'cpu', 'blueprint', 'endpoint', 'method', 'status',
+                 'error', 'length', 'request_bytes')
+
+    def __init__(self, method, request_bytes):
+        self.started = time.perf_counter()
+        self.cpu = time.thread_time()
+        self.blueprint = self.endpoint = 'unmatched'
+        self.method = method
+        self.status = None
+        self.error = None
+        self.length = None
+        self.request_bytes = request_bytes
+
+
+# ── Request hooks ───────────────────────────────────────────────────────────
+
+def _labels(sample):
+    return sample.blueprint, sample.endpoint
+
+
+def _finish(sample, sent):
+    if sample.status is None:
+        sample.status, sample.error = 500, sample.error or 'unhandled'
+    REQUESTS.labels(*_labels(sample), sample.method, str(sample.status)).inc()
+    if sample.status >= 400:
+        ERRORS.labels(*_labels(sample), sample.error or f'http_{sample.status}').inc()
+    LATENCY.labels(*_labels(sample)).observe(time.perf_counter() - sample.started)
+    CPU.labels(*_labels(sample)).observe(max(0.0, time.thread_time() - sample.cpu))
+    REQUEST_BYTES.labels(*_labels(sample)).observe(sample.request_bytes)
+    size = sent if sent is not None else sample.length
+    if size is not None:
+        RESPONSE_BYTES.labels(*_labels(sample)).observe(size)
+
+
+class Observe:
+    """WSGI middleware: one sample per request, recorded when the response is closed."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        sample = _Sample(environ.get('REQUEST_METHOD', ''),
+                         int(environ.get('CONTENT_LENGTH') or 0))
+        environ[_ENVIRON_KEY] = sample
+
+        def _start_response(status, headers, exc_info=None):
+            sample.status = int(status.split(' ', 1)[0])
+            for k, v in headers:
+                if k.lower() == 'content-length':
+                    sample.length = int(v)
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.app(environ, _start_response)
+        except BaseException as e:
+            sample.error = type(e).__name__
+            _finish(sample, None)
+            raise
+        return on_close(environ, body, lambda sent: _finish(sample, sent))
+
+
+def _route(response):
+    """``after_request`` hook: label the sample with the matched route."""
+    sample = request.environ.get(_ENVIRON_KEY)
+    if sample is not None and request.endpoint:
+        sample.blueprint = request.blueprint or 'app'
+        sample.endpoint = request.endpoint
+    return response
+
+
+def record_error(exception):
+    """Keep the type of an exception that reached the app's error handler."""
+    sample = request.environ.get(_ENVIRON_KEY)
+    if sample is not None:
+        sample.error = type(exception).__name__
+
+
+def install(app):
+    if multiprocess is None:
+        return
+    app.after_request(_route)
+    app.wsgi_app = Observe(app.wsgi_app)
+
+
+# ── Other observations ──────────────────────────────────────────────────────
+
+@contextmanager
+def timed(tool):
+    """Time a call into an external tool: ``with metrics.timed('tesseract'): ...``."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        if multiprocess is not None:
+            TOOL_SECONDS.labels(tool, outcome).observe(time.perf_counter() - started)
+
+
+def observe_peak(endpoint, peak_bytes):
+    if multiprocess is not None:
+        PEAK_RSS.labels(endpoint).observe(max(0, peak_bytes))
+
+
+# ── Exposition & lifecycle ──────────────────────────────────────────────────
+
+def exposition():
+    """The ``/metrics`` response, merged across every process writing to METRICS_DIR."""
+    if multiprocess is None:
+        return jsonify(error='Metrics need the prometheus-client package'), 503
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=METRICS_DIR)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def reset_dir():
+    """Start a deployment with no samples left over from earlier runs."""
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def mark_process_dead(pid):
+    if multiprocess is not None:
+        multiprocess.mark_process_dead(pid, METRICS_DIR)
@@ -0,0 +1,41 @@
+"""Page ranges – parse ``pages=`` specs like ``1-3,7,10-`` into page indices."""
+
+
+class PageRangeError(ValueError):
+    """The ``pages=`` spec is malformed or outside the document."""
+
+
+def parse(spec, total):
+    """Return 0-based page indices for a 1-based *spec*, in the order given.
+
+    ``None`` or an empty spec selects every page.  Open ranges are allowed
+    (``-5`` = first five pages, ``10-`` = page 10 to the end).  Raises
+    ``PageRangeError`` for malformed or out-of-range specs.
+    """
+    if spec is None or not str(spec).strip():
+        return list(range(total))
+    indices = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                lo, hi = (s.strip() for s in part.split('-', 1))
+                start = int(lo) if lo else 1
+                end = int(hi) if hi else total
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise PageRangeError(f'Invalid page range "{part}"') from None
+        if start < 1 or end > total or start > end:
+            raise PageRangeError(f'Page range "{part}" is outside 1-{total}')
+        indices.extend(range(start - 1, end))
+    if not indices:
+        raise PageRangeError('No pages selected')
+    return indices
+
+
+def chunks(indices, size):
+    """Split *indices* into consecutive lists of at most *size* pages."""
+    return [indices[i:i + size] for i in range(0, len(indices), size)]
@@ -0,0 +1,39 @@
+"""Process pools – lazily created, per-process, named executors.
+
+Each gunicorn worker gets its own pools on first use (they are rebuilt after
+a fork).  Children are started with ``spawn`` so they never inherit Flask's
+threads or locks.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os, threading, multiprocessing
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def cpu_count():
+    """CPUs this process may actually run on (respects affinity / cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def process_pool(name, max_workers):
+    """Return the executor called *name* for this process, creating it if needed."""
+    with _lock:
+        entry = _pools.get(name)
+        if entry is None or entry[0] != os.getpid():
+            executor = ProcessPoolExecutor(max_workers=max(1, max_workers),
+                                           mp_context=multiprocessing.get_context('spawn'))
+            entry = _pools[name] = (os.getpid(), executor)
+        return entry[1]
+
+
+def discard(name):
+    """Drop a pool (e.g. after BrokenProcessPool) so the next call builds a fresh one."""
+    with _lock:
+        entry = _pools.pop(name, None)
+    if entry and entry[0] == os.getpid():
+        entry[1].shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,160 @@
+"""Result cache – content-addressed on-disk cache shared by all gunicorn workers.
+
+Entries are keyed by a SHA-256 of the input bytes + operation name + the
+parameters that influence the output.  Writes go to a temp file in the cache
+directory followed by ``os.replace`` so concurrent workers never observe a
+partial entry.  Hits refresh the entry's mtime and eviction removes the
+oldest entries once the directory exceeds ``RESULT_CACHE_MAX_MB``.
+"""
+
+import os, json, shutil, hashlib, tempfile, fcntl, logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'allfilechanger-cache'))
+MAX_BYTES = int(float(os.environ.get('RESULT_CACHE_MAX_MB', 512)) * 1024 * 1024)
+_STATS = os.path.join(CACHE_DIR, '.stats')
+_EVICT_LOCK = os.path.join(CACHE_DIR, '.evict')
+_CHUNK = 1024 * 1024
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+def enabled():
+    return MAX_BYTES > 0
+
+
+def key_for(op, source, **params):
+    """Cache key for *source* (bytes or a file path) processed by *op* with *params*."""
+    h = hashlib.sha256()
+    h.update(json.dumps([op, params], sort_keys=True, default=str).encode('utf-8'))
+    h.update(b'\0')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _path(key):
+    return os.path.join(CACHE_DIR, key)
+
+
+def get(key):
+    """Return the cached file path for *key*, or None on a miss."""
+    if not enabled():
+        return None
+    path = _path(key)
+    try:
+        os.utime(path)  # LRU: a hit makes the entry the most recent
+    except FileNotFoundError:
+        _bump('misses')
+        return None
+    _bump('hits')
+    return path
+
+
+def put(key, source):
+    """Store *source* (bytes or a file path) under *key* atomically; returns the entry path."""
+    if not enabled():
+        return None
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                out.write(source)
+            else:
+                with open(source, 'rb') as src:
+                    shutil.copyfileobj(src, out, _CHUNK)
+        os.replace(tmp, _path(key))
+    except Exception:
+        try: os.unlink(tmp)
+        except OSError: pass
+        logger.warning('Result cache write failed', exc_info=True)
+        return None
+    _evict()
+    return _path(key)
+
+
+def _entries():
+    out = []
+    for e in os.scandir(CACHE_DIR):
+        if e.name.startswith('.'):
+            continue
+        try:
+            st = e.stat()
+        except FileNotFoundError:
+            continue
+        out.append((st.st_mtime, st.st_size, e.path))
+    return out
+
+
+def _evict():
+    """Drop least-recently-used entries until the cache is back under 90 % of the cap."""
+    with open(_EVICT_LOCK, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # another worker is already evicting
+        entries = _entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= MAX_BYTES:
+            return
+        target = MAX_BYTES * 0.9
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        _bump('evictions', removed)
+
+
+def _bump(field, n=1):
+    """Increment a counter in the shared stats file (flock-serialised across workers)."""
+    try:
+        with open(_STATS, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                stats = json.loads(f.read() or '{}')
+            except ValueError:
+                stats = {}
+            stats[field] = stats.get(field, 0) + n
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(stats))
+    except OSError:
+        pass
+
+
+def stats():
+    """Counters and current size for /health."""
+    try:
+        with open(_STATS) as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            counters = json.loads(f.read() or '{}')
+    except (OSError, ValueError):
+        counters = {}
+    try:
+        entries = _entries()
+    except OSError:
+        entries = []
+    hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+    return {
+        'enabled': enabled(),
+        'hits': hits,
+        'misses': misses,
+        'evictions': counters.get('evictions', 0),
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        'entries': len(entries),
+        'size_mb': round(sum(size for _, size, _ in entries) / (1024 * 1024), 1),
+        'max_mb': round(MAX_BYTES / (1024 * 1024)),
+    }
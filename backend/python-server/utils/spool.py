@@ -0,0 +1,127 @@
+"""Spool – read uploads without copying them into memory.
+
+Multipart parts larger than ``UPLOAD_SPOOL_KB`` are written straight to a
+temporary file while the request is parsed.  ``open_input`` then hands
+PyPDF2, python-docx, openpyxl, pandas and Pillow a read-only ``mmap`` of
+that file instead of ``BytesIO(f.read())``: the mapping is backed by the
+page cache, so a request's private memory is the parser's working set
+rather than two or three copies of the upload.  Small parts stay in
+memory and are passed through as they are; ``file_id`` inputs are mapped
+from the file store directly.
+"""
+
+from flask import Request, g
+import io, os, mmap, tempfile
+
+SPOOL_BYTES = int(float(os.environ.get('UPLOAD_SPOOL_KB', 512)) * 1024)
+SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+
+
+class SpoolingRequest(Request):
+    """Spools every upload above ``SPOOL_BYTES`` to ``SPOOL_DIR``."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='rb+', dir=SPOOL_DIR)
+
+
+class MappedFile(io.RawIOBase):
+    """Read-only, seekable file object over an ``mmap`` of *fileobj* – no copy of the data.
+
+    ``getbuffer()`` and ``getvalue()`` mirror ``BytesIO`` so callers can use
+    either kind of input.
+    """
+
+    def __init__(self, fileobj):
+        super().__init__()
+        if fileobj.writable():
+            fileobj.flush()     # the spool's write buffer must reach the file first
+        self._mm = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._mm.read(None if size is None or size < 0 else size)
+
+    def readall(self):
+        return self._mm.read()
+
+    def readinto(self, b):
+        data = self._mm.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        line = self._mm.readline()
+        if 0 <= size < len(line):
+            self._mm.seek(size - len(line), os.SEEK_CUR)
+            line = line[:size]
+        return line
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._mm.seek(offset, whence)
+        return self._mm.tell()
+
+    def tell(self):
+        return self._mm.tell()
+
+    def getbuffer(self):
+        return memoryview(self._mm)
+
+    def getvalue(self):
+        return self._mm[:]
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass    # a memoryview is still alive; the mapping goes with it
+        super().close()
+
+
+def _disk_file(stream):
+    """The on-disk file behind *stream*, or None while it is still in memory."""
+    if hasattr(stream, '_rolled'):          # SpooledTemporaryFile
+        return stream._file if stream._rolled else None
+    try:
+        stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return stream
+
+
+def open_input(storage):
+    """A seekable, read-only file object over an upload (``FileStorage``), positioned at 0.
+
+    Disk-backed uploads are mapped, in-memory ones returned as they are –
+    either way something with ``getbuffer()``/``getvalue()``.  An empty file
+    cannot be mapped and comes back as an empty ``BytesIO``.
+    The object stays valid until the request ends – including while a
+    streamed response is being sent – and is closed in teardown.
+    """
+    stream = storage.stream
+    disk = _disk_file(stream)
+    if disk is not None:
+        if not os.fstat(disk.fileno()).st_size:
+            return io.BytesIO()
+        src = MappedFile(disk)
+        g.setdefault('_mapped_inputs', []).append(src)
+        return src
+    if hasattr(stream, '_rolled'):
+        stream = stream._file
+    stream.seek(0)
+    return stream
+
+
+def _close_inputs(exc=None):
+    for src in g.pop('_mapped_inputs', ()):
+        src.close()
+
+
+def install(app):
+    app.request_class = SpoolingRequest
+    app.teardown_request(_close_inputs)
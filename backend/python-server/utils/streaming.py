@@ -0,0 +1,212 @@
+"""Streaming helpers – build chunked responses without buffering whole outputs.
+
+Results that already sit on disk are sent with ``send_temp_file`` /
+``send_cached_file``: the response body is the open file, so gunicorn hands
+it to ``sendfile()`` through ``wsgi.file_wrapper`` and the worker never reads
+it into memory.  With ``SENDFILE_MODE`` set the worker does not send the
+bytes at all – the file is placed in ``SENDFILE_DIR`` and a fronting nginx
+(``x-accel``) or Apache/lighttpd (``x-sendfile``) serves it from there.
+"""
+
+from flask import Response, current_app, request, stream_with_context, send_file
+from werkzeug.utils import send_file as _send_path
+from utils import file_store
+import io, os, time, uuid, shutil, zipfile, tempfile, logging
+
+logger = logging.getLogger(__name__)
+
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE', '').lower()   # '', 'x-accel' or 'x-sendfile'
+SENDFILE_DIR = os.environ.get('SENDFILE_DIR') or os.path.join(tempfile.gettempdir(), 'allfilechanger-out')
+SENDFILE_PREFIX = os.environ.get('SENDFILE_PREFIX', '/_outputs/')
+SENDFILE_TTL = int(os.environ.get('SENDFILE_TTL', 600))
+
+if SENDFILE_MODE not in ('', 'x-accel', 'x-sendfile'):
+    raise ValueError(f'SENDFILE_MODE must be x-accel or x-sendfile, not {SENDFILE_MODE!r}')
+if SENDFILE_MODE:
+    os.makedirs(SENDFILE_DIR, exist_ok=True)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable buffer that hands back what was written so far.
+
+    ``zipfile`` detects that it cannot seek and falls back to data descriptors,
+    so each member can be flushed to the client as soon as it is written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(entries, compression=zipfile.ZIP_DEFLATED):
+    """Yield a ZIP archive chunk by chunk from an iterable of ``(name, data)``.
+
+    *data* is either ``bytes`` or an iterable of ``bytes`` chunks; the latter
+    is written incrementally, so not even one member has to fit in memory.
+    Otherwise only the current member is held in memory.  If the client goes away
+    the WSGI server closes this generator, which also closes *entries* so the
+    producer stops doing work nobody will read.
+    """
+    sink = _Sink()
+    try:
+        with zipfile.ZipFile(sink, 'w', compression) as zf:
+            for name, data in entries:
+                if isinstance(data, (bytes, bytearray)):
+                    zf.writestr(name, data)
+                else:
+                    # Size is unknown up front, so allow ZIP64 for large members
+                    with zf.open(name, 'w', force_zip64=True) as member:
+                        for chunk in data:
+                            member.write(chunk)
+                            yield sink.drain()
+                del data
+                yield sink.drain()
+        yield sink.drain()  # central directory
+    except GeneratorExit:
+        logger.info('Client disconnected – ZIP stream aborted')
+        raise
+    finally:
+        close = getattr(entries, 'close', None)
+        if close:
+            close()
+
+
+def stream_response(chunks, mimetype, download_name):
+    """Chunked attachment response around a generator (keeps the request context alive)."""
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={download_name}'})
+
+
+def send_temp_file(path, mimetype, download_name):
+    """Send *path* from disk and delete it; the file is never read into memory."""
+    if _offloaded():
+        return _offload(path, mimetype, download_name, shutil.move)
+    try:
+        # send_file opens the file before returning, so unlinking only drops
+        # the name: the data is freed when the server closes the body.  The
+        # response stays direct-passthrough, which keeps the sendfile() path.
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+    finally:
+        try: os.unlink(path)
+        except OSError: pass
+
+
+def send_cached_file(path, mimetype, download_name):
+    """Send *path* from disk and leave it there, e.g. a result cache entry."""
+    if _offloaded():
+        return _offload(path, mimetype, download_name, _link)
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+
+# ── X-Accel-Redirect / X-Sendfile ───────────────────────────────────────────
+
+_last_sweep = 0.0
+
+
+def _offloaded():
+    # ?store=1 stores the response body itself, so that must come from the worker
+    return bool(SENDFILE_MODE) and not file_store.wants_store()
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)   # no copy, and cache eviction cannot pull it away
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _sweep():
+    """Delete handed-off files older than ``SENDFILE_TTL`` – at most once a minute per worker."""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < 60:
+        return
+    _last_sweep = now
+    for e in os.scandir(SENDFILE_DIR):
+        try:
+            if e.stat().st_mtime < now - SENDFILE_TTL:
+                os.unlink(e.path)
+        except OSError:
+            pass    # another worker got there first
+
+
+def _offload(path, mimetype, download_name, place):
+    """Empty response telling the front-end server to send *path* itself.
+
+    The front end reads the file after this response has been sent, so it
+    cannot be deleted on close; it lives in ``SENDFILE_DIR`` under an
+    unguessable name until ``_sweep`` removes it.
+    """
+    _sweep()
+    name = uuid.uuid4().hex + os.path.splitext(path)[1]
+    dest = os.path.join(SENDFILE_DIR, name)
+    place(path, dest)
+    os.chmod(dest, 0o644)   # temp files are private; the front end may run as another user
+    os.utime(dest)  # the TTL starts now, not when the source was written
+    # Ranges and conditional requests are answered by the front end
+    resp = _send_path(dest, request.environ, mimetype=mimetype, as_attachment=True,
+                      download_name=download_name, conditional=False, use_x_sendfile=True,
+                      response_class=current_app.response_class)
+    if SENDFILE_MODE == 'x-accel':
+        del resp.headers['X-Sendfile']
+        resp.headers['X-Accel-Redirect'] = SENDFILE_PREFIX.rstrip('/') + '/' + name
+    resp.content_length = 0     # no body follows; the front end sets the real length
+    return resp
+
+
+def on_close(environ, body, callback):
+    """Call ``callback(sent)`` once the WSGI server closes the response *body*.
+
+    *sent* is the number of body bytes iterated, or ``None`` for file-wrapper
+    bodies: those keep the server's ``sendfile()`` fast path, so the hook is
+    chained onto their ``close()`` instead of wrapping the iterator.
+    """
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+        close = getattr(body, 'close', None)
+
+        def closing():
+            try:
+                if close is not None:
+                    close()
+            finally:
+                callback(None)
+        body.close = closing
+        return body
+    return _CountingBody(body, callback)
+
+
+class _CountingBody:
+    def __init__(self, body, callback):
+        self._body = body
+        self._callback = callback
+        self.sent = 0
+
+    def __iter__(self):
+        for chunk in self._body:
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            close = getattr(self._body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._callback(self.sent)